@@ -0,0 +1,371 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from peer_communication import PeerCommunicator
+from encryption_module.encrypt import StreamDecryptor
+from file_sharing_module.fileTransfer import DOWNLOAD_DIR, file_holdings, merkle_leaves, resolve_file_key
+from file_sharing_module.merkle import encode_leaves_reply
+from file_sharing_module.compression import DecompressingWriter
+from file_sharing_module.pipeline import HashingWriter
+from file_sharing_module.upload_engine import UPLOAD_BUFFER_SIZE, record_upload
+from file_sharing_module.upload_scheduler import UploadBusy, encode_busy, get_upload_scheduler, parse_busy
+from P2P_connection_module.protocol import (
+    FRAME_MAGIC,
+    FLAG_MORE,
+    MSG_REQUEST,
+    MSG_RESPONSE,
+    MSG_PING,
+    MSG_PONG,
+    MSG_CANCEL,
+    MSG_ERROR,
+    encode_frame,
+    read_frame_async,
+)
+
+ACCEPT_BACKLOG = 4096
+CRYPTO_WORKERS = 4          # bounded pool for CPU-bound crypto (key unwrap, decryption)
+ASYNC_READ_SIZE = 1024 * 1024
+FRAMED_SEND_SIZE = 256 * 1024  # body bytes per response frame when serving framed requests
+
+class _StreamConn:
+    """Socket-like adapter over an asyncio writer, so connections accepted by
+    the event loop can be kept in pending_requests/active_connections and
+    driven from the (threaded) CLI exactly like plain sockets."""
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+
+    def send(self, data):
+        if self.writer.is_closing():
+            raise ConnectionError("connection closed")
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+        return len(data)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+class _StreamReply:
+    """Reply target for a legacy one-command connection."""
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def sendfile(self, f, offset, count):
+        return await self.loop.sendfile(self.writer.transport, f, offset, count)
+
+    def close(self):
+        pass  # the connection itself is closed by handle_peer_message
+
+class _FrameReply:
+    """Reply target for one request on a multiplexed framed connection."""
+
+    def __init__(self, loop, writer, request_id):
+        self.loop = loop
+        self.writer = writer
+        self.request_id = request_id
+
+    def write(self, data):
+        self.writer.write(encode_frame(MSG_RESPONSE, self.request_id, data, FLAG_MORE))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def sendfile(self, f, offset, count):
+        f.seek(offset)
+        sent = 0
+        while count is None or sent < count:
+            want = FRAMED_SEND_SIZE if count is None else min(FRAMED_SEND_SIZE, count - sent)
+            data = await self.loop.run_in_executor(None, f.read, want)
+            if not data:
+                break
+            self.write(data)
+            await self.drain()
+            sent += len(data)
+        return sent
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(MSG_RESPONSE, self.request_id))
+
+class AsyncPeerCommunicator(PeerCommunicator):
+    """Event-loop implementation of the peer listener and transfer engine.
+
+    One loop serves every connection instead of one thread per socket (plus
+    one per GET_FILE); only CPU-bound crypto is pushed to a small thread pool.
+    It is a drop-in replacement for PeerCommunicator.
+    """
+
+    def __init__(self, local_port, crypto_workers=CRYPTO_WORKERS):
+        super().__init__(local_port)
+        self.loop = None
+        self.server = None
+        self.crypto_pool = ThreadPoolExecutor(max_workers=crypto_workers, thread_name_prefix="peer-crypto")
+
+    def start_listener(self):
+        asyncio.run(self.serve_forever())
+
+    async def serve_forever(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(
+            self.handle_peer_message, '0.0.0.0', self.local_port, backlog=ACCEPT_BACKLOG
+        )
+        print(f"[*] Listening for incoming peer messages on port {self.local_port} (asyncio)...")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_peer_message(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        keep_open = False
+        try:
+            prefix = await reader.readexactly(len(FRAME_MAGIC))
+            if prefix == FRAME_MAGIC:
+                await self.serve_framed(reader, writer, prefix)
+                return
+            message = (prefix + await reader.read(1024 - len(prefix))).decode()
+            if message.startswith("REQUEST_CONNECT"):
+                try:
+                    _, peer_name, listening_port = message.strip().split('|')
+                    listening_port = int(listening_port)
+                    logical_addr = (addr[0], listening_port)
+                    print(f"[!] Connection request from {peer_name} at {addr} (says they're listening on port {listening_port})")
+                    with self.lock:
+                        self.pending_requests.append((peer_name, logical_addr, _StreamConn(self.loop, writer)))
+                    keep_open = True
+                except Exception as e:
+                    print(f"[!] Failed to parse REQUEST_CONNECT: {e}")
+
+            elif message.startswith("ACCEPT_CONNECT"):
+                _, peer_name = message.strip().split('|')
+                print(f"[+] Connection accepted by {peer_name} at {addr}")
+                self.log_peer_accepted(peer_name, addr)
+
+            elif message.startswith("DENY_CONNECT"):
+                _, peer_name = message.strip().split('|')
+                print(f"[-] Connection denied by {peer_name} at {addr}")
+
+            elif not await self.serve_request(message, _StreamReply(self.loop, writer), addr[0]):
+                print(f"[Peer:{addr}] {message}")
+
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            print(f"[!] Error handling message from {addr}: {e}")
+        finally:
+            if not keep_open:
+                writer.close()
+
+    async def serve_request(self, message, reply, peer=None):
+        """Runs a data-plane command (GET_FILE, GET_RANGE, HAVE, MERKLE) from
+        peer against reply. Returns False if the command is not one of them."""
+        if message.startswith("GET_FILE"):
+            _, filename = message.strip().split("|")
+            await self.send_file(filename, reply, peer)
+        elif message.startswith("GET_RANGE"):
+            _, filename, offset, length = message.strip().split("|")
+            await self.send_file_range(filename, reply, int(offset), int(length), peer)
+        elif message.startswith("HAVE"):
+            _, filename = message.strip().split("|")
+            await self.send_holdings(filename, reply)
+        elif message.startswith("MERKLE"):
+            _, filename = message.strip().split("|")
+            await self.send_merkle(filename, reply)
+        else:
+            return False
+        return True
+
+    async def serve_framed(self, reader, writer, prefix):
+        """Serves a persistent framed connection; each request runs as its own
+        task so responses to concurrent requests interleave on the socket."""
+        tasks = {}
+        peer = writer.get_extra_info("peername")[0]
+
+        async def run(request_id, command):
+            reply = _FrameReply(self.loop, writer, request_id)
+            try:
+                if not await self.serve_request(command, reply, peer):
+                    writer.write(encode_frame(MSG_ERROR, request_id, f"Unsupported command: {command}".encode()))
+                    return
+                reply.close()
+                await writer.drain()
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                if not writer.is_closing():
+                    writer.write(encode_frame(MSG_ERROR, request_id, str(e).encode()))
+            finally:
+                tasks.pop(request_id, None)
+
+        try:
+            while frame := await read_frame_async(reader, prefix):
+                prefix = b""
+                msg_type, flags, request_id, payload = frame
+                if msg_type == MSG_REQUEST:
+                    tasks[request_id] = asyncio.create_task(run(request_id, payload.decode()))
+                elif msg_type == MSG_PING:
+                    writer.write(encode_frame(MSG_PONG, request_id, payload))
+                elif msg_type == MSG_CANCEL and request_id in tasks:
+                    tasks[request_id].cancel()
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+
+    async def _upload_slot(self, filename, reply, peer, nbytes):
+        """Waits for an upload slot; replies BUSY and returns None when the
+        upload queue is full."""
+        try:
+            return await get_upload_scheduler().acquire_async(peer, nbytes)
+        except UploadBusy as e:
+            reply.write(encode_busy(e.retry_after))
+            await reply.drain()
+            print(f"[!] Upload queue full; asked {peer} to retry {filename} in {e.retry_after:.1f}s")
+            return None
+
+    async def _sendfile(self, filename, reply, filepath, offset, count, slot):
+        # Sent in UPLOAD_BUFFER_SIZE blocks so the slot's rate limits apply
+        # and its byte counters stay current.
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        sent = 0
+        with open(filepath, "rb") as f:
+            while sent < count:
+                block = min(UPLOAD_BUFFER_SIZE, count - sent)
+                delay = slot.reserve(block)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                n = await reply.sendfile(f, offset + sent, block)
+                if not n:
+                    break
+                sent += n
+        method = "loop.sendfile" if isinstance(reply, _StreamReply) else "framed"
+        return record_upload(filename, sent, time.perf_counter() - start,
+                             time.thread_time() - cpu_start, method)
+
+    async def send_file(self, filename, reply, peer=None):
+        holdings = file_holdings(filename)
+        if holdings is None or holdings[2] != [[0, holdings[1]]]:
+            reply.write(b"FILE_NOT_FOUND")
+            await reply.drain()
+            print(f"[!] Requested file not found: {filename}")
+            return
+        slot = await self._upload_slot(filename, reply, peer, holdings[1])
+        if slot is None:
+            return
+        with slot:
+            reply.write(b"FILE_FOUND")
+            await reply.drain()
+            stat = await self._sendfile(filename, reply, holdings[0], 0, holdings[1], slot)
+        print(f"[+] File sent successfully: {filename} ({stat['mib_per_s']:.1f} MiB/s via {stat['method']})")
+
+    async def send_file_range(self, filename, reply, offset, length, peer=None):
+        holdings = file_holdings(filename)
+        if holdings is None:
+            reply.write(b"FILE_NOT_FOUND")
+            await reply.drain()
+            return
+        filepath, total, held = holdings
+        if offset < 0 or length < 0 or offset > total:
+            reply.write(b"RANGE_INVALID\n")
+            await reply.drain()
+            return
+        length = min(length, total - offset)
+        if length and not any(start <= offset and offset + length <= end for start, end in held):
+            reply.write(b"RANGE_INVALID\n")
+            await reply.drain()
+            return
+        if not length:
+            reply.write(f"RANGE_OK|{offset}|0|{total}\n".encode())
+            await reply.drain()
+            return
+        slot = await self._upload_slot(filename, reply, peer, length)
+        if slot is None:
+            return
+        with slot:
+            reply.write(f"RANGE_OK|{offset}|{length}|{total}\n".encode())
+            await reply.drain()
+            await self._sendfile(filename, reply, filepath, offset, length, slot)
+
+    async def send_holdings(self, filename, reply):
+        holdings = file_holdings(filename)
+        if holdings is None:
+            reply.write(b"FILE_NOT_FOUND")
+        else:
+            _, total, held = holdings
+            ranges = ",".join(f"{start}-{end}" for start, end in held)
+            reply.write(f"HAVE|{total}|{ranges}\n".encode())
+        await reply.drain()
+
+    async def send_merkle(self, filename, reply):
+        # Hashing a blob without a sidecar yet is CPU work; keep it off the loop.
+        tree = await self.loop.run_in_executor(self.crypto_pool, merkle_leaves, filename)
+        reply.write(encode_leaves_reply(*tree) if tree is not None else b"FILE_NOT_FOUND")
+        await reply.drain()
+
+    async def request_file(self, peer_ip, port, filename, session):
+        """Async counterpart of fileTransfer.request_file: decrypts and hashes
+        the stream as it arrives, with crypto work on the bounded pool.
+        Raises UploadBusy if the peer is out of upload slots."""
+        loop = asyncio.get_running_loop()
+        entry, file_key = await loop.run_in_executor(self.crypto_pool, resolve_file_key, filename, session)
+
+        reader, writer = await asyncio.open_connection(peer_ip, port)
+        try:
+            writer.write(f"GET_FILE|{filename}".encode())
+            await writer.drain()
+            try:
+                status = await reader.readexactly(len(b"FILE_FOUND"))
+            except asyncio.IncompleteReadError as e:
+                status = e.partial       # a short BUSY|<seconds> reply
+            if status.startswith(b"BUSY|"):
+                if not status.endswith(b"\n"):
+                    status += await reader.readline()
+                raise parse_busy(status.decode(errors="replace"))
+            if status != b"FILE_FOUND":
+                print(f"[-] Peer does not have the file: {filename}")
+                return False
+
+            print(f"[+] Receiving file: {filename}")
+            if file_key is None:
+                save_path = os.path.join(DOWNLOAD_DIR, filename)
+                with open(save_path, "wb") as f:
+                    while data := await reader.read(ASYNC_READ_SIZE):
+                        f.write(data)
+                print(f"[+] File received and saved to: {save_path}")
+                return True
+
+            decrypted_path = os.path.join(DOWNLOAD_DIR, f"decrypted_{filename}")
+            decryptor = StreamDecryptor(file_key)
+            compression = entry.get("compression")
+            try:
+                with open(decrypted_path, "wb") as f:
+                    out = HashingWriter(f)
+                    sink = DecompressingWriter(out, compression["codec"]) if compression else out
+                    while data := await reader.read(ASYNC_READ_SIZE):
+                        plaintext = await loop.run_in_executor(self.crypto_pool, decryptor.update, data)
+                        await loop.run_in_executor(self.crypto_pool, sink.write, plaintext)
+                    plaintext = await loop.run_in_executor(self.crypto_pool, decryptor.finalize)
+                    await loop.run_in_executor(self.crypto_pool, sink.write, plaintext)
+                    if compression:
+                        sink.close()
+            except ValueError as e:
+                print(f"[!] Failed to decrypt file: {e}")
+                os.remove(decrypted_path)
+                return False
+            print(f"[+] File decrypted and saved to: {decrypted_path}")
+
+            if out.hexdigest() == entry["hash"]:
+                print("[+] File integrity verified.")
+                return True
+            print("[!] WARNING: File integrity check failed.")
+            return False
+        finally:
+            writer.close()
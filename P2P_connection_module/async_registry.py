@@ -0,0 +1,204 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import heapq
+import time
+from connection_registery import HOST, PORT, PEER_TIMEOUT, safe_print
+from P2P_connection_module.membership import MembershipLog
+from P2P_connection_module.heartbeat import HeartbeatVerifier, heartbeat_secret, open_receiver
+from P2P_connection_module.protocol import (
+    FRAME_MAGIC,
+    MSG_REQUEST,
+    MSG_RESPONSE,
+    MSG_PING,
+    MSG_PONG,
+    encode_frame,
+    read_frame_async,
+)
+
+ACCEPT_BACKLOG = 8192
+STATUS_INTERVAL = 10  # seconds between "Active peers" status lines
+
+class PeerTable:
+    """Registry membership with heap-scheduled expiry and a cached GETPEERS reply.
+
+    Heartbeats push (deadline, peer) onto a min-heap and stale heap entries
+    are skipped lazily, so each heartbeat and each expiry costs O(log n)
+    instead of a full scan. The pre-serialized peer list is only rebuilt
+    after a join, leave or expiry, which are also recorded in a versioned
+    MembershipLog for incremental GETPEERS.
+    """
+
+    def __init__(self, timeout=PEER_TIMEOUT):
+        self.timeout = timeout
+        self.last_seen = {}          # {(ip, port): last_seen_timestamp}
+        self.heartbeat_counter = {}
+        self._heap = []              # [(expires_at, (ip, port))]
+        self._snapshot = None
+        self.membership = MembershipLog()
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def touch(self, peer_id, now=None):
+        """Registers or refreshes a peer. Returns True if it is new."""
+        now = time.time() if now is None else now
+        is_new = peer_id not in self.last_seen
+        self.last_seen[peer_id] = now
+        self.heartbeat_counter[peer_id] = self.heartbeat_counter.get(peer_id, 0) + 1
+        heapq.heappush(self._heap, (now + self.timeout, peer_id))
+        if is_new:
+            self._snapshot = None
+            self.membership.join(peer_id)
+        self._compact()
+        return is_new
+
+    def remove(self, peer_id):
+        if peer_id not in self.last_seen:
+            return False
+        del self.last_seen[peer_id]
+        self.heartbeat_counter.pop(peer_id, None)
+        self._snapshot = None
+        self.membership.leave(peer_id)
+        return True
+
+    def expire(self, now=None):
+        """Drops peers whose deadline has passed and returns them."""
+        now = time.time() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, peer_id = heapq.heappop(self._heap)
+            last_seen = self.last_seen.get(peer_id)
+            # Skip entries superseded by a later heartbeat or an unregister.
+            if last_seen is not None and last_seen + self.timeout <= deadline:
+                self.remove(peer_id)
+                expired.append(peer_id)
+        return expired
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def _compact(self):
+        # Every heartbeat leaves a superseded entry behind; rebuild the heap
+        # once those outnumber the live ones.
+        if len(self._heap) > 2 * len(self.last_seen) + 1024:
+            self._heap = [(ts + self.timeout, peer_id) for peer_id, ts in self.last_seen.items()]
+            heapq.heapify(self._heap)
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = '|'.join(f"{ip}:{port}" for (ip, port) in self.last_seen).encode()
+        return self._snapshot
+
+class HeartbeatProtocol(asyncio.DatagramProtocol):
+    """Applies signed UDP heartbeat datagrams straight to the peer table."""
+
+    def __init__(self, peers, secret):
+        self.peers = peers
+        self.verifier = HeartbeatVerifier(secret)
+
+    def datagram_received(self, data, addr):
+        now = time.time()
+        for peer_id in self.verifier.verify(data, now) or ():
+            if self.peers.touch(peer_id, now):
+                safe_print(f"[+] New peer registered (UDP heartbeat): {peer_id[0]}:{peer_id[1]}")
+
+class AsyncRegistry:
+    """asyncio version of connection_registery: same wire protocol, no thread
+    per connection and no global lock (everything runs on the event loop)."""
+
+    def __init__(self, host=HOST, port=PORT, timeout=PEER_TIMEOUT, heartbeat_key=None):
+        self.host = host
+        self.port = port
+        self.peers = PeerTable(timeout)
+        self.heartbeat_key = heartbeat_key or heartbeat_secret()
+
+    def handle_message(self, data):
+        """Applies one registry command and returns the reply bytes."""
+        if data.startswith("REGISTER"):
+            _, peer_ip, peer_port = data.strip().split('|')
+            peer_id = (peer_ip, int(peer_port))
+            if self.peers.touch(peer_id):
+                safe_print(f"[+] New peer registered: {peer_ip}:{peer_port}")
+            return b"REGISTERED"
+
+        elif data.startswith("UNREGISTER"):
+            _, peer_ip, peer_port = data.strip().split('|')
+            if self.peers.remove((peer_ip, int(peer_port))):
+                safe_print(f"[-] Peer unregistered: {peer_ip}:{peer_port}")
+                return b"UNREGISTERED"
+            return b"PEER_NOT_FOUND"
+
+        elif data.startswith("GETPEERS"):
+            self.peers.expire()
+            return self.peers.membership.handle_getpeers(data, self.peers.snapshot)
+
+        return b"UNKNOWN_COMMAND"
+
+    async def handle_client(self, reader, writer):
+        client_address = writer.get_extra_info("peername")
+        try:
+            prefix = await reader.readexactly(len(FRAME_MAGIC))
+            if prefix == FRAME_MAGIC:
+                await self.serve_framed(reader, writer, prefix)
+                return
+            data = (prefix + await reader.read(1024 - len(prefix))).decode()
+            writer.write(self.handle_message(data))
+            await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            safe_print(f"[!] Error handling client {client_address}: {e}")
+        finally:
+            writer.close()
+
+    async def serve_framed(self, reader, writer, prefix):
+        """Persistent framed session: one response frame per request frame."""
+        while frame := await read_frame_async(reader, prefix):
+            prefix = b""
+            msg_type, flags, request_id, payload = frame
+            if msg_type == MSG_REQUEST:
+                writer.write(encode_frame(MSG_RESPONSE, request_id, self.handle_message(payload.decode())))
+            elif msg_type == MSG_PING:
+                writer.write(encode_frame(MSG_PONG, request_id, payload))
+            await writer.drain()
+
+    async def expire_peers(self):
+        # A peer registered while sleeping expires no earlier than now + timeout,
+        # so sleeping until the current earliest deadline never misses one.
+        while True:
+            deadline = self.peers.next_deadline()
+            delay = self.peers.timeout if deadline is None else max(0.0, deadline - time.time())
+            await asyncio.sleep(delay)
+            for peer in self.peers.expire():
+                safe_print(f"[-] Peer timed out: {peer[0]}:{peer[1]}")
+
+    async def report_status(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            safe_print(f"[*] Active peers: {len(self.peers)}", end='\r')
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=ACCEPT_BACKLOG)
+        safe_print(f"[*] Starting Connection Registry Server on port {self.port} (asyncio)...")
+        tasks = [asyncio.create_task(self.expire_peers()), asyncio.create_task(self.report_status())]
+        transport = None
+        if self.heartbeat_key:
+            transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: HeartbeatProtocol(self.peers, self.heartbeat_key), sock=open_receiver(self.host, self.port))
+            safe_print(f"[*] Listening for UDP heartbeats on port {self.port}...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if transport is not None:
+                transport.close()
+            for task in tasks:
+                task.cancel()
+
+def start_server():
+    asyncio.run(AsyncRegistry().serve_forever())
+
+if __name__ == "__main__":
+    start_server()
@@ -0,0 +1,217 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from P2P_connection_module.protocol import FramedConnection
+
+# Pool of persistent framed connections, keyed by (host, port).
+#
+# Transfers and registry calls check a connection out, run one or more
+# requests over it and hand it back, so repeated requests to the same peer
+# skip the TCP handshake. Idle connections are health-checked with a PING
+# before reuse and closed by a reaper once they have been idle too long.
+MAX_PER_PEER = 4             # connections open to one address at a time
+IDLE_TIMEOUT = 120           # seconds an unused connection is kept open
+HEALTH_CHECK_AFTER = 15      # ping connections idle longer than this before reuse
+HEALTH_CHECK_TIMEOUT = 2
+CHECKOUT_TIMEOUT = 30        # wait for a free slot when a peer is at MAX_PER_PEER
+REAP_INTERVAL = 10
+TCP_KEEPALIVE_IDLE = 30      # kernel keepalive probes for half-dead peers
+TCP_KEEPALIVE_INTERVAL = 10
+TCP_KEEPALIVE_PROBES = 3
+
+def enable_keepalive(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", TCP_KEEPALIVE_IDLE),
+                        ("TCP_KEEPINTVL", TCP_KEEPALIVE_INTERVAL),
+                        ("TCP_KEEPCNT", TCP_KEEPALIVE_PROBES)):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+class ConnectionPool:
+    """Thread-safe pool of FramedConnections with a per-peer cap, idle
+    eviction and health checks on reuse."""
+
+    def __init__(self, max_per_peer=MAX_PER_PEER, idle_timeout=IDLE_TIMEOUT,
+                 health_check_after=HEALTH_CHECK_AFTER, connect_timeout=10, request_timeout=60):
+        self.max_per_peer = max_per_peer
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.idle = {}          # {address: [(connection, last_used), ...]} most recent last
+        self.open_count = {}    # {address: idle + checked-out connections}
+        self.cond = threading.Condition()
+        self.stats = {"connects": 0, "reuses": 0, "health_failures": 0, "evictions": 0}
+        self._closed = False
+        self._reaper = None
+
+    def _connect(self, address):
+        conn = FramedConnection.connect(address, timeout=self.request_timeout,
+                                        connect_timeout=self.connect_timeout)
+        enable_keepalive(conn.sock)
+        return conn
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            conn.ping(timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    def _forget(self, address):
+        # Caller holds self.cond.
+        self.open_count[address] -= 1
+        if not self.open_count[address]:
+            del self.open_count[address]
+        self.cond.notify_all()
+
+    def acquire(self, address, timeout=CHECKOUT_TIMEOUT):
+        """Returns a connection to address, reusing an idle one when possible."""
+        address = (address[0], int(address[1]))
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.cond:
+                if self._closed:
+                    raise ConnectionError("Connection pool is closed")
+                idle = self.idle.get(address)
+                if idle:
+                    conn, last_used = idle.pop()
+                    if not idle:
+                        del self.idle[address]
+                elif self.open_count.get(address, 0) < self.max_per_peer:
+                    self.open_count[address] = self.open_count.get(address, 0) + 1
+                    conn = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No free connection to {address[0]}:{address[1]}")
+                    self.cond.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    conn = self._connect(address)
+                except Exception:
+                    with self.cond:
+                        self._forget(address)
+                    raise
+                with self.cond:
+                    self.stats["connects"] += 1
+                self._start_reaper()
+                return conn
+
+            # The health check runs outside the lock; a failed connection
+            # frees its slot and the loop tries the next one.
+            if self._healthy(conn, time.monotonic() - last_used):
+                with self.cond:
+                    self.stats["reuses"] += 1
+                return conn
+            conn.close()
+            with self.cond:
+                self.stats["health_failures"] += 1
+                self._forget(address)
+
+    def release(self, address, conn, discard=False):
+        """Returns a connection to the pool; broken or discarded ones are closed."""
+        address = (address[0], int(address[1]))
+        with self.cond:
+            if discard or conn.closed or self._closed:
+                conn.close()
+                self._forget(address)
+                return
+            self.idle.setdefault(address, []).append((conn, time.monotonic()))
+            self.cond.notify_all()
+
+    @contextmanager
+    def connection(self, address, timeout=CHECKOUT_TIMEOUT):
+        """with pool.connection((ip, port)) as conn: ... -- the connection is
+        returned afterwards, or dropped if the block raised: a failed block
+        may have abandoned a response mid-stream, so the connection is not
+        trusted for reuse."""
+        conn = self.acquire(address, timeout)
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            discard = True
+            raise
+        finally:
+            self.release(address, conn, discard)
+
+    def evict_idle(self, now=None):
+        """Closes connections idle longer than idle_timeout; returns how many."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self.cond:
+            for address in list(self.idle):
+                keep = []
+                for conn, last_used in self.idle[address]:
+                    if now - last_used >= self.idle_timeout or conn.closed:
+                        expired.append(conn)
+                        self._forget(address)
+                    else:
+                        keep.append((conn, last_used))
+                if keep:
+                    self.idle[address] = keep
+                else:
+                    del self.idle[address]
+            self.stats["evictions"] += len(expired)
+        for conn in expired:
+            conn.close()
+        return len(expired)
+
+    def _start_reaper(self):
+        with self.cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while not self._closed:
+            time.sleep(REAP_INTERVAL)
+            self.evict_idle()
+
+    def close_peer(self, address):
+        """Drops every idle connection to address (e.g. when a peer leaves)."""
+        address = (address[0], int(address[1]))
+        with self.cond:
+            idle = self.idle.pop(address, [])
+            for _ in idle:
+                self._forget(address)
+        for conn, _ in idle:
+            conn.close()
+
+    def close(self):
+        with self.cond:
+            self._closed = True
+            idle, self.idle = self.idle, {}
+            for address, conns in idle.items():
+                for _ in conns:
+                    self._forget(address)
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def get_stats(self):
+        with self.cond:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(conns) for conns in self.idle.values())
+            stats["open"] = sum(self.open_count.values())
+        return stats
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+def get_pool():
+    """Process-wide pool shared by file transfers and registry calls."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+        return _default_pool
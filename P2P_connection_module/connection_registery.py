@@ -1,10 +1,17 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import socket
 import threading
 import time
+from P2P_connection_module.protocol import peek_is_framed, serve_framed
+from P2P_connection_module.membership import MembershipLog
+from P2P_connection_module.heartbeat import HeartbeatVerifier, heartbeat_secret, open_receiver, MAX_DATAGRAM
 
 # Stores peer information: { (ip, port): last_seen_timestamp }
 connected_peers = {}
 heartbeat_counter = {}  # Track heartbeat counts per peer
+membership = MembershipLog()  # versioned joins/leaves for incremental GETPEERS
 lock = threading.Lock()
 print_lock = threading.Lock()
 
@@ -12,6 +19,8 @@ HOST = '0.0.0.0'
 PORT = 9000
 HEARTBEAT_INTERVAL = 30  # seconds
 PEER_TIMEOUT = 90  # seconds
+HEARTBEAT_FLUSH_INTERVAL = 0.5  # seconds UDP heartbeats are coalesced before touching connected_peers
+HEARTBEAT_FLUSH_SIZE = 5000     # ...or this many distinct peers, whichever comes first
 
 def safe_print(*args, end='\n', pad=100):
     with print_lock:
@@ -29,55 +38,107 @@ def remove_stale_peers():
                 safe_print(f"[-] Peer timed out: {peer[0]}:{peer[1]}")
                 connected_peers.pop(peer, None)
                 heartbeat_counter.pop(peer, None)
+                membership.leave(peer)
             safe_print(f"[*] Active peers: {len(connected_peers)}", end='\r')
 
-def handle_client(client_socket, client_address):
+def process_command(data):
+    """Applies one registry command and returns the reply bytes."""
     global connected_peers, heartbeat_counter
-    try:
-        data = client_socket.recv(1024).decode()
-        if data.startswith("REGISTER"):
-            _, peer_ip, peer_port = data.strip().split('|')
-            peer_id = (peer_ip, int(peer_port))
-            now = time.time()
+    if data.startswith("REGISTER"):
+        _, peer_ip, peer_port = data.strip().split('|')
+        peer_id = (peer_ip, int(peer_port))
+        now = time.time()
 
-            with lock:
-                is_new_peer = peer_id not in connected_peers
-                connected_peers[peer_id] = now
-                heartbeat_counter[peer_id] = heartbeat_counter.get(peer_id, 0) + 1
-
-            if is_new_peer:
-                safe_print(f"[+] New peer registered: {peer_ip}:{peer_port}")
-            else:
-                safe_print(f"[{heartbeat_counter[peer_id]}] Heartbeat received from {peer_ip}:{peer_port} | Active peers: {len(connected_peers)}", end='\r')
-
-            client_socket.send(b"REGISTERED")
-
-        elif data.startswith("UNREGISTER"):
-            _, peer_ip, peer_port = data.strip().split('|')
-            peer_id = (peer_ip, int(peer_port))
-
-            with lock:
-                if peer_id in connected_peers:
-                    connected_peers.pop(peer_id, None)
-                    heartbeat_counter.pop(peer_id, None)
-                    safe_print(f"[-] Peer unregistered: {peer_ip}:{peer_port}")
-                    client_socket.send(b"UNREGISTERED")
-                else:
-                    client_socket.send(b"PEER_NOT_FOUND")
-
-        elif data.startswith("GETPEERS"):
-            with lock:
-                now = time.time()
-                connected_peers = {
-                    k: v for k, v in connected_peers.items()
-                    if now - v < PEER_TIMEOUT
-                }
-                peers = [f"{ip}:{port}" for (ip, port) in connected_peers.keys()]
-                response = '|'.join(peers)
-            client_socket.send(response.encode())
+        with lock:
+            is_new_peer = peer_id not in connected_peers
+            connected_peers[peer_id] = now
+            membership.join(peer_id)
+            heartbeat_counter[peer_id] = heartbeat_counter.get(peer_id, 0) + 1
 
+        if is_new_peer:
+            safe_print(f"[+] New peer registered: {peer_ip}:{peer_port}")
         else:
-            client_socket.send(b"UNKNOWN_COMMAND")
+            safe_print(f"[{heartbeat_counter[peer_id]}] Heartbeat received from {peer_ip}:{peer_port} | Active peers: {len(connected_peers)}", end='\r')
+
+        return b"REGISTERED"
+
+    elif data.startswith("UNREGISTER"):
+        _, peer_ip, peer_port = data.strip().split('|')
+        peer_id = (peer_ip, int(peer_port))
+
+        with lock:
+            if peer_id in connected_peers:
+                connected_peers.pop(peer_id, None)
+                heartbeat_counter.pop(peer_id, None)
+                membership.leave(peer_id)
+                safe_print(f"[-] Peer unregistered: {peer_ip}:{peer_port}")
+                return b"UNREGISTERED"
+            return b"PEER_NOT_FOUND"
+
+    elif data.startswith("GETPEERS"):
+        def full_list():
+            peers = [f"{ip}:{port}" for (ip, port) in connected_peers.keys()]
+            return '|'.join(peers).encode()
+
+        with lock:
+            now = time.time()
+            for peer in [k for k, v in connected_peers.items() if now - v >= PEER_TIMEOUT]:
+                connected_peers.pop(peer, None)
+                heartbeat_counter.pop(peer, None)
+                membership.leave(peer)
+            return membership.handle_getpeers(data, full_list)
+
+    return b"UNKNOWN_COMMAND"
+
+def apply_heartbeats(pending):
+    """Applies a batch of {peer_id: timestamp} heartbeats under one lock."""
+    joined = []
+    with lock:
+        for peer_id, ts in pending.items():
+            if peer_id not in connected_peers:
+                joined.append(peer_id)
+            connected_peers[peer_id] = max(ts, connected_peers.get(peer_id, 0))
+            heartbeat_counter[peer_id] = heartbeat_counter.get(peer_id, 0) + 1
+            membership.join(peer_id)
+    for peer_ip, peer_port in joined:
+        safe_print(f"[+] New peer registered (UDP heartbeat): {peer_ip}:{peer_port}")
+
+def udp_heartbeat_listener(secret):
+    """Receives signed heartbeat datagrams on UDP PORT. Verification runs
+    on this thread only; accepted heartbeats are buffered and applied to
+    connected_peers in batches rather than taking the lock per packet."""
+    udp_socket = open_receiver(HOST, PORT)
+    udp_socket.settimeout(HEARTBEAT_FLUSH_INTERVAL)
+    verifier = HeartbeatVerifier(secret)
+    pending = {}
+    next_flush = time.time() + HEARTBEAT_FLUSH_INTERVAL
+    safe_print(f"[*] Listening for UDP heartbeats on port {PORT}...")
+
+    while True:
+        try:
+            datagram, _ = udp_socket.recvfrom(MAX_DATAGRAM + 1)
+            now = time.time()
+            for peer_id in verifier.verify(datagram, now) or ():
+                pending[peer_id] = now
+        except socket.timeout:
+            now = time.time()
+        if pending and (now >= next_flush or len(pending) >= HEARTBEAT_FLUSH_SIZE):
+            apply_heartbeats(pending)
+            pending = {}
+        if now >= next_flush:
+            next_flush = now + HEARTBEAT_FLUSH_INTERVAL
+
+def handle_client(client_socket, client_address):
+    try:
+        if peek_is_framed(client_socket):
+            # Persistent framed session: answer each request frame in order.
+            def handle_request(command, reply):
+                reply.sendall(process_command(command))
+                reply.close()
+            serve_framed(client_socket, handle_request)
+            return
+        data = client_socket.recv(1024).decode()
+        client_socket.sendall(process_command(data))
 
     except Exception as e:
         safe_print(f"[!] Error handling client {client_address}: {e}")
@@ -91,6 +152,9 @@ def start_server():
     server_socket.listen(5)
 
     threading.Thread(target=remove_stale_peers, daemon=True).start()
+    secret = heartbeat_secret()
+    if secret:
+        threading.Thread(target=udp_heartbeat_listener, args=(secret,), daemon=True).start()
 
     while True:
         client_socket, client_address = server_socket.accept()
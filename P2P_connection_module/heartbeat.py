@@ -0,0 +1,109 @@
+import os
+import hmac
+import hashlib
+import socket
+import struct
+import time
+
+# UDP heartbeat datagrams.
+#
+# A heartbeat only has to say "these peers are still alive", so instead of
+# a TCP connect + REGISTER round trip it is a single authenticated datagram:
+#   header:  magic (2) | version (1) | count (1) | timestamp_ms (8) | nonce (8)
+#   entries: count x (IPv4 address (4) | port (2))
+#   tag:     HMAC-SHA256(secret, header + entries), truncated to 16 bytes
+# One datagram can carry heartbeats for several peers hosted on the same
+# machine. The timestamp window plus the per-datagram nonce stop replays;
+# the MAC (keyed by a secret shared by peers and registry) stops forgery.
+HEARTBEAT_MAGIC = b"HB"
+HEARTBEAT_VERSION = 1
+HEADER = struct.Struct(">2sBBQ8s")
+ENTRY = struct.Struct(">4sH")
+TAG_SIZE = 16
+MAX_BATCH = 200                      # entries per datagram (keeps it under ~1.3 KB)
+MAX_DATAGRAM = HEADER.size + MAX_BATCH * ENTRY.size + TAG_SIZE
+MAX_CLOCK_SKEW = 30                  # seconds a heartbeat stays acceptable
+RECV_BUFFER_SIZE = 4 * 1024 * 1024   # absorbs heartbeat bursts while the registry is busy
+HEARTBEAT_SECRET_ENV = "P2P_HEARTBEAT_SECRET"
+
+def heartbeat_secret():
+    """Shared heartbeat key from the environment, or None if the UDP
+    heartbeat channel is not configured."""
+    secret = os.environ.get(HEARTBEAT_SECRET_ENV)
+    return secret.encode() if secret else None
+
+def open_receiver(host, port):
+    """UDP socket for a registry to receive heartbeats on."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    except OSError:
+        pass  # keep the system default
+    sock.bind((host, port))
+    return sock
+
+def _tag(secret, body):
+    return hmac.new(secret, body, hashlib.sha256).digest()[:TAG_SIZE]
+
+def encode_heartbeats(secret, peer_ids, now=None):
+    """Packs up to MAX_BATCH (ip, port) pairs into one signed datagram."""
+    if not 0 < len(peer_ids) <= MAX_BATCH:
+        raise ValueError(f"A heartbeat datagram carries 1..{MAX_BATCH} peers")
+    now = time.time() if now is None else now
+    body = HEADER.pack(HEARTBEAT_MAGIC, HEARTBEAT_VERSION, len(peer_ids), int(now * 1000), os.urandom(8))
+    body += b"".join(ENTRY.pack(socket.inet_aton(ip), int(port)) for ip, port in peer_ids)
+    return body + _tag(secret, body)
+
+class HeartbeatVerifier:
+    """Authenticates heartbeat datagrams and rejects replays. Not thread-safe:
+    meant to be owned by the single thread or loop reading the UDP socket."""
+
+    def __init__(self, secret, max_skew=MAX_CLOCK_SKEW):
+        self.secret = secret
+        self.max_skew = max_skew
+        self.seen = {}         # {nonce: expires_at}
+        self._next_prune = 0.0
+        self.rejected = 0
+
+    def _prune(self, now):
+        if now >= self._next_prune:
+            self.seen = {nonce: exp for nonce, exp in self.seen.items() if exp > now}
+            self._next_prune = now + self.max_skew
+
+    def verify(self, datagram, now=None):
+        """Returns the list of (ip, port) in an authentic, fresh datagram, or None."""
+        now = time.time() if now is None else now
+        if len(datagram) < HEADER.size + TAG_SIZE or len(datagram) > MAX_DATAGRAM:
+            self.rejected += 1
+            return None
+        body, tag = datagram[:-TAG_SIZE], datagram[-TAG_SIZE:]
+        magic, version, count, timestamp_ms, nonce = HEADER.unpack_from(body)
+        if (magic != HEARTBEAT_MAGIC or version != HEARTBEAT_VERSION
+                or len(body) != HEADER.size + count * ENTRY.size
+                or not hmac.compare_digest(tag, _tag(self.secret, body))):
+            self.rejected += 1
+            return None
+        if abs(now - timestamp_ms / 1000) > self.max_skew or nonce in self.seen:
+            self.rejected += 1
+            return None
+        self._prune(now)
+        self.seen[nonce] = now + 2 * self.max_skew
+        return [(socket.inet_ntoa(ip), port)
+                for ip, port in ENTRY.iter_unpack(body[HEADER.size:])]
+
+class HeartbeatSender:
+    """Sends heartbeats for one or more local peers to the registry over UDP."""
+
+    def __init__(self, registry_addr, secret):
+        self.registry_addr = registry_addr
+        self.secret = secret
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, peer_ids):
+        """Sends heartbeats for all peer_ids, MAX_BATCH per datagram."""
+        peer_ids = list(peer_ids)
+        for start in range(0, len(peer_ids), MAX_BATCH):
+            self.sock.sendto(encode_heartbeats(self.secret, peer_ids[start:start + MAX_BATCH]), self.registry_addr)
+
+    def close(self):
+        self.sock.close()
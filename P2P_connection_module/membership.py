@@ -0,0 +1,96 @@
+import bisect
+import time
+from collections import deque
+
+# Versioned registry membership shared by both registry servers.
+#
+# Every join or leave bumps a monotonically increasing version and is kept
+# in a bounded change log, so clients that already hold the list at some
+# version only fetch what changed since (heartbeats of known peers are not
+# changes). Clients that are too far behind get the full list, paged.
+#
+#   GETPEERS                      -> "ip:port|ip:port|..."           (legacy, full list)
+#   GETPEERS since=<version>      -> "DELTA|<version>|<more>|+ip:port,-ip:port,..."
+#                                    or the first SNAPSHOT page if the log no longer
+#                                    reaches back to <version>
+#   GETPEERS after=<cursor>       -> "SNAPSHOT|<version>|<next cursor>|ip:port,..."
+#
+# A DELTA with more=1 was cut at PEERS_PAGE_SIZE changes; <version> is then
+# the version reached, to be used as the next since=. An empty next cursor
+# ends a snapshot. Snapshot pages are keyed by the last peer returned, so
+# concurrent churn cannot make a page skip peers; a client finishes a
+# snapshot by replaying the deltas since the version of its first page.
+# Versions start from the clock (in microseconds), so after a registry
+# restart clients' old versions fall outside the log and they resync.
+PEERS_PAGE_SIZE = 1000
+MAX_CHANGE_LOG = 100000
+
+class MembershipLog:
+    def __init__(self, page_size=PEERS_PAGE_SIZE, max_log=MAX_CHANGE_LOG):
+        self.page_size = page_size
+        self.version = time.time_ns() // 1000
+        self.members = set()     # {"ip:port"}
+        self.changes = deque(maxlen=max_log)   # [(version, "+ip:port" | "-ip:port")]
+        self._sorted = None
+
+    def _record(self, change):
+        self.version += 1
+        self.changes.append((self.version, change))
+        self._sorted = None
+
+    def join(self, peer_id):
+        key = f"{peer_id[0]}:{peer_id[1]}"
+        if key in self.members:
+            return False
+        self.members.add(key)
+        self._record("+" + key)
+        return True
+
+    def leave(self, peer_id):
+        key = f"{peer_id[0]}:{peer_id[1]}"
+        if key not in self.members:
+            return False
+        self.members.discard(key)
+        self._record("-" + key)
+        return True
+
+    def _oldest_reachable(self):
+        # Lowest since= that can still be answered from the log.
+        return self.changes[0][0] - 1 if self.changes else self.version
+
+    def delta(self, since):
+        """Returns the DELTA reply for a client at `since`, or None if the
+        change log no longer covers it."""
+        if since > self.version or since < self._oldest_reachable():
+            return None
+        if since == self.version:
+            return f"DELTA|{self.version}|0|".encode()
+        # Versions are contiguous, so the entry for since+1 is at a known index.
+        start = since + 1 - self.changes[0][0]
+        end = min(start + self.page_size, len(self.changes))
+        reached = self.changes[end - 1][0]
+        batch = ",".join(self.changes[i][1] for i in range(start, end))
+        more = int(reached < self.version)
+        return f"DELTA|{reached}|{more}|{batch}".encode()
+
+    def page(self, after=""):
+        if self._sorted is None:
+            self._sorted = sorted(self.members)
+        start = bisect.bisect_right(self._sorted, after) if after else 0
+        batch = self._sorted[start:start + self.page_size]
+        cursor = batch[-1] if start + self.page_size < len(self._sorted) else ""
+        return f"SNAPSHOT|{self.version}|{cursor}|{','.join(batch)}".encode()
+
+    def handle_getpeers(self, data, legacy_reply):
+        """Answers a GETPEERS command. legacy_reply() builds the full
+        '|'-joined list for clients that send no arguments."""
+        args = dict(arg.split("=", 1) for arg in data.strip().split()[1:] if "=" in arg)
+        if "after" in args:
+            return self.page(args["after"])
+        if "since" in args:
+            try:
+                reply = self.delta(int(args["since"]))
+            except ValueError:
+                reply = None
+            return reply if reply is not None else self.page()
+        return legacy_reply()
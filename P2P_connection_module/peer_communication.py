@@ -3,7 +3,13 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import socket
 import threading
-from file_sharing_module.fileTransfer import handle_incoming_file_request
+from P2P_connection_module.protocol import peek_is_framed, serve_framed
+from file_sharing_module.fileTransfer import (
+    handle_incoming_file_request,
+    handle_incoming_range_request,
+    handle_incoming_have_request,
+    handle_incoming_merkle_request,
+)
 
 class PeerCommunicator:
     def __init__(self, local_port):
@@ -24,7 +30,30 @@ class PeerCommunicator:
 
     def handle_peer_message(self, conn, addr):
         try:
+            if peek_is_framed(conn):
+                self.serve_framed_session(conn, addr)
+                return
             message = conn.recv(1024).decode()
+            self.dispatch_message(message, conn, addr)
+        except Exception as e:
+            print(f"[!] Error handling message from {addr}: {e}")
+
+    def serve_framed_session(self, conn, addr):
+        """Serves a persistent framed connection: every request frame is
+        dispatched like a legacy command, with its own reply channel, on its
+        own thread (which also runs the transfer, see dispatch_message)."""
+        def handle_request(command, reply):
+            threading.Thread(target=self.dispatch_message, args=(command, reply, addr, False), daemon=True).start()
+        try:
+            serve_framed(conn, handle_request)
+        finally:
+            conn.close()
+
+    def dispatch_message(self, message, conn, addr, background=True):
+        """Handles one command. With background, uploads run on a thread of
+        their own so the caller returns at once; framed sessions already
+        call this on a per-request thread and pass background=False."""
+        try:
             if message.startswith("REQUEST_CONNECT"):
                 try:
                     _, peer_name, listening_port = message.strip().split('|')
@@ -51,11 +80,25 @@ class PeerCommunicator:
             elif message.startswith("GET_FILE"):
                 print(f"[DEBUG] GET_FILE received: {message} from {addr}")
                 _, filename = message.strip().split("|")
-                threading.Thread(
-                    target=handle_incoming_file_request,
-                    args=(filename, conn),
-                    daemon=True
-                ).start()
+                # Waits for an upload slot (or replies BUSY), so the number
+                # of transfers running at once stays bounded.
+                self._run_upload(background, handle_incoming_file_request, filename, conn, addr[0])
+                return
+
+            elif message.startswith("GET_RANGE"):
+                _, filename, offset, length = message.strip().split("|")
+                self._run_upload(background, handle_incoming_range_request,
+                                 filename, int(offset), int(length), conn, addr[0])
+                return
+
+            elif message.startswith("HAVE"):
+                _, filename = message.strip().split("|")
+                handle_incoming_have_request(filename, conn)
+                return
+
+            elif message.startswith("MERKLE"):
+                _, filename = message.strip().split("|")
+                handle_incoming_merkle_request(filename, conn)
                 return
 
             else:
@@ -65,6 +108,12 @@ class PeerCommunicator:
         except Exception as e:
             print(f"[!] Error handling message from {addr}: {e}")
 
+    def _run_upload(self, background, target, *args):
+        if background:
+            threading.Thread(target=target, args=args, daemon=True).start()
+        else:
+            target(*args)
+
     def respond_to_pending_requests(self):
         with self.lock:
             if not self.pending_requests:
@@ -1,4 +1,5 @@
-import socket
+from P2P_connection_module.connection_pool import get_pool
+from P2P_connection_module.heartbeat import HeartbeatSender, heartbeat_secret
 
 REGISTRY_HOST = '127.0.0.1'
 REGISTRY_PORT = 9000
@@ -7,45 +8,95 @@ class PeerDiscovery:
     def __init__(self, local_ip='127.0.0.1', local_port=10000):
         self.local_ip = local_ip
         self.local_port = local_port
+        self.peer_cache = set()      # {"ip:port"} as of peer_version
+        self.peer_version = None     # registry membership version the cache reflects
+        secret = heartbeat_secret()
+        self.heartbeat_sender = HeartbeatSender((REGISTRY_HOST, REGISTRY_PORT), secret) if secret else None
+
+    def registry_call(self, command):
+        """Sends one command to the registry over the framed protocol, so
+        replies of any size arrive intact, and returns the decoded reply.
+        The connection is pooled, so heartbeats reuse one socket."""
+        with get_pool().connection((REGISTRY_HOST, REGISTRY_PORT)) as conn:
+            return conn.call(command).decode()
 
     def register_with_registry(self, silent=False):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((REGISTRY_HOST, REGISTRY_PORT))
-                registration_message = f"REGISTER|{self.local_ip}|{self.local_port}"
-                s.send(registration_message.encode())
-                response = s.recv(1024).decode()
-                if not silent:
-                    print(f"[Registry] {response}")
+            response = self.registry_call(f"REGISTER|{self.local_ip}|{self.local_port}")
+            if not silent:
+                print(f"[Registry] {response}")
         except Exception as e:
             print(f"[!] Failed to register with registry: {e}")
+
+    def send_heartbeat(self):
+        """Refreshes this peer's registration: one signed UDP datagram when a
+        heartbeat secret is configured, otherwise a TCP REGISTER."""
+        if self.heartbeat_sender is None:
+            self.register_with_registry(silent=True)
+            return
+        try:
+            self.heartbeat_sender.send([(self.local_ip, self.local_port)])
+        except OSError as e:
+            print(f"[!] Failed to send heartbeat: {e}")
+
     def unregister_from_registry(self):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((REGISTRY_HOST, REGISTRY_PORT))
-                message = f"UNREGISTER|{self.local_ip}|{self.local_port}"
-                s.send(message.encode())
-                response = s.recv(1024).decode()
-                if response == "UNREGISTERED":
-                    print(f"[Registry] Successfully unregistered {self.local_ip}:{self.local_port}")
-                else:
-                    print(f"[Registry] Unregister failed: {response}")
+            response = self.registry_call(f"UNREGISTER|{self.local_ip}|{self.local_port}")
+            if response == "UNREGISTERED":
+                print(f"[Registry] Successfully unregistered {self.local_ip}:{self.local_port}")
+            else:
+                print(f"[Registry] Unregister failed: {response}")
         except Exception as e:
             print(f"[!] Failed to unregister from registry: {e}")
 
+    def _apply_snapshot(self, reply):
+        # Pages through a full snapshot; returns its version.
+        _, version, cursor, peers = reply.split('|', 3)
+        snapshot = set(filter(None, peers.split(',')))
+        while cursor:
+            _, _, cursor, peers = self.registry_call(f"GETPEERS after={cursor}").split('|', 3)
+            snapshot.update(filter(None, peers.split(',')))
+        self.peer_cache = snapshot
+        return int(version)
+
+    def sync_peers(self):
+        """Brings the local peer cache up to date with the registry. Only
+        joins and leaves since the cached version are transferred; a full
+        (paged) snapshot is fetched on first use or when the registry can no
+        longer supply the deltas. Returns the cached peers."""
+        since = self.peer_version if self.peer_version is not None else 0
+        reply = self.registry_call(f"GETPEERS since={since}")
+        while True:
+            if reply.startswith("DELTA|"):
+                _, version, more, changes = reply.split('|', 3)
+                for change in filter(None, changes.split(',')):
+                    if change[0] == '+':
+                        self.peer_cache.add(change[1:])
+                    else:
+                        self.peer_cache.discard(change[1:])
+                self.peer_version = int(version)
+                if more == "0":
+                    break
+            elif reply.startswith("SNAPSHOT|"):
+                # Catch up on changes made while the snapshot was paged.
+                self.peer_version = self._apply_snapshot(reply)
+            else:
+                # Registries that predate membership versions also predate
+                # the framed protocol registry_call() uses, so they cannot
+                # get here; anything else is an error reply.
+                raise ConnectionError(f"Unexpected GETPEERS reply: {reply[:64]!r}")
+            reply = self.registry_call(f"GETPEERS since={self.peer_version}")
+        return sorted(self.peer_cache)
+
     def get_active_peers(self):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((REGISTRY_HOST, REGISTRY_PORT))
-                s.send(b"GETPEERS")
-                response = s.recv(2048).decode()
-                if response:
-                    peers = response.split('|')
-                    print(f"[*] Active peers: {peers}")
-                    return peers
-                else:
-                    print("[*] No active peers found.")
-                    return []
+            peers = self.sync_peers()
+            if peers:
+                print(f"[*] Active peers: {peers}")
+                return peers
+            else:
+                print("[*] No active peers found.")
+                return []
         except Exception as e:
             print(f"[!] Could not retrieve peer list: {e}")
             return []
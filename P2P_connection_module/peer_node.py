@@ -6,13 +6,18 @@ import threading
 import time
 from peer_discovery import PeerDiscovery
 from peer_communication import PeerCommunicator
-from file_sharing_module.fileTransfer import request_file
+from P2P_connection_module.connection_pool import get_pool
+from async_peer_communication import AsyncPeerCommunicator
+from file_sharing_module.download_manager import DownloadManager
+from file_sharing_module.upload_engine import get_upload_stats
+from file_sharing_module.upload_scheduler import get_upload_scheduler
 from file_sharing_module.share_manager import share_file, list_shared_files, unshare_file
 from user_management_module.user_manager import login_user, register_user
-from user_management_module.session_manager import Session
+from user_management_module.session_manager import Session, SessionManager
 LOCAL_IP = '127.0.0.1'
 LOCAL_PORT = 10001  # Change manually for each peer
 HEARTBEAT_INTERVAL = 30  # seconds
+USE_ASYNC_LISTENER = False  # serve peers from the asyncio engine instead of thread-per-connection
 
 heartbeat_count = 0
 running = True
@@ -22,7 +27,7 @@ def send_heartbeat(discovery: PeerDiscovery):
     while running:
         time.sleep(HEARTBEAT_INTERVAL)
         try:
-            discovery.register_with_registry(silent=True)
+            discovery.send_heartbeat()
             heartbeat_count += 1
         except Exception as e:
             print(f"[!] Heartbeat failed: {e}")
@@ -42,19 +47,71 @@ def shutdown_peer(discovery: PeerDiscovery, communicator: PeerCommunicator):
     running = False
     communicator.disconnect_all_peers()
     discovery.unregister_from_registry()
+    get_pool().close()
     print("[!] Peer shutdown complete.")
     
-def monitor_session(session: Session, discovery: PeerDiscovery, communicator: PeerCommunicator):
-    while running:
-        if session.is_expired():
-            print(f"\n[!] Session expired for {session.username}. Logging out.")
-            shutdown_peer(discovery, communicator)
-            os._exit(0)  # Force exit due to input() blocking
-        time.sleep(5)
-        
+def watch_session(session: Session, discovery: PeerDiscovery, communicator: PeerCommunicator):
+    """Registers the CLI session with a SessionManager; its timer calls
+    back on expiry instead of this node polling."""
+    sessions = SessionManager()
+
+    @sessions.on_expire
+    def expired(expired_session):
+        print(f"\n[!] Session expired for {expired_session.username}. Logging out.")
+        shutdown_peer(discovery, communicator)
+        os._exit(0)  # Force exit due to input() blocking
+
+    sessions.add(session)
+    return sessions
+
+def manage_downloads(downloads: DownloadManager):
+    jobs = downloads.list_jobs()
+    if not jobs:
+        print("[!] No downloads yet.")
+        return
+    print("\nDownloads:")
+    for job in jobs:
+        print(f"  {job}")
+    action = input("p <id> pause, r <id> resume, c <id> cancel, Enter to go back: ").strip().split()
+    if len(action) != 2 or not action[1].isdigit():
+        return
+    command, job_id = action[0].lower(), int(action[1])
+    handlers = {"p": downloads.pause, "r": downloads.resume, "c": downloads.cancel}
+    if command not in handlers:
+        print("[!] Invalid option.")
+    elif not handlers[command](job_id):
+        print(f"[!] Download #{job_id} cannot be changed in its current state.")
+
+def show_uploads():
+    scheduler = get_upload_scheduler()
+    stats = scheduler.get_stats()
+    totals = get_upload_stats()["totals"]
+    limit = lambda rate: f"{rate / 2**20:.1f} MiB/s" if rate else "unlimited"
+    print(f"\nUpload slots: {stats['active']}/{stats['slots']} in use, {stats['queued']} queued "
+          f"(max {stats['max_queued']}), {stats['bytes_per_s'] / 2**20:.2f} MiB/s")
+    print(f"Limits: {limit(stats['global_rate'])} total, {limit(stats['peer_rate'])} per peer")
+    print(f"Granted {stats['granted']} (avg wait {stats['avg_wait_s']:.2f}s), "
+          f"rejected {stats['rejected']}, timed out {stats['timed_out']}; "
+          f"{totals['uploads']} uploads, {totals['bytes'] / 2**20:.1f} MiB sent in total")
+    for peer, peer_stats in stats["peers"].items():
+        print(f"  {peer}: {peer_stats['active']} active, {peer_stats['queued']} queued, "
+              f"{peer_stats['bytes_per_s'] / 2**20:.2f} MiB/s")
+    action = input("Set limits as '<total MiB/s> <per-peer MiB/s>' (0 = unlimited), Enter to go back: ").strip().split()
+    if not action:
+        return
+    try:
+        total_rate, peer_rate = (float(value) * 2**20 for value in action)
+    except ValueError:
+        print("[!] Invalid limits.")
+        return
+    scheduler.set_limits(total_rate or None, peer_rate or None)
+    print("[+] Upload limits updated.")
+
 def cli_menu(discovery: PeerDiscovery, communicator: PeerCommunicator, session):
     my_username = session.username
     global running
+    # Downloads run in the background, so the menu stays responsive.
+    downloads = DownloadManager(session)
     while running:
         print("\n========= Peer Menu =========")
         print("1. View active peers")
@@ -67,6 +124,8 @@ def cli_menu(discovery: PeerDiscovery, communicator: PeerCommunicator, session):
         print("8. List shared files")
         print("9. Unshare a file")
         print("10. View session details")
+        print("11. View and manage downloads")
+        print("12. View upload slots and limits")
         choice = input("Select an option: ").strip()
 
         if choice == '1':
@@ -104,6 +163,7 @@ def cli_menu(discovery: PeerDiscovery, communicator: PeerCommunicator, session):
 
         elif choice == '4':
             session.update_activity()
+            downloads.close()
             shutdown_peer(discovery, communicator)
             break
 
@@ -122,14 +182,18 @@ def cli_menu(discovery: PeerDiscovery, communicator: PeerCommunicator, session):
             for idx, peer in enumerate(connected_peers):
                 print(f"{idx + 1}. {peer}")
 
-            selected = input("Enter peer number to request file from: ").strip()
+            selected = input("Enter peer number to request file from (or 'all' for a swarm download): ").strip()
             session.update_activity()
-            if selected.isdigit() and 1 <= int(selected) <= len(connected_peers):
+            if selected.lower() == 'all':
+                filename = input("Enter the filename to request: ").strip()
+                job = downloads.submit(filename, connected_peers, swarm=True)
+            elif selected.isdigit() and 1 <= int(selected) <= len(connected_peers):
                 filename = input("Enter the filename to request: ").strip()
-                ip, port = connected_peers[int(selected) - 1]
-                request_file(ip, port, filename, session)  # ✅ Pass session to access private key
+                job = downloads.submit(filename, [connected_peers[int(selected) - 1]])
             else:
                 print("[!] Invalid selection.")
+                continue
+            print(f"[+] Download #{job.job_id} queued: {filename} (option 11 shows progress)")
 
         elif choice == '7':
             session.update_activity()
@@ -148,6 +212,12 @@ def cli_menu(discovery: PeerDiscovery, communicator: PeerCommunicator, session):
         elif choice == '10':
             session.update_activity()
             print(session)
+        elif choice == '11':
+            session.update_activity()
+            manage_downloads(downloads)
+        elif choice == '12':
+            session.update_activity()
+            show_uploads()
         else:
             print("[!] Invalid option. Try again.")
 
@@ -176,13 +246,16 @@ if __name__ == "__main__":
     session = auth_menu()
 
     discovery = PeerDiscovery(local_ip=LOCAL_IP, local_port=LOCAL_PORT)
-    communicator = PeerCommunicator(local_port=LOCAL_PORT)
+    if USE_ASYNC_LISTENER:
+        communicator = AsyncPeerCommunicator(local_port=LOCAL_PORT)
+    else:
+        communicator = PeerCommunicator(local_port=LOCAL_PORT)
 
     threading.Thread(target=communicator.start_listener, daemon=True).start()
     time.sleep(1)
 
     discovery.register_with_registry()
     threading.Thread(target=send_heartbeat, args=(discovery,), daemon=True).start()
-    threading.Thread(target=monitor_session, args=(session, discovery, communicator), daemon=True).start()
+    watch_session(session, discovery, communicator)
     cli_menu(discovery, communicator, session)
     time.sleep(1)
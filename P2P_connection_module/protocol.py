@@ -0,0 +1,411 @@
+import asyncio
+import socket
+import struct
+import threading
+import itertools
+import queue
+import time
+
+# Framed wire protocol shared by peers and the registry.
+#
+# Every frame is a fixed header followed by `length` payload bytes:
+#   magic (2) | version (1) | msg_type (1) | flags (1) | request_id (4) | length (4)
+# Requests carry the same "COMMAND|arg|arg" strings as the legacy protocol;
+# responses may span several frames (FLAG_MORE on all but the last), and
+# frames of different requests interleave freely on one connection.
+# The magic starts with a non-ASCII byte so servers can tell a framed
+# session from a legacy plain-text command by peeking at the first bytes.
+FRAME_MAGIC = b"\xf5P"
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct(">2sBBBII")
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+MAX_FRAME_PAYLOAD = 16 * 1024 * 1024
+
+MSG_REQUEST = 1
+MSG_RESPONSE = 2
+MSG_PING = 3
+MSG_PONG = 4
+MSG_ERROR = 5
+MSG_CANCEL = 6
+
+FLAG_MORE = 0x01
+STREAM_QUEUE_FRAMES = 64  # per-request receive window; a slow reader backpressures the socket
+DELIVER_POLL = 0.05       # how often a reader blocked on a full stream rechecks it was abandoned
+
+class ProtocolError(Exception):
+    pass
+
+def encode_frame(msg_type, request_id, payload=b"", flags=0) -> bytes:
+    if len(payload) > MAX_FRAME_PAYLOAD:
+        raise ProtocolError(f"Frame payload too large: {len(payload)}")
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, msg_type, flags, request_id, len(payload)) + bytes(payload)
+
+def decode_header(header: bytes):
+    """Returns (msg_type, flags, request_id, length) for a frame header."""
+    magic, version, msg_type, flags, request_id, length = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC or version != PROTOCOL_VERSION:
+        raise ProtocolError("Bad frame header")
+    if length > MAX_FRAME_PAYLOAD:
+        raise ProtocolError(f"Frame payload too large: {length}")
+    return msg_type, flags, request_id, length
+
+def is_framed(prefix: bytes) -> bool:
+    return prefix[:len(FRAME_MAGIC)] == FRAME_MAGIC
+
+def peek_is_framed(sock) -> bool:
+    """Peeks at a freshly accepted socket to see whether the client speaks
+    the framed protocol, without consuming anything."""
+    prefix = sock.recv(len(FRAME_MAGIC), socket.MSG_PEEK)
+    while prefix and prefix == FRAME_MAGIC[:len(prefix)] and len(prefix) < len(FRAME_MAGIC):
+        time.sleep(0.001)
+        prefix = sock.recv(len(FRAME_MAGIC), socket.MSG_PEEK)
+    return is_framed(prefix)
+
+def set_nodelay(sock):
+    # Responses are written as several small frames; without this, Nagle's
+    # algorithm holds them back waiting for delayed ACKs.
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+def recv_exact(sock, n) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-frame")
+        buf += chunk
+    return bytes(buf)
+
+def read_frame(sock):
+    """Reads one frame; returns (msg_type, flags, request_id, payload) or None at EOF."""
+    first = sock.recv(FRAME_HEADER_SIZE)
+    if not first:
+        return None
+    header = first + recv_exact(sock, FRAME_HEADER_SIZE - len(first))
+    msg_type, flags, request_id, length = decode_header(header)
+    return msg_type, flags, request_id, recv_exact(sock, length) if length else b""
+
+async def read_frame_async(reader, prefix=b""):
+    """asyncio counterpart of read_frame. prefix holds header bytes the
+    caller already consumed while sniffing the protocol."""
+    try:
+        header = prefix + await reader.readexactly(FRAME_HEADER_SIZE - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if not e.partial and not prefix:
+            return None
+        raise ConnectionError("Connection closed mid-frame")
+    msg_type, flags, request_id, length = decode_header(header)
+    payload = await reader.readexactly(length) if length else b""
+    return msg_type, flags, request_id, payload
+
+class FrameWriter:
+    """Serializes whole frames onto a shared socket from many threads."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def send(self, msg_type, request_id, payload=b"", flags=0):
+        frame = encode_frame(msg_type, request_id, payload, flags)
+        with self.lock:
+            self.sock.sendall(frame)
+
+    def send_body(self, msg_type, request_id, length, write_body, flags=0):
+        """Writes the header of a frame with a length-byte payload, then
+        calls write_body(sock), which must write exactly that many bytes to
+        the socket (e.g. with os.sendfile), all under the lock. A short or
+        failed body would leave the stream out of sync, so the connection is
+        shut down instead. Returns the payload size."""
+        if length > MAX_FRAME_PAYLOAD:
+            raise ProtocolError(f"Frame payload too large: {length}")
+        header = FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, msg_type, flags, request_id, length)
+        with self.lock:
+            self.sock.sendall(header)
+            try:
+                sent = write_body(self.sock)
+                if sent != length:
+                    raise ConnectionError(f"Frame body ended after {sent} of {length} bytes")
+            except BaseException:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                raise
+        return length
+
+class ReplyChannel:
+    """Socket-like view of one request's response stream on a framed
+    connection. Existing handlers call send/sendall/close on it as if it were
+    a dedicated socket; each write becomes a MSG_RESPONSE frame and close()
+    ends the response."""
+
+    def __init__(self, writer: FrameWriter, request_id):
+        self.writer = writer
+        self.request_id = request_id
+        self.cancelled = False
+        self.closed = False
+
+    def fileno(self):
+        # The socket is shared with other requests, so raw writes to it would
+        # break the framing; zero-copy uploads go through send_frame_body.
+        raise OSError("ReplyChannel has no file descriptor")
+
+    def send_frame_body(self, length, write_body):
+        """Sends one response frame whose payload write_body(sock) writes
+        straight to the connection's socket (see FrameWriter.send_body)."""
+        if self.cancelled or self.closed:
+            raise ConnectionAbortedError("Request cancelled")
+        return self.writer.send_body(MSG_RESPONSE, self.request_id, length, write_body, FLAG_MORE)
+
+    def sendall(self, data):
+        if self.cancelled or self.closed:
+            raise ConnectionAbortedError("Request cancelled")
+        view = memoryview(data)
+        for start in range(0, len(view), MAX_FRAME_PAYLOAD):
+            self.writer.send(MSG_RESPONSE, self.request_id, view[start:start + MAX_FRAME_PAYLOAD], FLAG_MORE)
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.send(MSG_RESPONSE, self.request_id)
+        except OSError:
+            pass
+
+def serve_framed(sock, handle_request):
+    """Runs a framed session on an accepted socket until the peer closes it.
+    handle_request(command, reply_channel) is called for every request and
+    is expected to return quickly (e.g. by handing off to a thread)."""
+    set_nodelay(sock)
+    writer = FrameWriter(sock)
+    channels = {}
+    while True:
+        frame = read_frame(sock)
+        if frame is None:
+            break
+        msg_type, flags, request_id, payload = frame
+        if msg_type == MSG_REQUEST:
+            channel = channels[request_id] = ReplyChannel(writer, request_id)
+            handle_request(payload.decode(), channel)
+        elif msg_type == MSG_PING:
+            writer.send(MSG_PONG, request_id, payload)
+        elif msg_type == MSG_CANCEL:
+            channel = channels.pop(request_id, None)
+            if channel:
+                channel.cancelled = True
+        # Drop bookkeeping for requests whose handlers already finished.
+        for rid in [rid for rid, ch in channels.items() if ch.closed]:
+            del channels[rid]
+    for channel in channels.values():
+        channel.cancelled = True
+
+_END = object()
+
+class ResponseStream:
+    """Client-side, file-like reader over one request's response frames."""
+
+    def __init__(self, connection, request_id, timeout=None):
+        self.connection = connection
+        self.request_id = request_id
+        self.timeout = timeout or connection.timeout
+        self.frames = queue.Queue(maxsize=STREAM_QUEUE_FRAMES)
+        self.finished = False
+        self.abandoned = False     # closed early; frames for it are dropped
+        self._buffer = bytearray()
+
+    def _fill(self):
+        if self.finished:
+            return False
+        try:
+            item = self.frames.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No response to request {self.request_id}")
+        if item is _END:
+            self.finished = True
+            return False
+        if isinstance(item, Exception):
+            self.finished = True
+            raise item
+        self._buffer += item
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def peek(self, size=1):
+        """Returns up to size buffered bytes without consuming them."""
+        while len(self._buffer) < size and self._fill():
+            pass
+        return bytes(self._buffer[:size])
+
+    def readline(self, limit=-1):
+        while b"\n" not in self._buffer and (limit < 0 or len(self._buffer) < limit) and self._fill():
+            pass
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        if limit >= 0:
+            end = min(end, limit)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def close(self):
+        """Abandons the response; tells the server to stop if still running.
+        Queued frames are discarded so the connection's reader never stays
+        blocked on this stream."""
+        if not self.finished:
+            self.finished = True
+            self.abandoned = True
+            self.connection._cancel(self.request_id)
+            self._buffer.clear()
+            while True:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FramedConnection:
+    """Client side of a persistent, multiplexed framed connection. Any number
+    of threads may issue requests concurrently; a reader thread routes
+    response frames to the matching ResponseStream by request id."""
+
+    def __init__(self, sock, timeout=60):
+        self.sock = sock
+        self.timeout = timeout
+        self.writer = FrameWriter(sock)
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    @classmethod
+    def connect(cls, address, timeout=60, connect_timeout=10):
+        sock = socket.create_connection(address, timeout=connect_timeout)
+        sock.settimeout(None)
+        set_nodelay(sock)
+        return cls(sock, timeout)
+
+    def _deliver(self, stream, item):
+        """Queues item for stream, waiting while its window is full. Gives up
+        (and drops the frame) once the stream is abandoned, or when its
+        reader has not taken a frame for a whole timeout; the stream then
+        fails, so one stuck consumer cannot stall the other requests on
+        this connection for longer than that."""
+        deadline = time.monotonic() + stream.timeout
+        while not stream.abandoned:
+            try:
+                stream.frames.put(item, timeout=DELIVER_POLL)
+                return
+            except queue.Full:
+                if time.monotonic() < deadline:
+                    continue
+            stream.abandoned = True
+            self._cancel(stream.request_id)
+            try:
+                stream.frames.get_nowait()
+            except queue.Empty:
+                pass
+            stream.frames.put_nowait(TimeoutError(f"Request {stream.request_id} was not read in time"))
+
+    def _read_loop(self):
+        error = ConnectionError("Connection closed")
+        try:
+            while True:
+                frame = read_frame(self.sock)
+                if frame is None:
+                    break
+                msg_type, flags, request_id, payload = frame
+                with self.lock:
+                    stream = self.streams.get(request_id)
+                if stream is None:
+                    continue
+                if msg_type == MSG_ERROR:
+                    self._deliver(stream, ConnectionError(payload.decode(errors="replace")))
+                    flags = 0
+                elif payload:
+                    self._deliver(stream, payload)
+                if not flags & FLAG_MORE:
+                    self._deliver(stream, _END)
+                    with self.lock:
+                        self.streams.pop(request_id, None)
+        except (OSError, ProtocolError) as e:
+            error = ConnectionError(f"Connection lost: {e}")
+        finally:
+            self.closed = True
+            with self.lock:
+                streams, self.streams = list(self.streams.values()), {}
+            for stream in streams:
+                while True:
+                    try:
+                        stream.frames.put_nowait(error)
+                        break
+                    except queue.Full:
+                        stream.frames.get_nowait()
+
+    def _send(self, msg_type, payload=b"", timeout=None):
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        request_id = next(self._ids)
+        stream = ResponseStream(self, request_id, timeout)
+        with self.lock:
+            self.streams[request_id] = stream
+        try:
+            self.writer.send(msg_type, request_id, payload)
+        except OSError:
+            with self.lock:
+                self.streams.pop(request_id, None)
+            self.close()
+            raise
+        return stream
+
+    def _cancel(self, request_id):
+        with self.lock:
+            active = self.streams.pop(request_id, None) is not None
+        if active and not self.closed:
+            try:
+                self.writer.send(MSG_CANCEL, request_id)
+            except OSError:
+                self.close()
+
+    def request(self, command: str) -> ResponseStream:
+        return self._send(MSG_REQUEST, command.encode())
+
+    def call(self, command: str) -> bytes:
+        """Sends a request and returns its complete response."""
+        with self.request(command) as stream:
+            return stream.read()
+
+    def ping(self, timeout=None) -> float:
+        """Round-trips a PING frame and returns the latency in seconds."""
+        start = time.perf_counter()
+        with self._send(MSG_PING, timeout=timeout) as stream:
+            stream.read()
+        return time.perf_counter() - start
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -0,0 +1,108 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import io
+import random
+import tempfile
+import time
+from encryption_module.encrypt import generate_key
+from file_sharing_module.compression import (
+    DEFAULT_LEVELS,
+    available_codecs,
+    choose_compression,
+    make_compressor,
+    make_decompressor,
+)
+from file_sharing_module.pipeline import decrypt_and_hash_stream, hash_and_encrypt_file
+
+def make_log(size):
+    """Text resembling application logs / CSV exports."""
+    rng = random.Random(1)
+    levels = ["INFO", "DEBUG", "WARN", "ERROR"]
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"2025-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z,"
+                f"{rng.choice(levels)},worker-{rng.randint(1, 16)},request {rng.randint(1, 10**6)} "
+                f"took {rng.randint(1, 900)} ms,status={rng.choice([200, 200, 200, 404, 500])}\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+def make_random(size):
+    return os.urandom(size)
+
+def codec_costs(data, codec, level):
+    start = time.perf_counter()
+    compressor = make_compressor(codec, level)
+    compressed = compressor.compress(data) + compressor.flush()
+    compress_s = time.perf_counter() - start
+    start = time.perf_counter()
+    decompressor = make_decompressor(codec)
+    decompressor.decompress(compressed)
+    decompressor.flush()
+    return len(compressed), compress_s, time.perf_counter() - start
+
+def pipeline_time(path, compression):
+    """Real share + download pipeline (hash, compress, encrypt / decrypt,
+    decompress, hash) on a file; returns (seconds, stored bytes)."""
+    key = generate_key()
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        out_path = tmp.name
+    try:
+        start = time.perf_counter()
+        hash_and_encrypt_file(path, out_path, key, compression=compression)
+        with open(out_path, "rb") as f_in:
+            decrypt_and_hash_stream(io.BufferedReader(f_in), io.BytesIO(), key, compression=compression)
+        return time.perf_counter() - start, os.path.getsize(out_path)
+    finally:
+        os.remove(out_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression CPU cost versus bytes on the wire.")
+    parser.add_argument("--size-mib", type=int, default=32)
+    parser.add_argument("--link-mbps", type=float, nargs="+", default=[100, 1000],
+                        help="link speeds to estimate transfer time for")
+    args = parser.parse_args()
+    size = args.size_mib * 1024 * 1024
+
+    for kind, make in (("log/csv", make_log), ("random", make_random)):
+        data = make(size)
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(data)
+            path = tmp.name
+        try:
+            decision = choose_compression(path)
+            print(f"\n[{kind}] {args.size_mib} MiB, sampler picks: {decision or 'no compression'}")
+            header = f"{'codec':<8} {'level':>5} {'ratio':>6} {'comp MiB/s':>11} {'decomp MiB/s':>13}"
+            header += "".join(f" {f'@{mbps:g}Mb/s':>11}" for mbps in args.link_mbps)
+            print(header)
+            rows = [("none", 0, size, 0.0, 0.0)]
+            for codec in available_codecs():
+                levels = sorted({1, DEFAULT_LEVELS[codec], 9 if codec != "zstd" else 19})
+                for level in levels:
+                    rows.append((codec, level) + codec_costs(data, codec, level))
+            for codec, level, out_size, comp_s, decomp_s in rows:
+                line = (f"{codec:<8} {level:>5} {out_size / size:6.3f} "
+                        f"{(size / 2**20 / comp_s) if comp_s else float('inf'):11.1f} "
+                        f"{(size / 2**20 / decomp_s) if decomp_s else float('inf'):13.1f}")
+                for mbps in args.link_mbps:
+                    # compress + send + decompress, each in turn
+                    total = comp_s + out_size * 8 / (mbps * 1e6) + decomp_s
+                    line += f" {total:10.2f}s"
+                print(line)
+
+            plain_s, plain_size = pipeline_time(path, None)
+            if decision:
+                comp_s, comp_size = pipeline_time(path, decision)
+                print(f"pipeline: {plain_s:.2f}s -> {plain_size} bytes uncompressed, "
+                      f"{comp_s:.2f}s -> {comp_size} bytes with {decision['codec']}-{decision['level']}")
+            else:
+                print(f"pipeline: {plain_s:.2f}s -> {plain_size} bytes (sampler skipped compression)")
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import tempfile
+import time
+from encryption_module.encrypt import encrypt_file, decrypt_file, generate_key
+from encryption_module.parallel_encrypt import encrypt_file_parallel, decrypt_file_parallel, DEFAULT_WORKERS
+
+def timed(label, size, fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s  {size / elapsed / 2**20:9.1f} MiB/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single-threaded and parallel file encryption.")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = parser.parse_args()
+
+    size = args.size_mb * 2**20
+    key = generate_key()
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "plain.bin")
+        cipher = os.path.join(tmp, "cipher.bin")
+        out = os.path.join(tmp, "out.bin")
+        with open(plain, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(2**20))
+
+        print(f"[*] {args.size_mb} MiB, {args.workers} workers ({'processes' if args.processes else 'threads'})")
+        serial_enc = timed("encrypt (serial)", size, encrypt_file, plain, cipher, key)
+        parallel_enc = timed("encrypt (parallel)", size, encrypt_file_parallel, plain, cipher, key,
+                             workers=args.workers, use_processes=args.processes)
+        serial_dec = timed("decrypt (serial)", size, decrypt_file, cipher, out, key)
+        parallel_dec = timed("decrypt (parallel)", size, decrypt_file_parallel, cipher, out, key,
+                             workers=args.workers, use_processes=args.processes)
+        print(f"[+] Speedup: encrypt x{serial_enc / parallel_enc:.2f}, decrypt x{serial_dec / parallel_dec:.2f}")
+
+if __name__ == "__main__":
+    main()
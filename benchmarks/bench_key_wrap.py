@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+from cryptography.hazmat.primitives import serialization
+from encryption_module.encrypt import generate_key
+from encryption_module.key_wrap import (
+    SCHEMES,
+    SCHEME_RSA_OAEP,
+    generate_keypair,
+    public_key_cache,
+    scheme_for_key,
+    wrap_for_recipients,
+)
+from encryption_module.parallel_encrypt import DEFAULT_WORKERS
+
+def make_recipients(count, scheme=SCHEME_RSA_OAEP):
+    pems = {}
+    for i in range(count):
+        _, public_key = generate_keypair(scheme)
+        pems[f"user{i}"] = public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    return pems
+
+def serial_share(file_key, recipients):
+    # What share_file used to do: parse every PEM, then wrap, one at a time.
+    wrapped = {}
+    for username, pem in recipients.items():
+        public_key = serialization.load_pem_public_key(pem.encode())
+        wrapped[username] = scheme_for_key(public_key).wrap(public_key, file_key)
+    return wrapped
+
+def timed(label, count, fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms  {count / elapsed:8.0f} recipients/s")
+    return elapsed
+
+def per_op(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count * 1000
+
+def compare_schemes(count):
+    """Per-operation cost of each key-wrap scheme."""
+    file_key = generate_key()
+    print(f"{'scheme':<12} {'keygen ms':>10} {'wrap ms':>10} {'unwrap ms':>10}")
+    for name, scheme in SCHEMES.items():
+        keygen = per_op(scheme.generate_keypair, max(1, count // 10))
+        private_key, public_key = scheme.generate_keypair()
+        wrapped = scheme.wrap(public_key, file_key)
+        wrap = per_op(lambda: scheme.wrap(public_key, file_key), count)
+        unwrap = per_op(lambda: scheme.unwrap(private_key, wrapped), count)
+        print(f"{name:<12} {keygen:10.3f} {wrap:10.3f} {unwrap:10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure wrapping one file key for a large group of recipients.")
+    parser.add_argument("--recipients", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    parser.add_argument("--scheme", choices=sorted(SCHEMES), default=SCHEME_RSA_OAEP,
+                        help="key type of the generated recipients")
+    parser.add_argument("--ops", type=int, default=200, help="operations per scheme in the comparison")
+    args = parser.parse_args()
+
+    compare_schemes(args.ops)
+
+    print(f"[*] Generating {args.recipients} {args.scheme} recipients...")
+    recipients = make_recipients(args.recipients, args.scheme)
+    file_key = generate_key()
+
+    print(f"[*] {args.workers} workers ({'processes' if args.processes else 'threads'})")
+    serial = timed("parse + wrap (serial)", args.recipients, serial_share, file_key, recipients)
+    public_key_cache.clear()
+    timed("batched (cold key cache)", args.recipients, wrap_for_recipients, file_key, recipients,
+          workers=args.workers, use_processes=args.processes)
+    warm = timed("batched (warm key cache)", args.recipients, wrap_for_recipients, file_key, recipients,
+                 workers=args.workers, use_processes=args.processes)
+    print(f"[*] speedup (warm): {serial / warm:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from encryption_module.encrypt import encrypt_private_key, decrypt_private_key
+from encryption_module.key_wrap import SCHEMES, generate_keypair
+from user_management_module.user_manager import derive_key_from_password
+
+PASSWORD = "correct horse battery staple"
+SALT = os.urandom(16)
+
+def ms(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def key_load_costs(repeat):
+    """Decrypting + parsing the stored private key, per scheme."""
+    costs = {}
+    derived_key = derive_key_from_password(PASSWORD, SALT, 1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in SCHEMES:
+            path = os.path.join(tmp, f"{name}.pem.enc")
+            encrypt_private_key(generate_keypair(name)[0], derived_key, path)
+            costs[name] = ms(lambda: decrypt_private_key(path, derived_key), repeat)
+    return costs
+
+def overlapped(hasher, stored_hash, iterations, repeat):
+    """Argon2 verify in this thread, PBKDF2 on a worker, like authenticate()."""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        def login():
+            derivation = pool.submit(derive_key_from_password, PASSWORD, SALT, iterations)
+            hasher.verify(stored_hash, PASSWORD)
+            derivation.result()
+        return ms(login, repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-step login latency for Argon2/PBKDF2 parameter choices.")
+    parser.add_argument("--budget", type=float, default=250, help="login latency budget in ms")
+    parser.add_argument("--time-cost", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--memory-cost", type=int, nargs="+", default=[19456, 65536], help="KiB")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100000, 600000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("private key load (lazy, first use):")
+    for name, cost in key_load_costs(args.repeat * 10).items():
+        print(f"  {name:<10} {cost:8.2f} ms")
+
+    pbkdf2 = {n: ms(lambda: derive_key_from_password(PASSWORD, SALT, n), args.repeat) for n in args.iterations}
+
+    print(f"\n{'time':>4} {'mem KiB':>8} {'iters':>8} {'argon2':>8} {'pbkdf2':>8} {'serial':>8} {'overlap':>8}  budget {args.budget:.0f} ms")
+    for time_cost in args.time_cost:
+        for memory_cost in args.memory_cost:
+            hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost)
+            stored_hash = hasher.hash(PASSWORD)
+            argon2 = ms(lambda: hasher.verify(stored_hash, PASSWORD), args.repeat)
+            for iterations, derive in pbkdf2.items():
+                both = overlapped(hasher, stored_hash, iterations, args.repeat)
+                verdict = "ok" if both <= args.budget else "over"
+                print(f"{time_cost:>4} {memory_cost:>8} {iterations:>8} {argon2:8.1f} {derive:8.1f} "
+                      f"{argon2 + derive:8.1f} {both:8.1f}  {verdict}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'P2P_connection_module')))
+
+import argparse
+import asyncio
+import resource
+import socket
+import threading
+import time
+from peer_communication import PeerCommunicator
+from async_peer_communication import AsyncPeerCommunicator
+from file_sharing_module.fileTransfer import SHARED_DIR
+
+BENCH_FILE = "bench_listener.bin"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def one_request(port, length, connected, hold, results):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    connected.append(1)
+    await hold.wait()  # keep every connection open until all are established
+    writer.write(f"GET_RANGE|{BENCH_FILE}|0|{length}".encode())
+    await writer.drain()
+    header = await reader.readline()
+    await reader.readexactly(int(header.split(b"|")[2]))
+    writer.close()
+    results.append(time.perf_counter() - start)
+
+async def run_clients(port, connections, length, connect_timeout=10):
+    hold = asyncio.Event()
+    connected, results = [], []
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(one_request(port, length, connected, hold, results)) for _ in range(connections)]
+    while len(connected) < connections and time.perf_counter() - start < connect_timeout:
+        await asyncio.sleep(0.05)
+    peak_threads = threading.active_count()
+    hold.set()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for o in outcomes if isinstance(o, Exception))
+    return elapsed, results, errors, peak_threads
+
+def bench(label, communicator_cls, connections, length):
+    port = free_port()
+    communicator = communicator_cls(port)
+    threading.Thread(target=communicator.start_listener, daemon=True).start()
+    time.sleep(0.5)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    elapsed, results, errors, peak_threads = asyncio.run(run_clients(port, connections, length))
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.sort()
+    p50 = results[len(results) // 2] * 1000 if results else 0
+    p99 = results[int(len(results) * 0.99) - 1] * 1000 if results else 0
+    print(f"{label:<10} {connections} conns: {elapsed:6.2f}s total, p50 {p50:7.1f} ms, p99 {p99:7.1f} ms, "
+          f"errors {errors}, peak threads {peak_threads}, max RSS +{(rss_after - rss_before) / 1024:.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded vs asyncio peer listener at many concurrent connections.")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--length", type=int, default=64 * 1024, help="bytes served per request")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.connections * 3)), hard))
+
+    path = os.path.join(SHARED_DIR, BENCH_FILE)
+    with open(path, "wb") as f:
+        f.write(os.urandom(args.length))
+    try:
+        bench("asyncio", AsyncPeerCommunicator, args.connections, args.length)
+        bench("threaded", PeerCommunicator, args.connections, args.length)
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'P2P_connection_module')))
+
+import argparse
+import asyncio
+import resource
+import socket
+import threading
+import time
+import async_registry
+from async_registry import AsyncRegistry
+from heartbeat import HeartbeatSender
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def call(port, message):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(message.encode())
+    await writer.drain()
+    reply = await reader.read()
+    writer.close()
+    return reply
+
+async def storm(port, peers, concurrency, label):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            await call(port, f"REGISTER|10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}|{10000 + i % 50000}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(peers)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {peers} requests in {elapsed:6.2f}s ({peers / elapsed:8.0f} req/s)")
+
+async def run(port, peers, concurrency):
+    await storm(port, peers, concurrency, "register")
+    await storm(port, peers, concurrency, "heartbeat")
+    start = time.perf_counter()
+    for _ in range(20):
+        reply = await call(port, "GETPEERS")
+    elapsed = (time.perf_counter() - start) / 20
+    print(f"{'getpeers':<12} {len(reply.split(b'|'))} peers, {len(reply)} bytes, {elapsed * 1000:.2f} ms per call")
+
+def udp_heartbeats(registry, port, peers, rounds=5):
+    """Heartbeats every peer over signed UDP datagrams and waits until the
+    registry has applied them."""
+    sender = HeartbeatSender(("127.0.0.1", port), registry.heartbeat_key)
+    peer_ids = [(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 10000 + i % 50000) for i in range(peers)]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        before = sum(registry.peers.heartbeat_counter.values())
+        sender.send(peer_ids)
+        deadline = time.monotonic() + 5
+        while sum(registry.peers.heartbeat_counter.values()) - before < peers and time.monotonic() < deadline:
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    applied = sum(registry.peers.heartbeat_counter.values())
+    print(f"{'udp':<12} {peers * rounds} heartbeats in {elapsed:6.2f}s ({peers * rounds / elapsed:8.0f} hb/s, "
+          f"{applied} applied incl. TCP)")
+    sender.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the asyncio registry with many heartbeating peers.")
+    parser.add_argument("--peers", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--udp", action="store_true", help="also measure batched UDP heartbeats")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.concurrency * 4)), hard))
+    async_registry.safe_print = lambda *a, **k: None  # keep per-peer logging out of the measurement
+
+    port = free_port()
+    registry = AsyncRegistry(host="127.0.0.1", port=port, heartbeat_key=os.urandom(32) if args.udp else None)
+    threading.Thread(target=lambda: asyncio.run(registry.serve_forever()), daemon=True).start()
+    time.sleep(0.5)
+    asyncio.run(run(port, args.peers, args.concurrency))
+    if args.udp:
+        udp_heartbeats(registry, port, args.peers)
+
+if __name__ == "__main__":
+    main()
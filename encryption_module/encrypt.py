@@ -1,17 +1,32 @@
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, x25519
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding as crypto_padding
+from cryptography.exceptions import InvalidTag
 import os
+import struct
 
 
 # Constants
 BLOCK_SIZE = 16  # AES block size (bytes)
 KEY_SIZE = 32    # AES-256
 RSA_KEY_SIZE = 2048
+# Chunked container format: header followed by fixed-size AES-GCM records.
+# Each record is encrypted under nonce = nonce_prefix || record_index and
+# authenticates the header plus a "final record" flag, so records cannot be
+# reordered, spliced between files or truncated without detection.
+STREAM_MAGIC = b"SPFE"
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 8
+STREAM_HEADER = struct.Struct(">4sBI8s")  # magic, version, chunk size, nonce prefix
+STREAM_HEADER_SIZE = STREAM_HEADER.size
+MAX_STREAM_CHUNK_SIZE = 16 * 1024 * 1024
 PRIVATE_KEY_DIR = os.path.join(os.path.dirname(__file__), "../private_keys")
 os.makedirs(PRIVATE_KEY_DIR, exist_ok=True)
 
@@ -26,29 +41,210 @@ def unpad(data: bytes) -> bytes:
 def generate_key() -> bytes:
     return get_random_bytes(KEY_SIZE)
 
-def encrypt_file(input_path: str, output_path: str, key: bytes) -> None:
-    cipher = AES.new(key, AES.MODE_CBC)
-    iv = cipher.iv
+def _record_nonce(nonce_prefix: bytes, index: int) -> bytes:
+    return nonce_prefix + index.to_bytes(4, "big")
 
-    with open(input_path, 'rb') as f_in:
-        plaintext = f_in.read()
-    padded = pad(plaintext)
-    ciphertext = cipher.encrypt(padded)
+def _record_aad(header: bytes, final: bool) -> bytes:
+    return header + (b"\x01" if final else b"\x00")
 
-    with open(output_path, 'wb') as f_out:
-        f_out.write(iv + ciphertext)
+def encrypt_record(key: bytes, header: bytes, index: int, plaintext: bytes, final: bool) -> bytes:
+    """Encrypts a single record of the chunked format (ciphertext || tag)."""
+    nonce_prefix = header[-NONCE_PREFIX_SIZE:]
+    return AESGCM(key).encrypt(_record_nonce(nonce_prefix, index), plaintext, _record_aad(header, final))
 
-def decrypt_file(input_path: str, output_path: str, key: bytes) -> None:
-    with open(input_path, 'rb') as f_in:
-        iv = f_in.read(BLOCK_SIZE)
-        ciphertext = f_in.read()
+def decrypt_record(key: bytes, header: bytes, index: int, record: bytes, final: bool) -> bytes:
+    """Authenticates and decrypts a single record of the chunked format."""
+    nonce_prefix = header[-NONCE_PREFIX_SIZE:]
+    try:
+        return AESGCM(key).decrypt(_record_nonce(nonce_prefix, index), record, _record_aad(header, final))
+    except InvalidTag:
+        raise ValueError(f"Authentication failed for record {index}")
+
+def build_stream_header(chunk_size: int = STREAM_CHUNK_SIZE, nonce_prefix: bytes = None) -> bytes:
+    if nonce_prefix is None:
+        nonce_prefix = get_random_bytes(NONCE_PREFIX_SIZE)
+    return STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, chunk_size, nonce_prefix)
+
+def parse_stream_header(header: bytes) -> int:
+    """Validates a chunked-format header and returns its chunk size."""
+    magic, version, chunk_size, _ = STREAM_HEADER.unpack(header)
+    if magic != STREAM_MAGIC or version != STREAM_VERSION:
+        raise ValueError("Not a chunked encrypted stream")
+    if not 0 < chunk_size <= MAX_STREAM_CHUNK_SIZE:
+        raise ValueError(f"Invalid chunk size in header: {chunk_size}")
+    return chunk_size
+
+def is_chunked_stream(prefix: bytes) -> bool:
+    return prefix[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+class StreamEncryptor:
+    """Incrementally encrypts plaintext into the chunked container format.
+
+    Holds at most one record of plaintext, so memory use is bounded by the
+    chunk size regardless of how much data is fed through update().
+    """
+
+    def __init__(self, key: bytes, chunk_size: int = STREAM_CHUNK_SIZE, nonce_prefix: bytes = None):
+        self.key = key
+        self.chunk_size = chunk_size
+        self.header = build_stream_header(chunk_size, nonce_prefix)
+        self._buffer = bytearray()
+        self._index = 0
+        self._header_sent = False
+
+    def _take_header(self) -> bytes:
+        if self._header_sent:
+            return b""
+        self._header_sent = True
+        return self.header
+
+    def update(self, data: bytes) -> bytes:
+        self._buffer += data
+        out = [self._take_header()]
+        # Keep the last full chunk back: it may turn out to be the final record.
+        while len(self._buffer) > self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            out.append(encrypt_record(self.key, self.header, self._index, chunk, final=False))
+            self._index += 1
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        out = self._take_header() + encrypt_record(
+            self.key, self.header, self._index, bytes(self._buffer), final=True
+        )
+        self._buffer.clear()
+        return out
+
+class _ChunkedDecryptor:
+    def __init__(self, key: bytes):
+        self.key = key
+        self.header = None
+        self.record_size = None
+        self._buffer = bytearray()
+        self._index = 0
+
+    def update(self, data: bytes) -> bytes:
+        self._buffer += data
+        if self.header is None:
+            if len(self._buffer) < STREAM_HEADER_SIZE:
+                return b""
+            self.header = bytes(self._buffer[:STREAM_HEADER_SIZE])
+            del self._buffer[:STREAM_HEADER_SIZE]
+            self.record_size = parse_stream_header(self.header) + TAG_SIZE
+        out = []
+        # A record is only known to be non-final once data past it has arrived.
+        while len(self._buffer) > self.record_size:
+            record = bytes(self._buffer[:self.record_size])
+            del self._buffer[:self.record_size]
+            out.append(decrypt_record(self.key, self.header, self._index, record, final=False))
+            self._index += 1
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        if self.header is None or len(self._buffer) < TAG_SIZE:
+            raise ValueError("Encrypted stream is truncated")
+        out = decrypt_record(self.key, self.header, self._index, bytes(self._buffer), final=True)
+        self._buffer.clear()
+        return out
+
+class _LegacyCBCDecryptor:
+    """Streams the old single-blob format: IV || AES-CBC(padded plaintext)."""
 
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    padded_plaintext = cipher.decrypt(ciphertext)
-    plaintext = unpad(padded_plaintext)
+    def __init__(self, key: bytes):
+        self.key = key
+        self._decryptor = None
+        self._pending = bytearray()
+        self._tail = b""
 
-    with open(output_path, 'wb') as f_out:
+    def update(self, data: bytes) -> bytes:
+        if self._decryptor is None:
+            self._pending += data
+            if len(self._pending) < BLOCK_SIZE:
+                return b""
+            iv = bytes(self._pending[:BLOCK_SIZE])
+            data = bytes(self._pending[BLOCK_SIZE:])
+            self._pending.clear()
+            cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=default_backend())
+            self._decryptor = cipher.decryptor()
+        plaintext = self._tail + self._decryptor.update(data)
+        # The last block carries the padding, so never release it early.
+        cut = max(len(plaintext) - BLOCK_SIZE, 0)
+        self._tail = plaintext[cut:]
+        return plaintext[:cut]
+
+    def finalize(self) -> bytes:
+        if self._decryptor is None:
+            raise ValueError("Encrypted stream is truncated")
+        plaintext = self._tail + self._decryptor.finalize()
+        self._tail = b""
+        return unpad(plaintext) if plaintext else b""
+
+class StreamDecryptor:
+    """Incrementally decrypts either the chunked format or the legacy CBC blob.
+
+    The format is picked from the first bytes of the stream, so callers can
+    feed data straight from a socket or file without knowing which one it is.
+    """
+
+    def __init__(self, key: bytes):
+        self.key = key
+        self._impl = None
+        self._prefix = bytearray()
+
+    @property
+    def legacy(self) -> bool:
+        return isinstance(self._impl, _LegacyCBCDecryptor)
+
+    def update(self, data: bytes) -> bytes:
+        if self._impl is None:
+            self._prefix += data
+            if len(self._prefix) < len(STREAM_MAGIC):
+                return b""
+            data = bytes(self._prefix)
+            self._prefix.clear()
+            if is_chunked_stream(data):
+                self._impl = _ChunkedDecryptor(self.key)
+            else:
+                self._impl = _LegacyCBCDecryptor(self.key)
+        return self._impl.update(data)
+
+    def finalize(self) -> bytes:
+        if self._impl is None:
+            raise ValueError("Encrypted stream is truncated")
+        return self._impl.finalize()
+
+def encrypt_stream(f_in, f_out, key: bytes, chunk_size: int = STREAM_CHUNK_SIZE, nonce_prefix: bytes = None) -> int:
+    """Encrypts file object f_in into f_out. Returns the plaintext size.
+    nonce_prefix defaults to random; pass one only if key never encrypts
+    different plaintext (see blob_store's convergent keys)."""
+    encryptor = StreamEncryptor(key, chunk_size, nonce_prefix)
+    total = 0
+    while chunk := f_in.read(chunk_size):
+        total += len(chunk)
+        f_out.write(encryptor.update(chunk))
+    f_out.write(encryptor.finalize())
+    return total
+
+def decrypt_stream(f_in, f_out, key: bytes, read_size: int = STREAM_CHUNK_SIZE + TAG_SIZE) -> int:
+    """Decrypts file object f_in into f_out. Returns the plaintext size."""
+    decryptor = StreamDecryptor(key)
+    total = 0
+    while chunk := f_in.read(read_size):
+        plaintext = decryptor.update(chunk)
+        total += len(plaintext)
         f_out.write(plaintext)
+    plaintext = decryptor.finalize()
+    f_out.write(plaintext)
+    return total + len(plaintext)
+
+def encrypt_file(input_path: str, output_path: str, key: bytes) -> None:
+    with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        encrypt_stream(f_in, f_out, key)
+
+def decrypt_file(input_path: str, output_path: str, key: bytes) -> None:
+    with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        decrypt_stream(f_in, f_out, key)
 
 def generate_rsa_keypair():
     """Generates an RSA private/public key pair."""
@@ -60,8 +256,13 @@ def generate_rsa_keypair():
     public_key = private_key.public_key()
     return private_key, public_key
 
+def generate_x25519_keypair():
+    """Generates an X25519 private/public key pair (for key wrapping)."""
+    private_key = x25519.X25519PrivateKey.generate()
+    return private_key, private_key.public_key()
+
 def encrypt_private_key(private_key, aes_key: bytes, filepath: str):
-    """Encrypts a private RSA key using AES and writes it to disk."""
+    """Encrypts a private (RSA or X25519) key using AES and writes it to disk."""
     pem = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PrivateFormat.PKCS8,
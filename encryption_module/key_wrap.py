@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, x25519
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from encryption_module.encrypt import generate_rsa_keypair, generate_x25519_keypair
+from encryption_module.parallel_encrypt import DEFAULT_WORKERS, _make_executor
+
+# Wrapping of per-file AES keys for many recipients.
+#
+# Key wrapping is pluggable: each scheme wraps a file key for one public key
+# and unwraps it with the matching private key. Manifest access entries
+# record the scheme as {"scheme": ..., "wrapped": <base64>}; a bare base64
+# string is a legacy RSA-OAEP entry, so old manifests keep working.
+#
+# Parsed public keys are kept in a bounded LRU keyed by (username, PEM
+# fingerprint), so a user who re-registers a new key is never served the
+# stale one. Batches of recipients are wrapped on a worker pool; a failure
+# for one recipient is reported for that recipient only.
+PUBLIC_KEY_CACHE_SIZE = 4096
+WRAP_BATCH = 32  # recipients per pool task, to amortize task overhead
+
+SCHEME_RSA_OAEP = "rsa-oaep"
+SCHEME_X25519 = "x25519"
+DEFAULT_KEY_SCHEME = SCHEME_X25519   # used for new registrations
+
+OAEP = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+class RSAOAEPScheme:
+    name = SCHEME_RSA_OAEP
+    key_types = (rsa.RSAPublicKey, rsa.RSAPrivateKey)
+
+    @staticmethod
+    def generate_keypair():
+        return generate_rsa_keypair()
+
+    @staticmethod
+    def wrap(public_key, file_key: bytes) -> bytes:
+        return public_key.encrypt(file_key, OAEP)
+
+    @staticmethod
+    def unwrap(private_key, wrapped: bytes) -> bytes:
+        return private_key.decrypt(wrapped, OAEP)
+
+class X25519Scheme:
+    """ECIES-style wrap: an ephemeral X25519 key agreement with the
+    recipient's key, HKDF-SHA256 to a one-time key-encryption key, and
+    AES-GCM over the file key.
+    wrapped = ephemeral_public (32) || AES-GCM(file_key) (len + 16)"""
+    name = SCHEME_X25519
+    key_types = (x25519.X25519PublicKey, x25519.X25519PrivateKey)
+    INFO = b"p2p-file-key-wrap/x25519/v1"
+    NONCE = b"\x00" * 12   # the KEK is fresh per wrap, so a fixed nonce is safe
+
+    @staticmethod
+    def generate_keypair():
+        return generate_x25519_keypair()
+
+    @classmethod
+    def _kek(cls, shared, ephemeral_public, recipient_public):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                    info=cls.INFO + ephemeral_public + recipient_public).derive(shared)
+
+    @classmethod
+    def wrap(cls, public_key, file_key: bytes) -> bytes:
+        ephemeral = x25519.X25519PrivateKey.generate()
+        ephemeral_public = ephemeral.public_key().public_bytes_raw()
+        recipient_public = public_key.public_bytes_raw()
+        kek = cls._kek(ephemeral.exchange(public_key), ephemeral_public, recipient_public)
+        return ephemeral_public + AESGCM(kek).encrypt(cls.NONCE, file_key, recipient_public)
+
+    @classmethod
+    def unwrap(cls, private_key, wrapped: bytes) -> bytes:
+        ephemeral_public, sealed = wrapped[:32], wrapped[32:]
+        recipient_public = private_key.public_key().public_bytes_raw()
+        shared = private_key.exchange(x25519.X25519PublicKey.from_public_bytes(ephemeral_public))
+        kek = cls._kek(shared, ephemeral_public, recipient_public)
+        return AESGCM(kek).decrypt(cls.NONCE, sealed, recipient_public)
+
+SCHEMES = {scheme.name: scheme for scheme in (RSAOAEPScheme, X25519Scheme)}
+
+def get_scheme(name):
+    try:
+        return SCHEMES[name]
+    except KeyError:
+        raise ValueError(f"Unknown key-wrap scheme: {name}")
+
+def scheme_for_key(key):
+    """Picks the scheme matching a loaded public or private key object."""
+    for scheme in SCHEMES.values():
+        if isinstance(key, scheme.key_types):
+            return scheme
+    raise ValueError(f"No key-wrap scheme for {type(key).__name__}")
+
+def generate_keypair(scheme_name=DEFAULT_KEY_SCHEME):
+    return get_scheme(scheme_name).generate_keypair()
+
+def make_access_entry(scheme_name, wrapped: bytes):
+    return {"scheme": scheme_name, "wrapped": base64.b64encode(wrapped).decode()}
+
+def parse_access_entry(value):
+    """Returns (scheme_name, wrapped_bytes) for a manifest access value."""
+    if isinstance(value, str):
+        return SCHEME_RSA_OAEP, base64.b64decode(value)
+    return value["scheme"], base64.b64decode(value["wrapped"])
+
+def key_fingerprint(pem) -> str:
+    if isinstance(pem, str):
+        pem = pem.encode()
+    return hashlib.sha256(pem).hexdigest()
+
+class PublicKeyCache:
+    """Thread-safe LRU of loaded public-key objects."""
+
+    def __init__(self, max_size=PUBLIC_KEY_CACHE_SIZE):
+        self.max_size = max_size
+        self.keys = OrderedDict()   # {(username, fingerprint): public_key}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, pem):
+        if isinstance(pem, str):
+            pem = pem.encode()
+        cache_key = (username, key_fingerprint(pem))
+        with self.lock:
+            public_key = self.keys.get(cache_key)
+            if public_key is not None:
+                self.keys.move_to_end(cache_key)
+                self.hits += 1
+                return public_key
+            self.misses += 1
+        public_key = serialization.load_pem_public_key(pem)
+        with self.lock:
+            self.keys[cache_key] = public_key
+            self.keys.move_to_end(cache_key)
+            while len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+        return public_key
+
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+
+public_key_cache = PublicKeyCache()
+
+def wrap_file_key(public_key, file_key: bytes):
+    """Wraps file_key with the scheme matching public_key's type.
+    Returns a manifest access entry."""
+    scheme = scheme_for_key(public_key)
+    return make_access_entry(scheme.name, scheme.wrap(public_key, file_key))
+
+def unwrap_file_key(private_key, access_value) -> bytes:
+    """Unwraps a manifest access entry with the recipient's private key.
+    Raises ValueError if the entry's scheme does not match the key."""
+    scheme_name, wrapped = parse_access_entry(access_value)
+    scheme = get_scheme(scheme_name)
+    if not isinstance(private_key, scheme.key_types):
+        raise ValueError(f"Key was wrapped with {scheme_name}, but the private key is {type(private_key).__name__}")
+    return scheme.unwrap(private_key, wrapped)
+
+def _wrap_batch(file_key, batch):
+    wrapped, failures = {}, {}
+    for username, pem in batch:
+        try:
+            wrapped[username] = wrap_file_key(public_key_cache.get(username, pem), file_key)
+        except Exception as e:
+            failures[username] = str(e)
+    return wrapped, failures
+
+def wrap_for_recipients(file_key: bytes, recipients: dict, workers: int = None,
+                        use_processes: bool = False):
+    """Wraps file_key for every {username: public_key_pem} in recipients,
+    using whichever scheme each recipient's key belongs to.
+
+    Returns (access, failures): access maps usernames to manifest access
+    entries, failures maps usernames to error messages.
+    """
+    items = list(recipients.items())
+    batches = [items[i:i + WRAP_BATCH] for i in range(0, len(items), WRAP_BATCH)]
+    workers = min(workers or DEFAULT_WORKERS, len(batches))
+    if workers <= 1:
+        results = [_wrap_batch(file_key, batch) for batch in batches]
+    else:
+        with _make_executor(workers, use_processes) as pool:
+            results = list(pool.map(_wrap_batch, [file_key] * len(batches), batches))
+
+    access, failures = {}, {}
+    for wrapped, failed in results:
+        access.update(wrapped)
+        failures.update(failed)
+    # Keep the recipients' order in the manifest.
+    return {username: access[username] for username, _ in items if username in access}, failures
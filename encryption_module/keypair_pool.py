@@ -0,0 +1,67 @@
+import queue
+import threading
+from encryption_module.key_wrap import SCHEME_RSA_OAEP, generate_keypair
+
+# Pre-generated keypairs, so registration does not wait on key generation.
+#
+# A daemon thread keeps up to `size` keypairs ready and refills the pool as
+# they are taken. If the pool is drained (e.g. during bulk provisioning) the
+# caller generates a keypair inline instead of waiting for the worker.
+# Only schemes with slow key generation are pooled; X25519 keys cost
+# microseconds and are always generated on demand.
+KEYPAIR_POOL_SIZE = 8
+POOLED_SCHEMES = (SCHEME_RSA_OAEP,)
+
+class KeypairPool:
+    def __init__(self, scheme, size=KEYPAIR_POOL_SIZE):
+        self.scheme = scheme
+        self.ready = queue.Queue(maxsize=size)
+        self.hits = 0
+        self.misses = 0
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._fill, daemon=True,
+                                                name=f"keypair-pool-{self.scheme}")
+                self._worker.start()
+        return self
+
+    def _fill(self):
+        while True:
+            # put() blocks while the pool is full, so taking a keypair is
+            # what triggers the next generation.
+            self.ready.put(generate_keypair(self.scheme))
+
+    def take(self):
+        """Returns (private_key, public_key), from the pool when one is ready."""
+        self.start()
+        try:
+            keypair = self.ready.get_nowait()
+            self.hits += 1
+            return keypair
+        except queue.Empty:
+            self.misses += 1
+            return generate_keypair(self.scheme)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_keypair_pool(scheme=SCHEME_RSA_OAEP):
+    with _pools_lock:
+        if scheme not in _pools:
+            _pools[scheme] = KeypairPool(scheme)
+        return _pools[scheme]
+
+def take_keypair(scheme):
+    """Keypair for a new user: pooled for slow schemes, inline otherwise."""
+    if scheme in POOLED_SCHEMES:
+        return get_keypair_pool(scheme).take()
+    return generate_keypair(scheme)
+
+def warm_up(scheme=SCHEME_RSA_OAEP):
+    """Starts filling the pool ahead of the first registration."""
+    if scheme in POOLED_SCHEMES:
+        get_keypair_pool(scheme).start()
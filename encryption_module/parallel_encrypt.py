@@ -0,0 +1,107 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from encryption_module.encrypt import (
+    STREAM_CHUNK_SIZE,
+    STREAM_HEADER_SIZE,
+    TAG_SIZE,
+    build_stream_header,
+    parse_stream_header,
+    is_chunked_stream,
+    encrypt_record,
+    decrypt_record,
+    decrypt_file,
+)
+
+# Records are independent (nonce = prefix || index), so segments of consecutive
+# records can be sealed/opened on any worker and written back in order.
+DEFAULT_WORKERS = os.cpu_count() or 1
+SEGMENT_RECORDS = 16  # records handed to a worker per task (1 MiB at 64 KiB chunks)
+
+def _encrypt_segment(key, header, first_index, data, chunk_size, is_last):
+    out = []
+    count = max(1, -(-len(data) // chunk_size))
+    for i in range(count):
+        chunk = data[i * chunk_size:(i + 1) * chunk_size]
+        final = is_last and i == count - 1
+        out.append(encrypt_record(key, header, first_index + i, chunk, final))
+    return b"".join(out)
+
+def _decrypt_segment(key, header, first_index, data, record_size, is_last):
+    if is_last and not data:
+        raise ValueError("Encrypted stream is truncated")
+    out = []
+    count = -(-len(data) // record_size)
+    for i in range(count):
+        record = data[i * record_size:(i + 1) * record_size]
+        final = is_last and i == count - 1
+        out.append(decrypt_record(key, header, first_index + i, record, final))
+    return b"".join(out)
+
+def _make_executor(workers, use_processes):
+    if use_processes:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crypto")
+
+def _run_ordered(f_in, f_out, segment_size, submit, workers):
+    """Reads segments with one-segment lookahead, keeps a bounded window of
+    tasks in flight and writes their results in submission order."""
+    pending = deque()
+    window = workers * 2
+    current = f_in.read(segment_size)
+    index = 0
+    while True:
+        following = f_in.read(segment_size)
+        is_last = not following
+        pending.append(submit(index, current, is_last))
+        index += 1
+        while len(pending) >= window or (is_last and pending):
+            f_out.write(pending.popleft().result())
+        if is_last:
+            return
+        current = following
+
+def encrypt_stream_parallel(f_in, f_out, key: bytes, workers: int = None,
+                            use_processes: bool = False, chunk_size: int = STREAM_CHUNK_SIZE,
+                            nonce_prefix: bytes = None) -> None:
+    """Parallel equivalent of encrypt_stream; produces the same container format."""
+    workers = workers or DEFAULT_WORKERS
+    header = build_stream_header(chunk_size, nonce_prefix)
+    f_out.write(header)
+    segment_size = chunk_size * SEGMENT_RECORDS
+    with _make_executor(workers, use_processes) as pool:
+        def submit(segment_no, data, is_last):
+            return pool.submit(_encrypt_segment, key, header, segment_no * SEGMENT_RECORDS,
+                               data, chunk_size, is_last)
+        _run_ordered(f_in, f_out, segment_size, submit, workers)
+
+def decrypt_stream_parallel(f_in, f_out, key: bytes, workers: int = None,
+                            use_processes: bool = False) -> None:
+    """Parallel equivalent of decrypt_stream for chunked-format input."""
+    workers = workers or DEFAULT_WORKERS
+    header = f_in.read(STREAM_HEADER_SIZE)
+    if len(header) < STREAM_HEADER_SIZE:
+        raise ValueError("Encrypted stream is truncated")
+    record_size = parse_stream_header(header) + TAG_SIZE
+    segment_size = record_size * SEGMENT_RECORDS
+    with _make_executor(workers, use_processes) as pool:
+        def submit(segment_no, data, is_last):
+            return pool.submit(_decrypt_segment, key, header, segment_no * SEGMENT_RECORDS,
+                               data, record_size, is_last)
+        _run_ordered(f_in, f_out, segment_size, submit, workers)
+
+def encrypt_file_parallel(input_path: str, output_path: str, key: bytes,
+                          workers: int = None, use_processes: bool = False) -> None:
+    with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        encrypt_stream_parallel(f_in, f_out, key, workers, use_processes)
+
+def decrypt_file_parallel(input_path: str, output_path: str, key: bytes,
+                          workers: int = None, use_processes: bool = False) -> None:
+    with open(input_path, 'rb') as f_in:
+        chunked = is_chunked_stream(f_in.read(STREAM_HEADER_SIZE))
+    if not chunked:
+        # Legacy CBC blobs are inherently sequential.
+        decrypt_file(input_path, output_path, key)
+        return
+    with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        decrypt_stream_parallel(f_in, f_out, key, workers, use_processes)
@@ -0,0 +1,218 @@
+import os
+import hashlib
+import threading
+from file_sharing_module.manifest_store import get_manifest_store
+from encryption_module.encrypt import NONCE_PREFIX_SIZE
+from file_sharing_module.merkle import LEAF_SIZE, hash_leaves, load_leaves, merkle_root, save_leaves
+from file_sharing_module.pipeline import hash_and_encrypt_file
+
+# Content-addressed storage for shared ciphertext.
+#
+# Encrypted files live under shared/blobs/<aa>/<sha256 of plaintext>[.codec]
+# instead of shared/<basename>, so two files with the same name no longer
+# overwrite each other and the same content shared under many names is
+# stored once. The codec suffix marks compressed content, whose ciphertext
+# differs from the uncompressed one. Manifest entries name their blob
+# ("blob": <blob id>) and act as its reference count: ManifestStore.remove() reports when the last entry
+# for a hash is gone, and its blobs are deleted in the same transaction.
+# Each blob has a <blob>.merkle sidecar with its Merkle leaf hashes; the
+# root goes into the manifest entry ("merkle").
+#
+# Dedup needs every share of the same content to use the same file key, so
+# keys are convergent: SHA-256 over a domain-separation prefix plus the
+# plaintext. This differs from the public content hash in the manifest, so
+# the key can only be derived by someone who already has the file (the
+# usual convergent-encryption caveat: they can confirm that guess).
+# The container's nonce prefix is derived from the key and the compression
+# settings too, so encrypting the same content again yields byte-identical
+# ciphertext: concurrent writers, or a blob restored after GC, never change
+# a blob whose Merkle root is already recorded. A key only ever encrypts
+# one plaintext (its compressed form differs per codec and level, which
+# the derivation includes), so the fixed nonces are never reused.
+#
+# Dedup is per whole file. The chunked container has one key and a random
+# nonce prefix per file, so equal chunks inside different files encrypt
+# differently; chunk-level dedup would need per-chunk keys and a new
+# container format.
+BLOB_DIR = os.path.join(os.path.dirname(__file__), "../shared/blobs")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "../shared")
+CONVERGENT_KEY_DOMAIN = b"p2p-convergent-file-key/v1\x00"
+CONVERGENT_NONCE_DOMAIN = b"p2p-convergent-nonce-prefix/v1\x00"
+HASH_READ_SIZE = 1024 * 1024
+
+def blob_id(hash_value, compression=None):
+    return f"{hash_value}.{compression['codec']}" if compression else hash_value
+
+def content_hash_and_key(filepath, sample_size=0):
+    """Returns (sha256 hex of the plaintext, convergent AES key) in one read.
+    With sample_size, the file's first sample_size bytes are returned as a
+    third item so callers need not open the file again for them."""
+    content = hashlib.sha256()
+    key = hashlib.sha256(CONVERGENT_KEY_DOMAIN)
+    sample = b""
+    with open(filepath, "rb") as f:
+        while chunk := f.read(HASH_READ_SIZE):
+            if len(sample) < sample_size:
+                sample += chunk[:sample_size - len(sample)]
+            content.update(chunk)
+            key.update(chunk)
+    if sample_size:
+        return content.hexdigest(), key.digest(), sample
+    return content.hexdigest(), key.digest()
+
+def convergent_nonce_prefix(key, compression=None):
+    """Nonce prefix for content encrypted under its convergent key."""
+    codec = f"{compression['codec']}-{compression['level']}" if compression else "none"
+    return hashlib.sha256(CONVERGENT_NONCE_DOMAIN + key + codec.encode()).digest()[:NONCE_PREFIX_SIZE]
+
+class BlobStore:
+    def __init__(self, root=BLOB_DIR, manifest=None):
+        self.root = root
+        # An empty ManifestStore is falsy (__len__), so test for None explicitly.
+        self.manifest = manifest if manifest is not None else get_manifest_store()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, blob):
+        return os.path.join(self.root, blob[:2], blob)
+
+    def exists(self, blob):
+        return os.path.exists(self.path(blob))
+
+    def put(self, filepath, hash_value, key, workers=None, compression=None):
+        """Encrypts (and optionally compresses) filepath into its blob unless
+        it is already stored. Returns True if the content was new.
+
+        New content is read a second time here: the convergent key depends
+        on the whole plaintext, so encryption cannot start during the hash
+        pass. Content that is already stored is not read again."""
+        blob_path = self.path(blob_id(hash_value, compression))
+        if os.path.exists(blob_path):
+            return False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            plain_hash = hash_and_encrypt_file(filepath, tmp_path, key, workers=workers,
+                                               compression=compression,
+                                               nonce_prefix=convergent_nonce_prefix(key, compression))
+            if plain_hash != hash_value:
+                raise ValueError(f"{filepath} changed while it was being shared")
+            # Concurrent writers of the same content produce the same bytes,
+            # so whichever replace lands last changes nothing.
+            os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def add(self, filepath, entry, key, workers=None):
+        """Stores filepath's content and records entry (with its "hash" and
+        "compression") in the manifest. Returns (entry_id, stored) where
+        stored is False if the content was deduplicated against an
+        existing blob."""
+        hash_value, compression = entry["hash"], entry.get("compression")
+        entry["blob"] = blob_id(hash_value, compression)
+        stored = self.put(filepath, hash_value, key, workers, compression)
+        entry["merkle"] = self.merkle_info(entry["blob"], workers)
+        entry_id = self.manifest.add(entry)
+        # A concurrent unshare may have dropped the last reference (and the
+        # blob) between put() and add(); now that entry holds a reference,
+        # restoring the blob is safe. Re-encryption is deterministic, so
+        # the restored blob matches every recorded Merkle root.
+        if not self.exists(entry["blob"]):
+            stored = self.put(filepath, hash_value, key, workers, compression)
+            entry["merkle"] = self.merkle_info(entry["blob"], workers)
+            self.manifest.update(entry_id, entry)
+        return entry_id, stored
+
+    def tree(self, blob, workers=None):
+        """Returns (leaf_size, leaves) for a blob, hashing it (in parallel)
+        and writing the sidecar the first time."""
+        sidecar_path = self.path(blob) + ".merkle"
+        blob_mtime = os.path.getmtime(self.path(blob))
+        cached = load_leaves(sidecar_path)
+        if cached is not None and os.path.getmtime(sidecar_path) >= blob_mtime:
+            return cached
+        leaves = hash_leaves(self.path(blob), LEAF_SIZE, workers)
+        save_leaves(sidecar_path, leaves, LEAF_SIZE)
+        return LEAF_SIZE, leaves
+
+    def merkle_info(self, blob, workers=None):
+        leaf_size, leaves = self.tree(blob, workers)
+        return {"root": merkle_root(leaves).hex(), "leaf_size": leaf_size}
+
+    def delete(self, hash_value):
+        """Deletes every stored variant of some content."""
+        prefix_dir = os.path.join(self.root, hash_value[:2])
+        deleted = False
+        try:
+            names = os.listdir(prefix_dir)
+        except FileNotFoundError:
+            return False
+        for name in names:
+            if name.split(".")[0] == hash_value and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(prefix_dir, name))
+                    deleted = True
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+    def release(self, entry_id):
+        """Removes a manifest entry and garbage-collects its blob if that
+        was the last reference. Returns (removed, collected)."""
+        collected = []
+        removed = self.manifest.remove(entry_id, on_orphaned=lambda h: collected.append(self.delete(h)))
+        return removed, any(collected)
+
+    def resolve(self, filename):
+        """Path of the ciphertext served for filename, or None. Names are
+        looked up in the manifest; files shared before the blob store
+        existed are still found at shared/<filename>."""
+        entry = self.manifest.get(filename)
+        if entry and entry.get("blob"):
+            blob_path = self.path(entry["blob"])
+            if os.path.exists(blob_path):
+                return blob_path
+        legacy_path = os.path.join(SHARED_DIR, filename)
+        if os.path.basename(filename) == filename and os.path.isfile(legacy_path):
+            return legacy_path
+        return None
+
+    def gc(self):
+        """Deletes blobs no manifest entry references. Returns the count;
+        needed only after entries were removed outside release()."""
+        removed = 0
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.endswith(".tmp"):
+                    continue
+                if not self.manifest.count_by_hash(name.split(".")[0]):
+                    os.remove(os.path.join(prefix_dir, name))
+                    removed += 1
+        return removed
+
+    def get_stats(self):
+        blobs = 0
+        size = 0
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if os.path.isdir(prefix_dir):
+                for name in os.listdir(prefix_dir):
+                    if not name.endswith((".tmp", ".merkle")):
+                        blobs += 1
+                        size += os.path.getsize(os.path.join(prefix_dir, name))
+        return {"blobs": blobs, "bytes": size, "entries": len(self.manifest)}
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_blob_store():
+    """Process-wide blob store for shared/blobs."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = BlobStore()
+        return _default_store
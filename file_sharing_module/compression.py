@@ -0,0 +1,151 @@
+import zlib
+import lzma
+
+try:
+    import zstandard
+except ImportError:  # optional; the stdlib codecs are always available
+    zstandard = None
+
+# Optional compression stage of the share pipeline.
+#
+# Plaintext is compressed before encryption (ciphertext does not compress),
+# and only when a sample from the start of the file compresses well, so
+# media and archives are not recompressed for nothing. The codec and level
+# are recorded in the manifest entry as {"codec": ..., "level": ...} and
+# downloads decompress as the plaintext is decrypted. zlib is the default
+# because every peer can decode it; zstd is only usable between peers that
+# have the zstandard package installed.
+SAMPLE_SIZE = 256 * 1024
+MIN_COMPRESS_SIZE = 4096          # smaller files are not worth a codec header
+MAX_SAMPLE_RATIO = 0.85           # compress only if the sample shrinks below this
+DEFAULT_CODEC = "zlib"
+DEFAULT_LEVELS = {"zlib": 1, "lzma": 1, "zstd": 3}   # fastest levels win below ~1 Gb/s
+
+class _LzmaDecompressor:
+    def __init__(self):
+        self._d = lzma.LZMADecompressor()
+
+    def decompress(self, data):
+        return self._d.decompress(data)
+
+    def flush(self):
+        if not self._d.eof:
+            raise ValueError("Compressed stream is truncated")
+        return b""
+
+class _ZlibDecompressor:
+    def __init__(self):
+        self._d = zlib.decompressobj()
+
+    def decompress(self, data):
+        return self._d.decompress(data)
+
+    def flush(self):
+        out = self._d.flush()
+        if not self._d.eof:
+            raise ValueError("Compressed stream is truncated")
+        return out
+
+class _ZstdDecompressor:
+    def __init__(self):
+        self._d = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._d.decompress(data)
+
+    def flush(self):
+        return b""
+
+def available_codecs():
+    codecs = ["zlib", "lzma"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    return codecs
+
+def make_compressor(codec, level):
+    """Object with compress(data) and flush() for the given codec."""
+    if codec == "zlib":
+        return zlib.compressobj(level)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+def make_decompressor(codec):
+    if codec == "zlib":
+        return _ZlibDecompressor()
+    if codec == "lzma":
+        return _LzmaDecompressor()
+    if codec == "zstd" and zstandard is not None:
+        return _ZstdDecompressor()
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+def sample_ratio(sample: bytes) -> float:
+    """Compressed/original size of sample at a cheap zlib level."""
+    if not sample:
+        return 1.0
+    return len(zlib.compress(sample, 1)) / len(sample)
+
+def choose_compression(filepath, codec=DEFAULT_CODEC, level=None, sample=None):
+    """Returns {"codec", "level"} for filepath, or None if its first
+    SAMPLE_SIZE bytes show it is too small or does not compress. Pass
+    sample if those bytes were already read."""
+    if sample is None:
+        with open(filepath, "rb") as f:
+            sample = f.read(SAMPLE_SIZE)
+    sample = sample[:SAMPLE_SIZE]
+    if len(sample) < MIN_COMPRESS_SIZE or sample_ratio(sample) > MAX_SAMPLE_RATIO:
+        return None
+    if codec not in available_codecs():
+        codec = DEFAULT_CODEC
+    return {"codec": codec, "level": DEFAULT_LEVELS[codec] if level is None else level}
+
+class CompressingReader:
+    """File-object wrapper whose read() returns compressed data. Reads are
+    filled to the requested size until EOF, as the parallel encryptor
+    expects full segments."""
+
+    def __init__(self, f, codec, level):
+        self.f = f
+        self.compressor = make_compressor(codec, level)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self.f.read(size if size > 0 else SAMPLE_SIZE)
+            if data:
+                self.bytes_in += len(data)
+                self._buffer += self.compressor.compress(data)
+            else:
+                self._buffer += self.compressor.flush()
+                self._eof = True
+        if size < 0:
+            size = len(self._buffer)
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.bytes_out += len(out)
+        return out
+
+class DecompressingWriter:
+    """File-object wrapper that decompresses everything written through it
+    into f. close() checks the stream was complete; it does not close f."""
+
+    def __init__(self, f, codec):
+        self.f = f
+        self.decompressor = make_decompressor(codec)
+
+    def write(self, data):
+        try:
+            return self.f.write(self.decompressor.decompress(data))
+        except (zlib.error, lzma.LZMAError) as e:
+            raise ValueError(f"Decompression failed: {e}")
+
+    def close(self):
+        try:
+            self.f.write(self.decompressor.flush())
+        except (zlib.error, lzma.LZMAError) as e:
+            raise ValueError(f"Decompression failed: {e}")
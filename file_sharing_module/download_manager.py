@@ -0,0 +1,351 @@
+import os
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from file_sharing_module.fileTransfer import DOWNLOAD_DIR, DownloadStopped, resume_download
+from file_sharing_module.swarm import swarm_download
+from file_sharing_module.upload_scheduler import UploadBusy
+
+# Background download manager.
+#
+# Downloads are queued as jobs and run on a fixed number of worker threads,
+# so the CLI (or a script) gets control back immediately and many files can
+# be fetched at once. Single-peer jobs use the resumable range download, so
+# they report progress as data arrives, can be paused (the .part file is
+# kept and the job continues where it stopped) or cancelled mid-transfer,
+# and get the same Merkle / AEAD / final-hash checks as request_file. A
+# failed attempt is retried after an exponential backoff with jitter,
+# moving on to the job's next peer. A peer that answers BUSY (no free
+# upload slot) is retried after the delay it asks for; that does not count
+# as a failed attempt, up to BUSY_RETRIES times. Swarm jobs (several peers
+# at once) run swarm_download; they can only be paused or cancelled between
+# attempts.
+DEFAULT_CONCURRENT_DOWNLOADS = 4
+DOWNLOAD_ATTEMPTS = 4
+BUSY_RETRIES = 10
+BACKOFF_BASE = 1.0    # seconds before the first retry, doubled per attempt
+BACKOFF_MAX = 30.0
+
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class DownloadJob:
+    def __init__(self, job_id, filename, peers, swarm=False):
+        self.job_id = job_id
+        self.filename = filename
+        self.peers = list(peers)
+        self.swarm = swarm
+        self.state = QUEUED
+        self.attempts = 0
+        self.busy_retries = 0
+        self.done_bytes = 0
+        self.total_bytes = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stop_request = None      # PAUSED or CANCELLED while running
+        self._run_started = None
+        self._run_start_bytes = 0
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def progress(self):
+        if not self.total_bytes:
+            return 1.0 if self.state == DONE else 0.0
+        return self.done_bytes / self.total_bytes
+
+    @property
+    def bytes_per_s(self):
+        """Throughput of the current (or last) attempt."""
+        if self._run_started is None:
+            return 0.0
+        end = self.finished_at if self.finished else time.time()
+        elapsed = max(end - self._run_started, 1e-6)
+        return (self.done_bytes - self._run_start_bytes) / elapsed
+
+    def peer_for_attempt(self):
+        return self.peers[self.attempts % len(self.peers)]
+
+    def to_dict(self):
+        return {
+            "id": self.job_id,
+            "filename": self.filename,
+            "state": self.state,
+            "attempts": self.attempts,
+            "done_bytes": self.done_bytes,
+            "total_bytes": self.total_bytes,
+            "progress": self.progress,
+            "bytes_per_s": self.bytes_per_s,
+            "error": self.error,
+        }
+
+    def __str__(self):
+        size = f"{self.done_bytes}/{self.total_bytes}" if self.total_bytes is not None else f"{self.done_bytes}"
+        line = (f"#{self.job_id} {self.filename} [{self.state}] {self.progress * 100:5.1f}% "
+                f"{size} bytes, {self.bytes_per_s / 2**20:.2f} MiB/s")
+        if self.attempts:
+            line += f", attempt {self.attempts + (0 if self.finished else 1)}"
+        if self.error:
+            line += f" ({self.error})"
+        return line
+
+class DownloadManager:
+    def __init__(self, session, max_concurrent=DEFAULT_CONCURRENT_DOWNLOADS,
+                 max_attempts=DOWNLOAD_ATTEMPTS, workers=None):
+        self.session = session
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.workers = workers            # crypto workers per download
+        self.jobs = OrderedDict()         # {job_id: DownloadJob}
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.threads = []
+        self.running = True
+        self._next_id = 1
+
+    # -- submitting ------------------------------------------------------
+
+    def _start_workers(self):
+        while len(self.threads) < self.max_concurrent:
+            t = threading.Thread(target=self._worker, daemon=True, name=f"download-{len(self.threads)}")
+            self.threads.append(t)
+            t.start()
+
+    def submit(self, filename, peers, swarm=False):
+        """Queues filename from peers ([(ip, port), ...]). Returns the job;
+        an unfinished job for the same file is returned instead of a new
+        one, since both would write the same .part file."""
+        if not peers:
+            raise ValueError("A download needs at least one peer")
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("The download manager is closed")
+            for job in self.jobs.values():
+                if job.filename == filename and not job.finished:
+                    return job
+            job = DownloadJob(self._next_id, filename, peers, swarm)
+            self._next_id += 1
+            self.jobs[job.job_id] = job
+            self.queue.append(job)
+            self._start_workers()
+            self.cond.notify_all()
+            return job
+
+    def submit_batch(self, filenames, peers, swarm=False):
+        """Queues many files from the same peers. Each job starts at a
+        different peer so the batch is spread over all of them."""
+        peers = list(peers)
+        jobs = []
+        for i, filename in enumerate(filenames):
+            rotated = peers if swarm else peers[i % len(peers):] + peers[:i % len(peers)]
+            jobs.append(self.submit(filename, rotated, swarm))
+        return jobs
+
+    def wait(self, jobs=None, timeout=None):
+        """Blocks until the given jobs (default: all) finish, or until the
+        manager is closed and none of them is running any more. Returns True
+        if they all finished within timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                selected = list(jobs or self.jobs.values())
+                pending = [job for job in selected if not job.finished and (self.running or job.state == RUNNING)]
+                if not pending:
+                    return all(job.finished for job in selected)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+
+    # -- control ---------------------------------------------------------
+
+    def get_job(self, job_id):
+        with self.cond:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.cond:
+            return list(self.jobs.values())
+
+    def pause(self, job_id):
+        """Pauses a queued or running job; its .part file is kept."""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished or job.state == PAUSED:
+                return False
+            if job.state == RUNNING:
+                job.stop_request = PAUSED
+            else:
+                job.state = PAUSED
+            return True
+
+    def resume(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or not self.running:
+                return False
+            if job.state == RUNNING and job.stop_request == PAUSED:
+                job.stop_request = None
+                return True
+            if job.state != PAUSED:
+                return False
+            job.state = QUEUED
+            self.queue.append(job)
+            self.cond.notify_all()
+            return True
+
+    def cancel(self, job_id):
+        """Cancels a job and deletes its partial download."""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            if job.state == RUNNING:
+                job.stop_request = CANCELLED
+                return True
+            self._discard_partial(job)
+            self._finish(job, CANCELLED)
+        return True
+
+    def get_stats(self):
+        with self.cond:
+            jobs = list(self.jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return {
+            "jobs": len(jobs),
+            "states": counts,
+            "queued": len(self.queue),
+            "active": counts.get(RUNNING, 0),
+            "max_concurrent": self.max_concurrent,
+            "bytes_per_s": sum(job.bytes_per_s for job in jobs if job.state == RUNNING),
+        }
+
+    def close(self):
+        """Stops the workers. Every unfinished job ends up paused (their
+        .part files stay resumable): queued and retrying jobs right away,
+        running ones as soon as their current attempt stops, so wait()
+        returns."""
+        with self.cond:
+            self.running = False
+            self.queue.clear()
+            for job in self.jobs.values():
+                if job.state == RUNNING:
+                    job.stop_request = PAUSED
+                elif job.state in (QUEUED, RETRYING):
+                    job.state = PAUSED
+            self.cond.notify_all()
+
+    # -- workers ---------------------------------------------------------
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished_at = time.time()
+        self.cond.notify_all()
+
+    def _discard_partial(self, job):
+        part_path = os.path.join(DOWNLOAD_DIR, f"{job.filename}.part")
+        # Runs before the job is marked cancelled, so wait() never returns
+        # while the old .part file is still there for a new download to reuse.
+        for path in (part_path, part_path + ".json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _requeue(self, job):
+        with self.cond:
+            if not self.running or job.state != RETRYING:
+                return    # closed, paused or cancelled while waiting
+            job.state = QUEUED
+            self.queue.append(job)
+            self.cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                job = self.queue.popleft()
+                if job.state != QUEUED:
+                    continue    # paused or cancelled while queued
+                job.state = RUNNING
+                job.stop_request = None
+                job.started_at = job.started_at or time.time()
+                job._run_started = time.time()
+                job._run_start_bytes = job.done_bytes
+            self._run(job)
+
+    def _run(self, job):
+        def on_progress(done, total):
+            job.done_bytes, job.total_bytes = done, total
+
+        def should_stop():
+            return job.stop_request is not None
+
+        try:
+            if job.swarm:
+                ok = swarm_download(job.peers, job.filename, self.session, self.workers)
+            else:
+                ip, port = job.peer_for_attempt()
+                ok = resume_download(ip, port, job.filename, self.session, self.workers, max_attempts=1,
+                                     on_progress=on_progress, should_stop=should_stop)
+            error = None if ok else "download or verification failed"
+            busy = None
+        except DownloadStopped:
+            ok, error, busy = False, None, None
+        except UploadBusy as e:
+            ok, error, busy = False, str(e), e
+        except Exception as e:
+            ok, error, busy = False, str(e), None
+
+        with self.cond:
+            stop = job.stop_request
+            job.stop_request = None
+            if ok:
+                if job.total_bytes is not None:
+                    job.done_bytes = job.total_bytes
+                self._finish(job, DONE)
+                return
+            if stop == CANCELLED:
+                self._discard_partial(job)
+                self._finish(job, CANCELLED)
+            elif stop == PAUSED:
+                job.state = PAUSED
+                self.cond.notify_all()
+                return
+            else:
+                job.attempts += 1
+                if busy is not None:
+                    job.busy_retries += 1
+                failures = job.attempts - job.busy_retries
+                if failures >= self.max_attempts or job.busy_retries > BUSY_RETRIES:
+                    self._finish(job, FAILED, error)
+                    print(f"[!] Download of {job.filename} failed after {job.attempts} attempts: {error}")
+                    return
+                job.state = RETRYING
+                job.error = error
+                if busy is not None:
+                    # Never earlier than the peer asked, so busy seeders are not hammered.
+                    delay = busy.retry_after * (1 + random.random() / 2)
+                else:
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+                    delay *= 0.5 + random.random() / 2
+                timer = threading.Timer(delay, self._requeue, (job,))
+                timer.daemon = True
+                timer.start()
@@ -1,110 +1,506 @@
 import os
-import socket
-import base64
-from encryption_module.encrypt import decrypt_file
-from file_sharing_module.share_manager import load_manifest, compute_file_hash
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes
+import time
+import hashlib
+import json
+from file_sharing_module.blob_store import get_blob_store
+from file_sharing_module.manifest_store import get_manifest_store
+from file_sharing_module.merkle import (
+    MerkleVerifyingReader,
+    decode_leaves_reply,
+    encode_leaves_reply,
+    verify_file_range,
+)
+from file_sharing_module.pipeline import decrypt_and_hash_stream
+from file_sharing_module.upload_engine import timed_upload
+from file_sharing_module.upload_scheduler import UploadBusy, encode_busy, get_upload_scheduler, parse_busy
+from P2P_connection_module.connection_pool import get_pool
+from encryption_module.key_wrap import parse_access_entry, unwrap_file_key as unwrap_with_private_key
 
 SHARED_DIR = os.path.join(os.path.dirname(__file__), "../shared")
 DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "../downloads")
 BUFFER_SIZE = 4096
+RANGE_SEGMENT_SIZE = 4 * 1024 * 1024  # unit of work and of resume bookkeeping
+RANGE_READ_SIZE = 256 * 1024
+RESUME_ATTEMPTS = 3
 
 # Ensure the directories exist
 os.makedirs(SHARED_DIR, exist_ok=True)
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-def send_file(filename, conn):
-    filepath = os.path.join(SHARED_DIR, filename)
+def acquire_upload_slot(filename, conn, peer, nbytes):
+    """Waits for an upload slot for nbytes to peer. If the upload queue is
+    full, replies BUSY|<seconds> and returns None."""
+    try:
+        return get_upload_scheduler().acquire(peer, nbytes)
+    except UploadBusy as e:
+        conn.sendall(encode_busy(e.retry_after))
+        print(f"[!] Upload queue full; asked {peer} to retry {filename} in {e.retry_after:.1f}s")
+        return None
+
+def send_file(filename, conn, zero_copy=True, peer=None):
+    # Shared names resolve to their content-addressed blob.
+    filepath = get_blob_store().resolve(filename)
     print(f"[DEBUG] Opening file at path: {filepath}")
 
-    if not os.path.exists(filepath):
-        conn.send(b"FILE_NOT_FOUND")
+    if filepath is None:
+        conn.sendall(b"FILE_NOT_FOUND")
         print(f"[!] Requested file not found: {filename}")
         conn.close()
         return
 
-    conn.send(b"FILE_FOUND")
-    print(f"[+] Sending file: {filename}")
+    slot = acquire_upload_slot(filename, conn, peer, os.path.getsize(filepath))
+    if slot is None:
+        conn.close()
+        return
 
     try:
+        conn.sendall(b"FILE_FOUND")
+        print(f"[+] Sending file: {filename}")
+        # The stored ciphertext is sent unchanged, so it can go out zero-copy.
         with open(filepath, "rb") as f:
-            while chunk := f.read(BUFFER_SIZE):
-                conn.send(chunk)
-        print(f"[+] File sent successfully: {filename}")
+            stat = timed_upload(filename, conn, f, zero_copy=zero_copy, throttle=slot.throttle)
+        print(f"[+] File sent successfully: {filename} "
+              f"({stat['mib_per_s']:.1f} MiB/s via {stat['method']})")
     except Exception as e:
         print(f"[!] Error sending file {filename}: {e}")
     finally:
+        slot.release()
         conn.close()
 
-def handle_incoming_file_request(filename, conn):
+def file_holdings(filename):
+    """Returns (path, total_size, held_ranges) for a file this peer can serve,
+    either a full shared copy or a partially downloaded .part file."""
+    shared_path = get_blob_store().resolve(filename)
+    if shared_path is not None:
+        size = os.path.getsize(shared_path)
+        return shared_path, size, [[0, size]]
+
+    part_path = os.path.join(DOWNLOAD_DIR, f"{filename}.part")
+    state_path = part_path + ".json"
+    if os.path.exists(part_path) and os.path.exists(state_path):
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+            return part_path, state["size"], merge_ranges(state["done"])
+        except (OSError, ValueError, KeyError):
+            pass
+    return None
+
+def send_file_range(filename, conn, offset, length, zero_copy=True, peer=None):
+    """Serves GET_RANGE: replies RANGE_OK|offset|length|total\\n followed by
+    the bytes, or BUSY|<seconds>\\n if no upload slot is free. A length of 0
+    only reports the total size and needs no slot."""
+    try:
+        holdings = file_holdings(filename)
+        if holdings is None:
+            conn.sendall(b"FILE_NOT_FOUND")
+            print(f"[!] Requested file not found: {filename}")
+            return
+
+        filepath, total, held = holdings
+        if offset < 0 or length < 0 or offset > total:
+            conn.sendall(b"RANGE_INVALID\n")
+            return
+        length = min(length, total - offset)
+        if length and not any(start <= offset and offset + length <= end for start, end in held):
+            conn.sendall(b"RANGE_INVALID\n")
+            return
+        if not length:
+            conn.sendall(f"RANGE_OK|{offset}|0|{total}\n".encode())
+            return
+        slot = acquire_upload_slot(filename, conn, peer, length)
+        if slot is None:
+            return
+        with slot:
+            conn.sendall(f"RANGE_OK|{offset}|{length}|{total}\n".encode())
+            with open(filepath, "rb") as f:
+                timed_upload(filename, conn, f, offset, length, zero_copy=zero_copy, throttle=slot.throttle)
+    except ConnectionAbortedError:
+        pass  # requester cancelled (e.g. another peer delivered the chunk first)
+    except Exception as e:
+        print(f"[!] Error sending range of {filename}: {e}")
+    finally:
+        conn.close()
+
+def send_holdings(filename, conn):
+    """Serves HAVE: replies HAVE|total|start-end,start-end\\n listing the byte
+    ranges of filename this peer can serve."""
+    try:
+        holdings = file_holdings(filename)
+        if holdings is None:
+            conn.sendall(b"FILE_NOT_FOUND")
+            return
+        _, total, held = holdings
+        ranges = ",".join(f"{start}-{end}" for start, end in held)
+        conn.sendall(f"HAVE|{total}|{ranges}\n".encode())
+    except Exception as e:
+        print(f"[!] Error reporting holdings of {filename}: {e}")
+    finally:
+        conn.close()
+
+def merkle_leaves(filename):
+    """Returns (leaf_size, leaves) for a name this peer stores as a blob,
+    or None."""
+    entry = get_manifest_store().get(filename)
+    blobs = get_blob_store()
+    if not entry or not entry.get("blob") or not blobs.exists(entry["blob"]):
+        return None
+    return blobs.tree(entry["blob"])
+
+def send_merkle(filename, conn):
+    """Serves MERKLE: replies MERKLE|leaf_size|count\n followed by the raw
+    32-byte leaf hashes of filename's stored ciphertext."""
+    try:
+        tree = merkle_leaves(filename)
+        if tree is None:
+            conn.sendall(b"FILE_NOT_FOUND")
+            return
+        conn.sendall(encode_leaves_reply(*tree))
+    except Exception as e:
+        print(f"[!] Error sending Merkle leaves of {filename}: {e}")
+    finally:
+        conn.close()
+
+def fetch_merkle_leaves(peer_ip, port, filename, entry, conn=None):
+    """Fetches a peer's leaf hashes for filename and checks them against
+    the manifest root. Returns the leaves, or None if the entry has no
+    Merkle root; raises ValueError if the peer's leaves do not match."""
+    if not entry or not entry.get("merkle"):
+        return None
+    if conn is None:
+        with get_pool().connection((peer_ip, port)) as conn:
+            return fetch_merkle_leaves(peer_ip, port, filename, entry, conn)
+    reply = conn.call(f"MERKLE|{filename}")
+    if not reply.startswith(b"MERKLE|"):
+        print(f"[!] Peer has no chunk hashes for {filename}; it will only be verified once complete.")
+        return None
+    return decode_leaves_reply(reply, entry["merkle"])
+
+def handle_incoming_range_request(filename, offset, length, conn, peer=None):
+    try:
+        send_file_range(filename, conn, offset, length, peer=peer)
+    except Exception as e:
+        print(f"[!] Failed to handle range request: {e}")
+        conn.close()
+
+def handle_incoming_have_request(filename, conn):
+    try:
+        send_holdings(filename, conn)
+    except Exception as e:
+        print(f"[!] Failed to handle holdings request: {e}")
+        conn.close()
+
+def handle_incoming_merkle_request(filename, conn):
+    try:
+        send_merkle(filename, conn)
+    except Exception as e:
+        print(f"[!] Failed to handle Merkle request: {e}")
+        conn.close()
+
+def handle_incoming_file_request(filename, conn, peer=None):
     try:
         print(f"[DEBUG] Preparing to send file: {filename}")
-        send_file(filename, conn)
+        send_file(filename, conn, peer=peer)
     except Exception as e:
         print(f"[!] Failed to handle file request: {e}")
         conn.close()
 
-def request_file(peer_ip, port, filename, session):
-    save_path = os.path.join(DOWNLOAD_DIR, filename)
+def unwrap_file_key(entry, session):
+    """Returns the file key for session from a manifest entry, or None.
+    Keys unwrapped earlier in the session are served from its cache."""
+    if session.username not in entry["access"]:
+        print("[!] You are not authorized to decrypt this file.")
+        return None
+
+    access_value = entry["access"][session.username]
     try:
-        s = socket.socket()
-        s.connect((peer_ip, port))
-        s.send(f"GET_FILE|{filename}".encode())
+        scheme, wrapped = parse_access_entry(access_value)
+    except (KeyError, ValueError, TypeError) as e:
+        print(f"[!] Malformed access entry: {e}")
+        return None
+    wrapped_digest = hashlib.sha256(scheme.encode() + wrapped).digest()
+    file_key = session.get_file_key(entry["hash"], wrapped_digest)
+    if file_key is not None:
+        return file_key
 
-        status = s.recv(BUFFER_SIZE)
-        if status == b"FILE_NOT_FOUND":
-            print(f"[-] Peer does not have the file: {filename}")
-            s.close()
-            return
+    try:
+        file_key = unwrap_with_private_key(session.private_key, access_value)
+    except Exception as e:
+        print(f"[!] Failed to decrypt file key: {e}")
+        return None
+    session.cache_file_key(entry["hash"], wrapped_digest, file_key)
+    return file_key
 
-        print(f"[+] Receiving file: {filename}")
-        with open(save_path, "wb") as f:
-            while True:
-                data = s.recv(BUFFER_SIZE)
-                if not data:
-                    break
-                f.write(data)
+def resolve_file_key(filename, session):
+    """Looks up filename in the manifest and unwraps its file key for session.
+    Returns (entry, file_key); either may be None."""
+    entry = get_manifest_store().get(filename)
+    file_key = None
+    if entry and entry.get("encrypted") and "access" in entry:
+        file_key = unwrap_file_key(entry, session)
+    else:
+        print("[!] No decryption metadata found for this file.")
+    return entry, file_key
 
-        print(f"[+] File received and saved to: {save_path}")
+def receive_range(reader, f_out, on_data=None):
+    """Reads a RANGE_OK reply from reader into f_out. Returns
+    (bytes_received, total_size)."""
+    header = reader.readline(256).decode().strip()
+    if header.startswith("BUSY|"):
+        raise parse_busy(header)
+    if not header.startswith("RANGE_OK"):
+        raise FileNotFoundError(f"Peer rejected range request: {header or 'no response'}")
+    _, got_offset, got_length, total = header.split("|")
+    got_offset, got_length, total = int(got_offset), int(got_length), int(total)
+
+    received = 0
+    f_out.seek(got_offset)
+    while received < got_length:
+        data = reader.read(min(RANGE_READ_SIZE, got_length - received))
+        if not data:
+            raise ConnectionError(f"Connection closed after {received} of {got_length} bytes")
+        f_out.write(data)
+        if on_data:
+            on_data(got_offset + received, len(data))
+        received += len(data)
+    return received, total
+
+def request_range(peer_ip, port, filename, offset, length, f_out, on_data=None, conn=None):
+    """Fetches [offset, offset+length) of a peer's shared file into f_out at
+    the same offset. Returns (bytes_received, total_size); raises on errors.
+    on_data(offset, nbytes) is called after each write, so callers can
+    checkpoint partial progress if the connection drops. If conn (a
+    FramedConnection) is given, the request is multiplexed over it;
+    otherwise a connection is checked out of the pool."""
+    command = f"GET_RANGE|{filename}|{offset}|{length}"
+    if conn is None:
+        with get_pool().connection((peer_ip, port)) as conn:
+            return request_range(peer_ip, port, filename, offset, length, f_out, on_data, conn)
+    with conn.request(command) as reader:
+        return receive_range(reader, f_out, on_data)
+
+def probe_file_size(peer_ip, port, filename):
+    """Returns the size of a peer's shared file using a zero-length range."""
+    with open(os.devnull, "wb") as sink:
+        return request_range(peer_ip, port, filename, 0, 0, sink)[1]
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def missing_ranges(done, size, segment_size):
+    missing, cursor = [], 0
+    for start, end in merge_ranges(done) + [[size, size]]:
+        while cursor < start:
+            step = min(segment_size, start - cursor)
+            missing.append((cursor, step))
+            cursor += step
+        cursor = max(cursor, end)
+    return missing
+
+def load_download_state(state_path, size, expected_hash):
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+            if state.get("size") == size and state.get("hash") == expected_hash:
+                return state
+        except (OSError, ValueError):
+            pass
+    return {"size": size, "hash": expected_hash, "done": []}
+
+def save_download_state(state_path, state):
+    state["done"] = merge_ranges(state["done"])
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+class DownloadStopped(Exception):
+    """Raised out of resume_download when should_stop() asks it to stop;
+    the .part file keeps everything received so far."""
+
+def resume_download(peer_ip, port, filename, session, workers=None, max_attempts=RESUME_ATTEMPTS,
+                    on_progress=None, should_stop=None):
+    """Downloads the ciphertext into downloads/<name>.part in ranges, tracking
+    completed ranges in a .part.json sidecar. An interrupted download (in this
+    call or an earlier one) only refetches the missing ranges; the finished
+    file is decrypted and verified against the manifest hash.
+
+    on_progress(done_bytes, total_bytes) is called as data arrives; if
+    should_stop() returns True the transfer stops with DownloadStopped. A
+    peer that replies BUSY is retried after the delay it asks for; if the
+    last attempt was turned away, UploadBusy is raised so callers can try
+    another peer."""
+    entry, file_key = resolve_file_key(filename, session)
+
+    part_path = os.path.join(DOWNLOAD_DIR, f"{filename}.part")
+    state_path = part_path + ".json"
+    try:
+        size = probe_file_size(peer_ip, port, filename)
+    except Exception as e:
+        print(f"[!] Failed to download file from peer: {e}")
+        return False
+
+    try:
+        leaves = fetch_merkle_leaves(peer_ip, port, filename, entry)
+    except (OSError, ValueError) as e:
+        print(f"[!] Failed to download file from peer: {e}")
+        return False
 
-        # --- DECRYPTION & INTEGRITY VERIFICATION ---
-        manifest = load_manifest()
-        entry = next((item for item in manifest if item["filename"] == filename), None)
+    state = load_download_state(state_path, size, entry["hash"] if entry else None)
+    if not os.path.exists(part_path):
+        state["done"] = []
+    with open(part_path, "r+b" if os.path.exists(part_path) else "w+b") as f:
+        f.truncate(size)
 
-        if entry and entry.get("encrypted") and "access" in entry:
-            if session.username not in entry["access"]:
-                print("[!] You are not authorized to decrypt this file.")
-                return
+        def checkpoint(start, end):
+            # With chunk hashes, only verified leaves count as done; a bad
+            # leaf stays missing and is fetched again on the next attempt.
+            f.flush()
+            if leaves is not None:
+                (start, end), bad = verify_file_range(f, leaves, entry["merkle"]["leaf_size"], start, end, size)
+                if bad is not None:
+                    print(f"[!] Chunk {bad} of {filename} failed verification; refetching it")
+            if end > start:
+                state["done"].append([start, end])
+                save_download_state(state_path, state)
 
-            encrypted_file_key_b64 = entry["access"][session.username]
-            encrypted_file_key = base64.b64decode(encrypted_file_key_b64)
+        done_bytes = [sum(end - start for start, end in merge_ranges(state["done"]))]
+        if on_progress:
+            on_progress(done_bytes[0], size)
 
+        busy = None
+        for attempt in range(1, max_attempts + 1):
+            missing = missing_ranges(state["done"], size, RANGE_SEGMENT_SIZE)
+            if not missing:
+                break
+            if busy is not None:
+                time.sleep(busy.retry_after)
+                busy = None
+            print(f"[+] Fetching {len(missing)} missing range(s) of {filename} (attempt {attempt})")
             try:
-                file_key = session.private_key.decrypt(
-                    encrypted_file_key,
-                    padding.OAEP(
-                        mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                        algorithm=hashes.SHA256(),
-                        label=None
-                    )
-                )
+                for offset, length in missing:
+                    progress = [offset, offset]
+                    def on_data(at, nbytes, progress=progress):
+                        progress[1] = at + nbytes
+                        done_bytes[0] += nbytes
+                        if on_progress:
+                            on_progress(done_bytes[0], size)
+                        if should_stop and should_stop():
+                            raise DownloadStopped(filename)
+                    try:
+                        request_range(peer_ip, port, filename, offset, length, f, on_data)
+                    finally:
+                        if progress[1] > progress[0]:
+                            checkpoint(*progress)
+            except DownloadStopped:
+                raise
+            except UploadBusy as e:
+                busy = e
+                print(f"[!] {peer_ip}:{port} is busy (asked to retry in {e.retry_after:.1f}s)")
             except Exception as e:
-                print(f"[!] Failed to decrypt file key: {e}")
-                return
-
-            decrypted_path = os.path.join(DOWNLOAD_DIR, f"decrypted_{filename}")
-            decrypt_file(save_path, decrypted_path, file_key)
-            print(f"[+] File decrypted and saved to: {decrypted_path}")
-
-            downloaded_hash = compute_file_hash(decrypted_path)
-            if downloaded_hash == entry["hash"]:
-                print("[+] File integrity verified.")
-            else:
-                print("[!] WARNING: File integrity check failed.")
-        else:
-            print("[!] No decryption metadata found for this file.")
+                print(f"[!] Range transfer interrupted: {e}")
+        if missing_ranges(state["done"], size, RANGE_SEGMENT_SIZE):
+            if busy is not None:
+                raise busy
+            print(f"[!] Download incomplete; rerun to resume from {part_path}")
+            return False
+
+    if os.path.exists(state_path):    # never written when there was nothing to fetch
+        os.remove(state_path)
+    return finish_download(part_path, filename, entry, file_key, workers)
+
+def finish_download(part_path, filename, entry, file_key, workers=None):
+    """Turns a completely downloaded .part file into the final download:
+    decrypts and verifies it when a file key is available, otherwise moves
+    the raw file into place. The .part file is always consumed."""
+    if file_key is None:
+        save_path = os.path.join(DOWNLOAD_DIR, filename)
+        os.replace(part_path, save_path)
+        print(f"[+] File received and saved to: {save_path}")
+        return True
+
+    decrypted_path = os.path.join(DOWNLOAD_DIR, f"decrypted_{filename}")
+    try:
+        with open(part_path, "rb") as f_in, open(decrypted_path, "wb") as f_out:
+            downloaded_hash = decrypt_and_hash_stream(f_in, f_out, file_key, workers=workers,
+                                                      compression=entry.get("compression"))
+    except ValueError as e:
+        downloaded_hash = None
+        print(f"[!] Failed to decrypt file: {e}")
+        os.remove(decrypted_path)
+
+    # Either way the partial file is no longer useful: a verified file is
+    # done, a corrupt one has to be fetched again from scratch.
+    os.remove(part_path)
+    if downloaded_hash is None:
+        return False
+    print(f"[+] File decrypted and saved to: {decrypted_path}")
+    if downloaded_hash == entry["hash"]:
+        print("[+] File integrity verified.")
+        return True
+    print("[!] WARNING: File integrity check failed.")
+    return False
+
+def request_file(peer_ip, port, filename, session, workers=None, resume=False):
+    if resume:
+        return resume_download(peer_ip, port, filename, session, workers)
+
+    # Resolve the file key up front so the download can be decrypted and
+    # hashed while it is received, instead of re-reading it from disk.
+    entry, file_key = resolve_file_key(filename, session)
+
+    # Reuses a pooled connection to the peer, so pulling many small files
+    # does not pay a TCP handshake for each one. The chunk hashes come first
+    # so every chunk is checked as it arrives.
+    try:
+        with get_pool().connection((peer_ip, port)) as conn:
+            leaves = fetch_merkle_leaves(peer_ip, port, filename, entry, conn)
+            with conn.request(f"GET_FILE|{filename}") as reader:
+                _receive_file(reader, filename, entry, file_key, workers, leaves)
     except Exception as e:
         print(f"[!] Failed to download file from peer: {e}")
-    finally:
-        s.close()
+
+def _receive_file(reader, filename, entry, file_key, workers, leaves=None):
+    status = reader.read(len(b"FILE_FOUND"))
+    if status.startswith(b"BUSY|"):
+        raise parse_busy((status + reader.readline(64)).decode(errors="replace"))
+    if status != b"FILE_FOUND":
+        print(f"[-] Peer does not have the file: {filename}")
+        return
+
+    print(f"[+] Receiving file: {filename}")
+    if leaves is not None:
+        # Raises ValueError at the first corrupt chunk, aborting the transfer.
+        reader = MerkleVerifyingReader(reader, leaves, entry["merkle"]["leaf_size"])
+    if file_key is None:
+        save_path = os.path.join(DOWNLOAD_DIR, filename)
+        with open(save_path, "wb") as f:
+            while data := reader.read(BUFFER_SIZE):
+                f.write(data)
+        print(f"[+] File received and saved to: {save_path}")
+        return
+
+    # --- DECRYPTION & INTEGRITY VERIFICATION (while receiving) ---
+    decrypted_path = os.path.join(DOWNLOAD_DIR, f"decrypted_{filename}")
+    try:
+        with open(decrypted_path, "wb") as f:
+            downloaded_hash = decrypt_and_hash_stream(reader, f, file_key, workers=workers,
+                                                      compression=entry.get("compression"))
+    except ValueError:
+        # Re-raised so the pooled connection, whose response was abandoned
+        # mid-stream, is discarded rather than reused.
+        os.remove(decrypted_path)
+        raise
+    print(f"[+] File decrypted and saved to: {decrypted_path}")
+
+    if downloaded_hash == entry["hash"]:
+        print("[+] File integrity verified.")
+    else:
+        print("[!] WARNING: File integrity check failed.")
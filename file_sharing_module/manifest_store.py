@@ -0,0 +1,201 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Indexed manifest storage.
+#
+# Entries live in an embedded SQLite database (WAL mode) instead of a JSON
+# list that is parsed and rewritten on every change: sharing a file is one
+# INSERT, and lookups by filename, content hash or recipient use indexes.
+# SQLite's locking makes concurrent writers (threads or separate peer
+# processes on the same shared/ directory) safe. Each entry is stored as its
+# original JSON dict, so callers keep seeing the same shape as before.
+MANIFEST_DB = os.path.join(os.path.dirname(__file__), "../shared/shared_manifest.db")
+LEGACY_MANIFEST_FILE = os.path.join(os.path.dirname(__file__), "../shared/shared_manifest.json")
+BUSY_TIMEOUT_MS = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    hash TEXT,
+    shared_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_filename ON entries (filename);
+CREATE INDEX IF NOT EXISTS entries_by_hash ON entries (hash);
+CREATE TABLE IF NOT EXISTS access (
+    entry_id INTEGER NOT NULL REFERENCES entries (id) ON DELETE CASCADE,
+    recipient TEXT NOT NULL,
+    PRIMARY KEY (entry_id, recipient)
+);
+CREATE INDEX IF NOT EXISTS access_by_recipient ON access (recipient);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class ManifestStore:
+    """Manifest entries with indexed lookups. Thread-safe; one connection
+    per store guarded by a lock, plus SQLite locking across processes."""
+
+    def __init__(self, path=MANIFEST_DB, legacy_json=LEGACY_MANIFEST_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(_SCHEMA)
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_once(legacy_json)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes SQLite's write lock up front, so concurrent
+        # writers queue on the busy timeout instead of failing mid-transaction.
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def _import_once(self, json_path):
+        # The legacy JSON manifest is imported the first time a store is
+        # opened next to it; the JSON file itself is left untouched.
+        key = "imported:" + os.path.basename(json_path)
+        with open(json_path, "r") as f:
+            entries = json.load(f)
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return
+            for entry in entries:
+                self._insert(entry)
+            db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(len(entries))))
+        if entries:
+            print(f"[+] Imported {len(entries)} manifest entries from {json_path}")
+
+    def _insert(self, entry):
+        cur = self.db.execute(
+            "INSERT INTO entries (filename, hash, shared_at, data) VALUES (?, ?, ?, ?)",
+            (entry["filename"], entry.get("hash"), entry.get("shared_at"), json.dumps(entry)),
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO access (entry_id, recipient) VALUES (?, ?)",
+            [(cur.lastrowid, recipient) for recipient in entry.get("access", {})],
+        )
+        return cur.lastrowid
+
+    def add(self, entry):
+        """Appends an entry and returns its id."""
+        with self._transaction():
+            return self._insert(entry)
+
+    def import_json(self, json_path):
+        """Bulk-imports a legacy shared_manifest.json list; returns the count."""
+        with open(json_path, "r") as f:
+            entries = json.load(f)
+        with self._transaction():
+            for entry in entries:
+                self._insert(entry)
+        return len(entries)
+
+    def update(self, entry_id, entry):
+        """Replaces an entry in place (e.g. after granting access to more users)."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE entries SET filename = ?, hash = ?, shared_at = ?, data = ? WHERE id = ?",
+                (entry["filename"], entry.get("hash"), entry.get("shared_at"), json.dumps(entry), entry_id),
+            )
+            db.execute("DELETE FROM access WHERE entry_id = ?", (entry_id,))
+            db.executemany(
+                "INSERT INTO access (entry_id, recipient) VALUES (?, ?)",
+                [(entry_id, recipient) for recipient in entry.get("access", {})],
+            )
+
+    def remove(self, entry_id, on_orphaned=None):
+        """Deletes an entry. If it was the last entry for its content hash,
+        on_orphaned(hash) runs inside the same transaction, so no concurrent
+        add() can start referencing that content until it returns."""
+        with self._transaction() as db:
+            row = db.execute("SELECT hash FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return False
+            db.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            if on_orphaned and row[0] and not self._count_by_hash(row[0]):
+                on_orphaned(row[0])
+            return True
+
+    def _count_by_hash(self, hash_value):
+        return self.db.execute("SELECT COUNT(*) FROM entries WHERE hash = ?", (hash_value,)).fetchone()[0]
+
+    def count_by_hash(self, hash_value):
+        """Number of entries referencing some content (its reference count)."""
+        with self.lock:
+            return self._count_by_hash(hash_value)
+
+    def _rows(self, sql, params=()):
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [(entry_id, json.loads(data)) for entry_id, data in rows]
+
+    def get(self, filename):
+        """Returns the entry for filename, or None. If a name was shared more
+        than once, the newest entry wins, since it matches the file on disk."""
+        rows = self._rows("SELECT id, data FROM entries WHERE filename = ? ORDER BY id DESC LIMIT 1", (filename,))
+        return rows[0][1] if rows else None
+
+    def find_by_hash(self, hash_value):
+        return [entry for _, entry in self._rows("SELECT id, data FROM entries WHERE hash = ? ORDER BY id", (hash_value,))]
+
+    def shared_with(self, recipient):
+        """Entries whose file key is wrapped for recipient."""
+        return [entry for _, entry in self._rows(
+            "SELECT e.id, e.data FROM access a JOIN entries e ON e.id = a.entry_id "
+            "WHERE a.recipient = ? ORDER BY e.id", (recipient,))]
+
+    def items(self):
+        """All (id, entry) pairs in the order they were shared."""
+        return self._rows("SELECT id, data FROM entries ORDER BY id")
+
+    def all(self):
+        return [entry for _, entry in self.items()]
+
+    def replace_all(self, entries):
+        with self._transaction() as db:
+            db.execute("DELETE FROM entries")
+            for entry in entries:
+                self._insert(entry)
+
+    def export_json(self, json_path):
+        """Writes the manifest out in the legacy JSON list format."""
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.all(), f, indent=4)
+        os.replace(tmp_path, json_path)
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_manifest_store():
+    """Process-wide store for shared/shared_manifest.db."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ManifestStore()
+        return _default_store
@@ -0,0 +1,160 @@
+import os
+import struct
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from encryption_module.parallel_encrypt import DEFAULT_WORKERS
+
+# Merkle trees over stored (encrypted) files.
+#
+# The tree covers the bytes that actually travel between peers, so a
+# receiver can check every leaf as it arrives, before decrypting and
+# without the file key. Leaves are LEAF_SIZE slices of the file; leaf and
+# inner-node hashes are domain-separated (0x00 / 0x01 prefixes, as in RFC
+# 6962) and an odd node is promoted to the next level unchanged. The root
+# and leaf size are recorded in the manifest entry as "merkle"; the leaf
+# hashes are kept in a <file>.merkle sidecar and served to peers, who check
+# them against the manifest root before trusting any of them.
+LEAF_SIZE = 1024 * 1024
+DIGEST_SIZE = 32
+SIDECAR_HEADER = struct.Struct(">4sQ")  # magic, leaf size
+SIDECAR_MAGIC = b"MRKL"
+
+def leaf_hash(data) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes(data)).digest()
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_root(leaves) -> bytes:
+    if not leaves:
+        return leaf_hash(b"")
+    level = list(leaves)
+    while len(level) > 1:
+        paired = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+def _hash_leaf(fd, offset, size):
+    # os.pread and hashlib both release the GIL on large buffers, so leaves
+    # hash in parallel on a thread pool.
+    return leaf_hash(os.pread(fd, size, offset))
+
+def hash_leaves(path, leaf_size=LEAF_SIZE, workers=None):
+    """Leaf hashes of the file at path, computed on a thread pool."""
+    size = os.path.getsize(path)
+    offsets = range(0, size, leaf_size)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if len(offsets) <= 1:
+            return [_hash_leaf(fd, offset, leaf_size) for offset in offsets]
+        with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS, thread_name_prefix="merkle") as pool:
+            return list(pool.map(lambda offset: _hash_leaf(fd, offset, leaf_size), offsets))
+    finally:
+        os.close(fd)
+
+def save_leaves(sidecar_path, leaves, leaf_size=LEAF_SIZE):
+    tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, leaf_size) + b"".join(leaves))
+    os.replace(tmp_path, sidecar_path)
+
+def load_leaves(sidecar_path):
+    """Returns (leaf_size, leaves) from a sidecar, or None."""
+    try:
+        with open(sidecar_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    magic, leaf_size = SIDECAR_HEADER.unpack_from(data)
+    if magic != SIDECAR_MAGIC:
+        return None
+    return leaf_size, split_digests(data[SIDECAR_HEADER.size:])
+
+def split_digests(data):
+    if len(data) % DIGEST_SIZE:
+        raise ValueError("Truncated Merkle leaf list")
+    return [bytes(data[i:i + DIGEST_SIZE]) for i in range(0, len(data), DIGEST_SIZE)]
+
+def encode_leaves_reply(leaf_size, leaves) -> bytes:
+    """MERKLE reply: MERKLE|leaf_size|count\\n followed by the raw digests."""
+    return f"MERKLE|{leaf_size}|{len(leaves)}\n".encode() + b"".join(leaves)
+
+def decode_leaves_reply(reply, merkle):
+    """Parses a MERKLE reply and checks it against the manifest's
+    {"root", "leaf_size"}. Returns the leaves; raises ValueError."""
+    line, _, body = bytes(reply).partition(b"\n")
+    parts = line.decode(errors="replace").split("|")
+    if parts[0] != "MERKLE" or len(parts) != 3:
+        raise ValueError(f"Peer has no Merkle leaves: {line[:64]!r}")
+    leaf_size, count = int(parts[1]), int(parts[2])
+    leaves = split_digests(body)
+    if leaf_size != merkle["leaf_size"] or len(leaves) != count:
+        raise ValueError("Merkle leaf list does not match the manifest")
+    if merkle_root(leaves).hex() != merkle["root"]:
+        raise ValueError("Merkle leaves do not match the manifest root")
+    return leaves
+
+def leaf_count(size, leaf_size):
+    return -(-size // leaf_size)
+
+def verify_leaf(leaves, index, data):
+    if index >= len(leaves) or leaf_hash(data) != leaves[index]:
+        raise ValueError(f"Chunk {index} failed Merkle verification")
+
+def verify_file_range(f, leaves, leaf_size, start, end, size):
+    """Checks the leaves of an open file that [start, end) completes; the
+    bytes before start in the first leaf must already be in place. Returns
+    the verified byte range [a, b), stopping at the first bad leaf, and
+    the index of that leaf (or None)."""
+    first = start // leaf_size
+    last = leaf_count(end, leaf_size) if end >= size else end // leaf_size
+    verified_end = first * leaf_size
+    for index in range(first, last):
+        offset = index * leaf_size
+        f.seek(offset)
+        data = f.read(min(leaf_size, size - offset))
+        if index >= len(leaves) or leaf_hash(data) != leaves[index]:
+            return (first * leaf_size, verified_end), index
+        verified_end = offset + len(data)
+    return (first * leaf_size, verified_end), None
+
+class MerkleVerifyingReader:
+    """Wraps a stream of a whole stored file and raises ValueError as soon
+    as a leaf's bytes do not match, instead of after the full download."""
+
+    def __init__(self, f, leaves, leaf_size):
+        self.f = f
+        self.leaves = leaves
+        self.leaf_size = leaf_size
+        self.index = 0
+        self._leaf = hashlib.sha256(b"\x00")
+        self._filled = 0
+
+    def peek(self, size=1):
+        return self.f.peek(size)
+
+    def _finish_leaf(self):
+        if self.index >= len(self.leaves) or self._leaf.digest() != self.leaves[self.index]:
+            raise ValueError(f"Chunk {self.index} failed Merkle verification")
+        self.index += 1
+        self._leaf = hashlib.sha256(b"\x00")
+        self._filled = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.leaf_size - self._filled)
+            self._leaf.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == self.leaf_size:
+                self._finish_leaf()
+        if (not data and size != 0) or size is None or size < 0:
+            if self._filled:
+                self._finish_leaf()
+            if self.index != len(self.leaves):
+                raise ValueError("Stream ended before all Merkle leaves were received")
+        return data
@@ -0,0 +1,78 @@
+import hashlib
+from encryption_module.encrypt import (
+    STREAM_CHUNK_SIZE,
+    STREAM_HEADER_SIZE,
+    TAG_SIZE,
+    encrypt_stream,
+    decrypt_stream,
+    is_chunked_stream,
+)
+from encryption_module.parallel_encrypt import encrypt_stream_parallel, decrypt_stream_parallel
+from file_sharing_module.compression import CompressingReader, DecompressingWriter
+
+# Single-pass share/download stages: the plaintext is hashed as it flows
+# through encryption or decryption instead of being re-read from disk.
+
+class HashingReader:
+    """File-object wrapper that hashes everything read through it."""
+
+    def __init__(self, f, hasher=None):
+        self.f = f
+        self.hasher = hasher or hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.hasher.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+class HashingWriter:
+    """File-object wrapper that hashes everything written through it."""
+
+    def __init__(self, f, hasher=None):
+        self.f = f
+        self.hasher = hasher or hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.bytes_written += len(data)
+        return self.f.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+def hash_and_encrypt_file(input_path: str, output_path: str, key: bytes, workers=None,
+                          compression=None, nonce_prefix=None) -> str:
+    """Encrypts input_path to output_path in one read and returns the SHA-256
+    of the plaintext. compression ({"codec", "level"}) compresses the
+    plaintext before it is encrypted. nonce_prefix makes the output
+    deterministic (see encrypt_stream)."""
+    with open(input_path, 'rb') as f_in, open(output_path, 'wb') as f_out:
+        reader = HashingReader(f_in)
+        source = reader
+        if compression:
+            source = CompressingReader(reader, compression["codec"], compression["level"])
+        if workers:
+            encrypt_stream_parallel(source, f_out, key, workers=workers, nonce_prefix=nonce_prefix)
+        else:
+            encrypt_stream(source, f_out, key, nonce_prefix=nonce_prefix)
+    return reader.hexdigest()
+
+def decrypt_and_hash_stream(f_in, f_out, key: bytes, workers=None, compression=None) -> str:
+    """Decrypts a buffered stream (e.g. socket.makefile('rb')) into f_out while
+    hashing the plaintext. Returns the SHA-256 hex digest. compression is
+    the manifest entry's setting; the data is decompressed as it arrives."""
+    writer = HashingWriter(f_out)
+    sink = DecompressingWriter(writer, compression["codec"]) if compression else writer
+    if workers and hasattr(f_in, "peek") and is_chunked_stream(f_in.peek(STREAM_HEADER_SIZE)):
+        decrypt_stream_parallel(f_in, sink, key, workers=workers)
+    else:
+        decrypt_stream(f_in, sink, key, read_size=STREAM_CHUNK_SIZE + TAG_SIZE)
+    if compression:
+        sink.close()
+    return writer.hexdigest()
@@ -1,98 +1,86 @@
 import os
-import json
-import base64
 from datetime import datetime
 import hashlib
-from encryption_module.encrypt import encrypt_file, generate_key
+from encryption_module.key_wrap import wrap_for_recipients
+from file_sharing_module.blob_store import content_hash_and_key, get_blob_store
+from file_sharing_module.compression import SAMPLE_SIZE, choose_compression
+from file_sharing_module.manifest_store import get_manifest_store
+from user_management_module.user_directory import get_user_directory
 from user_management_module.session_manager import Session
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes
 
-MANIFEST_FILE = os.path.join(os.path.dirname(__file__), "../shared/shared_manifest.json")
 SHARED_DIR = os.path.join(os.path.dirname(__file__), "../shared")
-USER_DATA_FILE = os.path.join(os.path.dirname(__file__), "../user_management_module/userData.json")
 
 # Ensure shared directory exists
 os.makedirs(SHARED_DIR, exist_ok=True)
 
 def load_manifest():
-    if not os.path.exists(MANIFEST_FILE):
-        return []
-    with open(MANIFEST_FILE, "r") as f:
-        return json.load(f)
+    """Returns every manifest entry, oldest first. Prefer the indexed
+    lookups on get_manifest_store() over scanning this list."""
+    return get_manifest_store().all()
 
 def save_manifest(manifest):
-    with open(MANIFEST_FILE, "w") as f:
-        json.dump(manifest, f, indent=4)
+    get_manifest_store().replace_all(manifest)
 
 def compute_file_hash(filepath):
+    # Plain SHA-256 is sequential; large reads keep it off the syscall path.
+    # The parallel per-chunk hash is the Merkle root (file_sharing_module.merkle).
     sha256 = hashlib.sha256()
     with open(filepath, 'rb') as f:
-        while chunk := f.read(4096):
+        while chunk := f.read(1024 * 1024):
             sha256.update(chunk)
     return sha256.hexdigest()
 
 def load_users():
-    if not os.path.exists(USER_DATA_FILE):
-        return {}
-    with open(USER_DATA_FILE, 'r') as f:
-        return json.load(f)
+    return get_user_directory().all()
 
-def share_file(filepath, session: Session):
+def share_file(filepath, session: Session, workers=None, compress=True):
     if not os.path.exists(filepath):
         print("[!] File does not exist.")
         return
 
     filename = os.path.basename(filepath)
-    shared_path = os.path.join(SHARED_DIR, filename)
 
-    # Step 1: Compute hash before encryption (plaintext)
-    hash_value = compute_file_hash(filepath)
-
-    # Step 2: Generate random AES key and encrypt the file
-    file_key = generate_key()
-    encrypt_file(filepath, shared_path, file_key)
+    # Step 1-2: Hash the plaintext and derive its convergent AES key; the
+    # ciphertext is stored once per content under shared/blobs. The same
+    # pass keeps the sample that decides whether to compress.
+    hash_value, file_key, sample = content_hash_and_key(filepath, sample_size=SAMPLE_SIZE)
+    compression = choose_compression(filepath, sample=sample) if compress else None
 
     # Step 3: Choose recipients
-    users = load_users()
+    users = get_user_directory()
     print("Enter usernames to share this file with (comma-separated):")
-    print("Available users:", ", ".join(users.keys()))
+    print("Available users:", ", ".join(users.usernames()))
     recipients = input("Recipients: ").strip().split(",")
     recipients = [r.strip() for r in recipients if r.strip() in users]
 
-    # Step 4: Encrypt file_key for each recipient
-    access = {}
-    for recipient in recipients:
-        try:
-            pub_pem = users[recipient]["public_key"].encode()
-            public_key = serialization.load_pem_public_key(pub_pem)
-
-            encrypted_key = public_key.encrypt(
-                file_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
-            access[recipient] = base64.b64encode(encrypted_key).decode()
-        except Exception as e:
-            print(f"[!] Failed to encrypt file key for {recipient}: {e}")
-
-    # Step 5: Save to manifest
-    manifest = load_manifest()
+    # Step 4: Wrap file_key for each recipient (parsed keys are cached and
+    # large groups are wrapped on a worker pool)
+    public_keys = {r: users.get(r).get("public_key", "") for r in recipients}
+    access, failures = wrap_for_recipients(file_key, public_keys, workers=workers)
+    for recipient, error in failures.items():
+        print(f"[!] Failed to encrypt file key for {recipient}: {error}")
+
+    # Step 5: Store the blob and save the manifest entry that references
+    # it. Already shared content is not read again; new content takes a
+    # second pass to encrypt, as the key needed the whole file first
     entry = {
         "filename": filename,
         "original_name": filename,
         "encrypted": True,
         "shared_at": datetime.utcnow().isoformat() + "Z",
         "hash": hash_value,
-        "note": "Encrypted with AES, keys shared via RSA",
+        "compression": compression,
+        "note": "Encrypted with chunked AES-GCM under a convergent key, keys wrapped per recipient",
         "access": access
     }
-    manifest.append(entry)
-    save_manifest(manifest)
+    blobs = get_blob_store()
+    _, stored = blobs.add(filepath, entry, file_key, workers=workers)
+    if not stored:
+        print("[+] Identical content is already shared; reusing the stored copy.")
+    elif compression:
+        stored_size = os.path.getsize(blobs.path(entry["blob"]))
+        print(f"[+] Compressed with {compression['codec']}-{compression['level']}: "
+              f"{os.path.getsize(filepath)} -> {stored_size} bytes")
     print(f"[+] File shared securely with: {', '.join(access.keys()) if access else 'no one'}")
 
 def list_shared_files():
@@ -105,19 +93,28 @@ def list_shared_files():
         print(f"{idx + 1}. {entry['filename']} (shared at {entry['shared_at']})")
 
 def unshare_file():
-    manifest = load_manifest()
+    store = get_manifest_store()
+    manifest = store.items()
     if not manifest:
         print("[!] No files to unshare.")
         return
 
     print("\nShared Files:")
-    for idx, entry in enumerate(manifest):
+    for idx, (_, entry) in enumerate(manifest):
         print(f"{idx + 1}. {entry['filename']} (shared at {entry['shared_at']})")
 
     try:
         choice = int(input("Enter the number of the file to unshare: "))
         if 1 <= choice <= len(manifest):
-            entry = manifest.pop(choice - 1)
+            entry_id, entry = manifest[choice - 1]
+            if entry.get("blob"):
+                # The blob is deleted only when no other entry references it.
+                _, collected = get_blob_store().release(entry_id)
+                detail = "deleted" if collected else "kept for other shares of the same content"
+                print(f"[-] File '{entry['filename']}' has been unshared; stored copy {detail}.")
+                return
+
+            store.remove(entry_id)
             file_path = os.path.join(SHARED_DIR, entry["filename"])
 
             if os.path.exists(file_path):
@@ -125,8 +122,6 @@ def unshare_file():
                 print(f"[-] File '{entry['filename']}' has been unshared and deleted.")
             else:
                 print(f"[!] File '{entry['filename']}' not found in shared directory.")
-
-            save_manifest(manifest)
         else:
             print("[!] Invalid selection.")
     except ValueError:
@@ -0,0 +1,389 @@
+import os
+import threading
+import time
+from encryption_module.encrypt import (
+    STREAM_HEADER_SIZE,
+    TAG_SIZE,
+    is_chunked_stream,
+    parse_stream_header,
+    decrypt_record,
+)
+from P2P_connection_module.connection_pool import get_pool
+from file_sharing_module.merkle import leaf_count, verify_leaf
+from file_sharing_module.upload_scheduler import UploadBusy
+from file_sharing_module.fileTransfer import (
+    DOWNLOAD_DIR,
+    fetch_merkle_leaves,
+    request_range,
+    resolve_file_key,
+    finish_download,
+    load_download_state,
+    save_download_state,
+)
+
+SWARM_CHUNK_RECORDS = 16           # encrypted records per swarm chunk (~1 MiB)
+SWARM_CHUNK_SIZE = 1024 * 1024     # chunk size when records can't be checked
+SWARM_REQUESTS_PER_PEER = 2        # concurrent range requests per seeder
+SWARM_MAX_PEER_FAILURES = 3
+ENDGAME_STALL_SECONDS = 5.0        # duplicate a chunk with no rate data after this long
+ENDGAME_MAX_FETCHERS = 2
+RATE_SMOOTHING = 0.3
+
+class ChunkAlreadyDone(Exception):
+    """Raised inside a transfer to abandon a chunk another peer finished first."""
+
+class _ChunkBuffer:
+    """Minimal file-like target so request_range can fill an in-memory chunk."""
+
+    def __init__(self, base, size):
+        self.base = base
+        self.data = bytearray(size)
+        self.pos = 0
+
+    def seek(self, offset):
+        self.pos = offset - self.base
+
+    def write(self, data):
+        self.data[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+
+def query_holdings(peer_ip, port, filename, conn=None):
+    """Asks a peer which byte ranges of filename it can serve.
+    Returns (total_size, [[start, end], ...]) or None."""
+    if conn is None:
+        with get_pool().connection((peer_ip, port)) as conn:
+            return query_holdings(peer_ip, port, filename, conn)
+    reply = conn.call(f"HAVE|{filename}").decode().strip()
+    if not reply.startswith("HAVE|"):
+        return None
+    _, total, ranges = reply.split("|")
+    held = [[int(a), int(b)] for a, b in (r.split("-") for r in ranges.split(",") if r)]
+    return int(total), held
+
+def plan_chunks(size, header=None, leaf_size=None):
+    """Splits a file into (start, end) chunks. With Merkle leaves, chunk i
+    is leaf i. Otherwise, when the stream header is known, chunks are
+    aligned to whole encrypted records so each one can be authenticated on
+    its own; chunk 0 also carries the header."""
+    if leaf_size is not None:
+        return [(i * leaf_size, min((i + 1) * leaf_size, size)) for i in range(max(leaf_count(size, leaf_size), 1))]
+    if header is None:
+        return [(start, min(start + SWARM_CHUNK_SIZE, size)) for start in range(0, max(size, 1), SWARM_CHUNK_SIZE)]
+    record_size = parse_stream_header(header) + TAG_SIZE
+    span = record_size * SWARM_CHUNK_RECORDS
+    chunks, start = [], 0
+    while True:
+        end = min(STREAM_HEADER_SIZE + (len(chunks) + 1) * span, size)
+        chunks.append((start, end))
+        if end >= size:
+            return chunks
+        start = end
+
+def verify_chunk(key, header, index, start, data, size):
+    """Authenticates every record inside a record-aligned chunk."""
+    record_size = parse_stream_header(header) + TAG_SIZE
+    if index == 0:
+        if bytes(data[:STREAM_HEADER_SIZE]) != header:
+            raise ValueError("Stream header mismatch")
+        data = memoryview(data)[STREAM_HEADER_SIZE:]
+        start = STREAM_HEADER_SIZE
+    else:
+        data = memoryview(data)
+    first_record = (start - STREAM_HEADER_SIZE) // record_size
+    is_last_chunk = start + len(data) >= size
+    count = -(-len(data) // record_size)
+    for i in range(count):
+        record = bytes(data[i * record_size:(i + 1) * record_size])
+        final = is_last_chunk and i == count - 1
+        decrypt_record(key, header, first_record + i, record, final)
+
+class ChunkScheduler:
+    """Rarest-first chunk assignment with per-peer rate tracking and an
+    endgame mode that re-issues slow in-flight chunks to faster peers."""
+
+    def __init__(self, chunks, holdings, done=()):
+        self.chunks = chunks
+        self.holdings = {peer: set(held) for peer, held in holdings.items()}
+        self.done = set(done)
+        self.pending = set(range(len(chunks))) - self.done
+        self.in_flight = {}        # {chunk: {peer: start_time}}
+        self.rates = {}            # {peer: bytes/s (smoothed)}
+        self.failures = {}
+        self.cond = threading.Condition()
+
+    def _availability(self, index):
+        return sum(1 for held in self.holdings.values() if index in held)
+
+    def _eta(self, peer, index, started):
+        rate = self.rates.get(peer)
+        if not rate:
+            return None
+        start, end = self.chunks[index]
+        return started + (end - start) / rate
+
+    @property
+    def finished(self):
+        return len(self.done) == len(self.chunks)
+
+    @property
+    def stuck(self):
+        """True when unfinished chunks are held by none of the remaining peers."""
+        remaining = set(range(len(self.chunks))) - self.done
+        held = set().union(*self.holdings.values()) if self.holdings else set()
+        return bool(remaining - held)
+
+    def next_chunk(self, peer):
+        with self.cond:
+            held = self.holdings.get(peer, set())
+            candidates = [i for i in self.pending if i in held]
+            if candidates:
+                index = min(candidates, key=lambda i: (self._availability(i), i))
+                self.pending.discard(index)
+                self.in_flight.setdefault(index, {})[peer] = time.monotonic()
+                return index
+            return self._endgame_chunk(peer, held)
+
+    def _endgame_chunk(self, peer, held):
+        now = time.monotonic()
+        best, best_eta = None, None
+        for index, fetchers in self.in_flight.items():
+            if index not in held or peer in fetchers or len(fetchers) >= ENDGAME_MAX_FETCHERS:
+                continue
+            etas = [self._eta(p, index, t) for p, t in fetchers.items()]
+            known = [eta for eta in etas if eta is not None]
+            if known:
+                current_eta = min(known)
+                my_eta = self._eta(peer, index, now)
+                if (my_eta if my_eta is not None else now) >= current_eta:
+                    continue
+            else:
+                # No rate data for its fetchers yet: only a stalled chunk is duplicated.
+                current_eta = min(fetchers.values()) + ENDGAME_STALL_SECONDS
+                if now < current_eta:
+                    continue
+            if best_eta is None or current_eta > best_eta:
+                best, best_eta = index, current_eta
+        if best is not None:
+            self.in_flight[best][peer] = now
+        return best
+
+    def is_done(self, index):
+        return index in self.done
+
+    def complete(self, index, peer, nbytes, seconds):
+        """Returns True if this peer delivered the chunk first."""
+        with self.cond:
+            if seconds > 0:
+                sample = nbytes / seconds
+                old = self.rates.get(peer)
+                self.rates[peer] = sample if old is None else old + RATE_SMOOTHING * (sample - old)
+            self.in_flight.get(index, {}).pop(peer, None)
+            if index in self.done:
+                return False
+            self.done.add(index)
+            self.in_flight.pop(index, None)
+            self.cond.notify_all()
+            return True
+
+    def fail(self, index, peer, drop_after=SWARM_MAX_PEER_FAILURES, count=True):
+        """Puts a chunk back for any holder. count=False (the peer was only
+        busy) does not count towards dropping the peer."""
+        with self.cond:
+            fetchers = self.in_flight.get(index, {})
+            fetchers.pop(peer, None)
+            if not fetchers:
+                self.in_flight.pop(index, None)
+                if index not in self.done:
+                    self.pending.add(index)
+            if count:
+                self.failures[peer] = self.failures.get(peer, 0) + 1
+                if self.failures[peer] >= drop_after:
+                    self.holdings.pop(peer, None)
+            self.cond.notify_all()
+
+    def release(self, index, peer):
+        """Forgets a duplicate fetch that lost the race."""
+        with self.cond:
+            self.in_flight.get(index, {}).pop(peer, None)
+            if not self.in_flight.get(index):
+                self.in_flight.pop(index, None)
+
+    def wait(self, timeout=0.5):
+        with self.cond:
+            self.cond.wait(timeout)
+
+def _peer_worker(peer, conn, filename, scheduler, write_chunk, verify):
+    ip, port = peer
+    while not scheduler.finished and peer in scheduler.holdings:
+        index = scheduler.next_chunk(peer)
+        if index is None:
+            if scheduler.stuck and not scheduler.in_flight:
+                return
+            scheduler.wait()
+            continue
+
+        start, end = scheduler.chunks[index]
+        buf = _ChunkBuffer(start, end - start)
+
+        def on_data(at, nbytes):
+            if scheduler.is_done(index):
+                raise ChunkAlreadyDone()
+
+        began = time.monotonic()
+        try:
+            request_range(ip, port, filename, start, end - start, buf, on_data, conn=conn)
+            verify(index, start, buf.data)
+        except ChunkAlreadyDone:
+            scheduler.release(index, peer)
+            continue
+        except UploadBusy as e:
+            # The seeder is out of upload slots; other peers can take the
+            # chunk meanwhile.
+            scheduler.fail(index, peer, count=False)
+            deadline = time.monotonic() + e.retry_after
+            while not scheduler.finished and time.monotonic() < deadline:
+                scheduler.wait(deadline - time.monotonic())
+            continue
+        except Exception as e:
+            print(f"[!] Chunk {index} from {ip}:{port} failed: {e}")
+            scheduler.fail(index, peer)
+            continue
+
+        if scheduler.complete(index, peer, end - start, time.monotonic() - began):
+            write_chunk(index, start, end, buf.data)
+
+def swarm_download(peers, filename, session, workers=None):
+    """Downloads filename from every peer in peers that holds (part of) it,
+    fetching chunks in parallel and verifying each chunk as it arrives.
+    Progress is checkpointed in the same .part/.part.json files used by
+    resumable downloads, so an interrupted swarm can be resumed or seeded."""
+    entry, file_key = resolve_file_key(filename, session)
+
+    # One pooled connection per peer carries all of its (multiplexed) chunk requests.
+    pool = get_pool()
+    connections, holdings, size = {}, {}, None
+    for peer in peers:
+        conn = None
+        try:
+            conn = pool.acquire(peer)
+            result = query_holdings(peer[0], peer[1], filename, conn=conn)
+        except Exception as e:
+            print(f"[!] Could not query {peer[0]}:{peer[1]}: {e}")
+            if conn is not None:
+                pool.release(peer, conn, discard=True)
+            continue
+        connections[peer] = conn
+        if result is None:
+            continue
+        total, held = result
+        if size is None:
+            size = total
+        elif total != size:
+            print(f"[!] Ignoring {peer[0]}:{peer[1]}: size mismatch ({total} != {size})")
+            continue
+        holdings[peer] = held
+    try:
+        leaves = _swarm_leaves(filename, entry, holdings, connections)
+        return _swarm_fetch(filename, entry, file_key, holdings, connections, size, workers, leaves)
+    finally:
+        for peer, conn in connections.items():
+            pool.release(peer, conn)
+
+def _swarm_leaves(filename, entry, holdings, connections):
+    """Chunk hashes for filename from the first holder that can serve them
+    (partial seeders cannot); they are checked against the manifest root."""
+    if not entry or not entry.get("merkle"):
+        return None
+    for peer in holdings:
+        try:
+            leaves = fetch_merkle_leaves(peer[0], peer[1], filename, entry, conn=connections[peer])
+        except Exception as e:
+            print(f"[!] Bad chunk hashes from {peer[0]}:{peer[1]}: {e}")
+            continue
+        if leaves:
+            return leaves
+    return None
+
+def _probe_header(filename, holdings, connections):
+    """Reads the stream header from the first holder of byte 0 that serves
+    it; a busy or failing peer is skipped rather than failing the swarm.
+    Returns None if no holder answered or the file is not chunked."""
+    for peer, held in holdings.items():
+        if not any(start == 0 and end >= STREAM_HEADER_SIZE for start, end in held):
+            continue
+        probe = _ChunkBuffer(0, STREAM_HEADER_SIZE)
+        try:
+            request_range(peer[0], peer[1], filename, 0, STREAM_HEADER_SIZE, probe, conn=connections[peer])
+        except Exception as e:
+            print(f"[!] Could not read the stream header from {peer[0]}:{peer[1]}: {e}")
+            continue
+        return bytes(probe.data) if is_chunked_stream(bytes(probe.data)) else None
+    return None
+
+def _swarm_fetch(filename, entry, file_key, holdings, connections, size, workers, leaves=None):
+    if not holdings:
+        print(f"[-] No connected peer has the file: {filename}")
+        return False
+
+    part_path = os.path.join(DOWNLOAD_DIR, f"{filename}.part")
+    state_path = part_path + ".json"
+    state = load_download_state(state_path, size, entry["hash"] if entry else None)
+    if not os.path.exists(part_path):
+        state["done"] = []
+    file_lock = threading.Lock()
+
+    with open(part_path, "r+b" if os.path.exists(part_path) else "w+b") as f:
+        f.truncate(size)
+
+        # Chunks are checked against the Merkle leaves when there are any;
+        # otherwise record-aligned chunks (and per-chunk authentication)
+        # need the header.
+        header = None
+        leaf_size = entry["merkle"]["leaf_size"] if leaves is not None else None
+        if leaves is None and file_key is not None and size >= STREAM_HEADER_SIZE:
+            header = _probe_header(filename, holdings, connections)
+
+        chunks = plan_chunks(size, header, leaf_size)
+        done_ranges = state["done"]
+        already = [i for i, (start, end) in enumerate(chunks)
+                   if any(a <= start and end <= b for a, b in done_ranges)]
+        peer_chunks = {
+            peer: [i for i, (start, end) in enumerate(chunks)
+                   if any(a <= start and end <= b for a, b in held)]
+            for peer, held in holdings.items()
+        }
+        scheduler = ChunkScheduler(chunks, peer_chunks, done=already)
+
+        def verify(index, start, data):
+            if leaves is not None:
+                verify_leaf(leaves, index, data)
+            elif header is not None:
+                verify_chunk(file_key, header, index, start, data, size)
+
+        def write_chunk(index, start, end, data):
+            with file_lock:
+                f.seek(start)
+                f.write(data)
+                f.flush()
+                state["done"].append([start, end])
+                save_download_state(state_path, state)
+
+        print(f"[+] Swarm downloading {filename} ({len(chunks)} chunks) from {len(holdings)} peer(s)")
+        threads = [
+            threading.Thread(target=_peer_worker, args=(peer, connections[peer], filename, scheduler, write_chunk, verify),
+                             daemon=True)
+            for peer in holdings
+            for _ in range(SWARM_REQUESTS_PER_PEER)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if not scheduler.finished:
+            print(f"[!] Swarm download incomplete ({len(scheduler.done)}/{len(chunks)} chunks); rerun to resume.")
+            return False
+
+    if os.path.exists(state_path):    # never written when there was nothing to fetch
+        os.remove(state_path)
+    return finish_download(part_path, filename, entry, file_key, workers)
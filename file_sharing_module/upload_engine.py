@@ -0,0 +1,166 @@
+import os
+import time
+import errno
+import select
+import socket
+import threading
+from collections import deque
+
+# Upload engine: pushes on-disk ciphertext to a socket with os.sendfile when
+# the kernel supports it (no copies through Python), otherwise with sendall
+# over a large reusable buffer. With a throttle (the upload scheduler's rate
+# limit), data goes out in UPLOAD_BUFFER_SIZE blocks and throttle(n) is
+# called for each one. On a framed (multiplexed) reply channel, each block
+# becomes one response frame: the header is written and the body sendfile'd
+# straight to the shared socket while holding its writer lock.
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+SENDFILE_BLOCK = 1 << 30  # cap per os.sendfile call
+FRAMED_SENDFILE_BLOCK = 4 * 1024 * 1024  # per frame; other requests wait at most one frame
+STATS_HISTORY = 100
+
+_SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP, errno.ENOTSUP}
+_local = threading.local()
+_stats_lock = threading.Lock()
+_recent_uploads = deque(maxlen=STATS_HISTORY)
+_totals = {"uploads": 0, "bytes": 0, "seconds": 0.0, "cpu_seconds": 0.0}
+
+def _buffer():
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = _local.buffer = memoryview(bytearray(UPLOAD_BUFFER_SIZE))
+    return buf
+
+def _wait_writable(conn, fd):
+    """Waits for room in the socket's send buffer, honouring its timeout the
+    way sendall does (a socket with a timeout is non-blocking underneath, so
+    sendfile returns EAGAIN instead of blocking)."""
+    timeout = getattr(conn, "gettimeout", lambda: None)() or None
+    if hasattr(select, "poll"):    # no FD_SETSIZE limit on busy seeders
+        poller = select.poll()
+        poller.register(fd, select.POLLOUT)
+        writable = poller.poll(None if timeout is None else timeout * 1000)
+    else:
+        _, writable, _ = select.select([], [fd], [], timeout)
+    if not writable:
+        raise socket.timeout("timed out waiting to send file data")
+
+def _send_zero_copy(conn, f, offset, count, throttle=None):
+    """Returns bytes sent, or None if sendfile cannot be used for this pair."""
+    if not hasattr(os, "sendfile"):
+        return None
+    try:
+        out_fd, in_fd = conn.fileno(), f.fileno()
+    except (AttributeError, OSError):
+        return None  # not backed by a real socket/file (e.g. a framed reply channel)
+    max_block = SENDFILE_BLOCK if throttle is None else UPLOAD_BUFFER_SIZE
+    sent = 0
+    while count is None or sent < count:
+        block = max_block if count is None else min(max_block, count - sent)
+        try:
+            n = os.sendfile(out_fd, in_fd, offset + sent, block)
+        except BlockingIOError:
+            _wait_writable(conn, out_fd)
+            continue
+        except OSError as e:
+            if sent == 0 and e.errno in _SENDFILE_UNSUPPORTED:
+                return None
+            raise
+        if n == 0:
+            break
+        sent += n
+        if throttle is not None:
+            throttle(n)  # after the send, so an unsupported first call is not counted
+    return sent
+
+def _send_buffered(conn, f, offset, count, throttle=None):
+    view = _buffer()
+    f.seek(offset)
+    sent = 0
+    while count is None or sent < count:
+        want = len(view) if count is None else min(len(view), count - sent)
+        n = f.readinto(view[:want])
+        if not n:
+            break
+        if throttle is not None:
+            throttle(n)
+        conn.sendall(view[:n])
+        sent += n
+    return sent
+
+def _send_framed(conn, f, offset, count, throttle=None):
+    """Zero-copy upload over a framed reply channel. Returns (bytes_sent,
+    method), or None if conn is not one or f has no descriptor."""
+    send_frame_body = getattr(conn, "send_frame_body", None)
+    if send_frame_body is None:
+        return None
+    try:
+        remaining = max(0, os.fstat(f.fileno()).st_size - offset)
+    except (AttributeError, OSError):
+        return None
+    if count is not None:
+        remaining = min(count, remaining)
+    max_block = FRAMED_SENDFILE_BLOCK if throttle is None else UPLOAD_BUFFER_SIZE
+    method = ["sendfile"]
+    sent = 0
+    while sent < remaining:
+        block = min(max_block, remaining - sent)
+        if throttle is not None:
+            throttle(block)
+
+        def write_body(sock, start=offset + sent, n=block):
+            written = _send_zero_copy(sock, f, start, n)
+            if written is None:
+                method[0] = "buffered"
+                written = _send_buffered(sock, f, start, n)
+            return written
+
+        sent += send_frame_body(block, write_body)
+    return sent, method[0]
+
+def stream_file(conn, f, offset=0, count=None, zero_copy=True, throttle=None):
+    """Sends count bytes (or everything) of f from offset to conn.
+
+    Returns (bytes_sent, method) where method is "sendfile" or "buffered".
+    """
+    if zero_copy:
+        framed = _send_framed(conn, f, offset, count, throttle)
+        if framed is not None:
+            return framed
+        sent = _send_zero_copy(conn, f, offset, count, throttle)
+        if sent is not None:
+            return sent, "sendfile"
+    return _send_buffered(conn, f, offset, count, throttle), "buffered"
+
+def record_upload(name, nbytes, seconds, cpu_seconds, method):
+    gib = nbytes / 2**30
+    stat = {
+        "file": name,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "method": method,
+        "mib_per_s": nbytes / 2**20 / seconds if seconds > 0 else 0.0,
+        "cpu_s_per_gib": cpu_seconds / gib if gib > 0 else 0.0,
+    }
+    with _stats_lock:
+        _recent_uploads.append(stat)
+        _totals["uploads"] += 1
+        _totals["bytes"] += nbytes
+        _totals["seconds"] += seconds
+        _totals["cpu_seconds"] += cpu_seconds
+    return stat
+
+def timed_upload(name, conn, f, offset=0, count=None, zero_copy=True, throttle=None):
+    """stream_file plus wall-clock/CPU accounting. Returns the recorded stat."""
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    sent, method = stream_file(conn, f, offset, count, zero_copy, throttle)
+    return record_upload(name, sent, time.perf_counter() - start, time.thread_time() - cpu_start, method)
+
+def get_upload_stats():
+    """Returns aggregate upload totals and the most recent per-upload stats."""
+    with _stats_lock:
+        totals = dict(_totals)
+        recent = list(_recent_uploads)
+    gib = totals["bytes"] / 2**30
+    totals["mib_per_s"] = totals["bytes"] / 2**20 / totals["seconds"] if totals["seconds"] > 0 else 0.0
+    totals["cpu_s_per_gib"] = totals["cpu_seconds"] / gib if gib > 0 else 0.0
+    return {"totals": totals, "recent": recent}
@@ -0,0 +1,341 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+# Upload slot scheduler.
+#
+# Every GET_FILE / GET_RANGE that sends data has to hold one of a fixed
+# number of upload slots, so a popular seeder serves a few transfers at
+# full speed instead of hundreds at a crawl. Requests that find no free slot
+# wait in per-peer queues; when a slot frees up the next request is picked
+# by deficit round-robin over the waiting peers (each peer's turn is worth
+# DRR_QUANTUM bytes), so a peer with many queued chunks cannot starve one
+# with a single small request. Token buckets cap the upload rate overall
+# and per peer. When the queue is full, or a request has waited too long,
+# the requester is sent BUSY|<seconds>\n instead of data and should retry
+# after that long (preferably elsewhere). Zero-length range probes, HAVE
+# and MERKLE are cheap and are never queued.
+DEFAULT_UPLOAD_SLOTS = 4
+MAX_QUEUED_UPLOADS = 64
+MAX_QUEUED_PER_PEER = 16
+QUEUE_TIMEOUT = 30.0               # requesters give up on a silent request after 60 s
+DRR_QUANTUM = 4 * 1024 * 1024      # one range segment per turn
+DRR_MAX_COST = 256 * 1024 * 1024   # whole-file requests cost at most this many bytes
+BUCKET_BURST_SECONDS = 1.0         # a bucket holds this many seconds of its rate
+RATE_WINDOW = 5.0                  # seconds of history behind bytes_per_s
+BUSY_RETRY_MIN = 1.0
+BUSY_RETRY_MAX = 30.0
+
+class UploadBusy(ConnectionError):
+    """Raised when an upload cannot get a slot; on the requesting side,
+    when the peer replied BUSY. retry_after is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Peer is busy; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+def encode_busy(retry_after) -> bytes:
+    return f"BUSY|{retry_after:.1f}\n".encode()
+
+def parse_busy(line: str):
+    """UploadBusy for a BUSY|<seconds> reply line."""
+    try:
+        retry_after = float(line.strip().split("|")[1])
+    except (IndexError, ValueError):
+        retry_after = BUSY_RETRY_MIN
+    return UploadBusy(retry_after)
+
+class TokenBucket:
+    """Thread-safe token bucket. reserve(n) takes n tokens, going into debt
+    if needed, and returns how long the caller must wait before sending, so
+    it works for threads (sleep) and coroutines (asyncio.sleep) alike."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate * BUCKET_BURST_SECONDS
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= nbytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def full(self):
+        with self.lock:
+            return self.tokens + (time.monotonic() - self.stamp) * self.rate >= self.burst
+
+class _RateMeter:
+    def __init__(self):
+        self.samples = deque()     # (time, bytes)
+        self.total = 0
+
+    def add(self, nbytes, now):
+        self.samples.append((now, nbytes))
+        self.total += nbytes
+        self._prune(now)
+
+    def _prune(self, now):
+        while self.samples and self.samples[0][0] < now - RATE_WINDOW:
+            self.total -= self.samples.popleft()[1]
+
+    def rate(self, now):
+        self._prune(now)
+        return self.total / RATE_WINDOW
+
+class UploadSlot:
+    """A queued or granted upload. Use as a context manager (or call
+    release()) so the slot is always handed back."""
+
+    def __init__(self, scheduler, peer, nbytes, future=None):
+        self.scheduler = scheduler
+        self.peer = peer
+        self.nbytes = nbytes
+        self.cost = max(1, min(nbytes, DRR_MAX_COST))
+        self.queued_at = time.monotonic()
+        self.granted_at = None
+        self.released = False
+        self.event = threading.Event()
+        self.future = future       # set instead of event for coroutines
+
+    def reserve(self, nbytes):
+        """Accounts nbytes about to be sent; returns the seconds to wait
+        first to stay within the rate limits."""
+        return self.scheduler._reserve(self.peer, nbytes)
+
+    def throttle(self, nbytes):
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class UploadScheduler:
+    def __init__(self, slots=DEFAULT_UPLOAD_SLOTS, max_queued=MAX_QUEUED_UPLOADS,
+                 max_queued_per_peer=MAX_QUEUED_PER_PEER, global_rate=None, peer_rate=None,
+                 queue_timeout=QUEUE_TIMEOUT, quantum=DRR_QUANTUM):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.max_queued_per_peer = max_queued_per_peer
+        self.queue_timeout = queue_timeout
+        self.quantum = quantum
+        self.lock = threading.Lock()
+        self.waiting = {}          # {peer: deque of UploadSlot}
+        self.ring = deque()        # peers with waiting requests, current turn first
+        self.deficit = {}          # {peer: bytes the peer may still start this turn}
+        self.active = {}           # {peer: granted slots}
+        self.active_count = 0
+        self.queued_count = 0
+        self.meters = {}           # {peer: _RateMeter}
+        self.meter = _RateMeter()
+        self.counters = {"granted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "wait_seconds": 0.0}
+        self.set_limits(global_rate, peer_rate)
+
+    def set_limits(self, global_rate=None, peer_rate=None):
+        """Upload rate limits in bytes/s (None: unlimited); takes effect for
+        transfers already running too."""
+        with self.lock:
+            self.global_rate = global_rate
+            self.peer_rate = peer_rate
+            self.global_bucket = TokenBucket(global_rate) if global_rate else None
+            self.peer_buckets = {}
+
+    # -- queueing --------------------------------------------------------
+
+    def _retry_after(self):
+        """Roughly how long the current backlog takes to drain."""
+        backlog = sum(slot.nbytes for queue in self.waiting.values() for slot in queue)
+        rate = self.meter.rate(time.monotonic())
+        if rate <= 0:
+            return BUSY_RETRY_MIN
+        return min(BUSY_RETRY_MAX, max(BUSY_RETRY_MIN, backlog / rate))
+
+    def _enqueue(self, peer, nbytes, future=None):
+        with self.lock:
+            slot = UploadSlot(self, peer, nbytes, future)
+            if self.active_count < self.slots and not self.ring:
+                self._grant(slot)
+                return slot
+            queue = self.waiting.get(peer)
+            if self.queued_count >= self.max_queued or (queue and len(queue) >= self.max_queued_per_peer):
+                self.counters["rejected"] += 1
+                raise UploadBusy(self._retry_after())
+            if queue is None:
+                queue = self.waiting[peer] = deque()
+                # A peer that joins an empty ring starts its turn at once;
+                # otherwise it gets its quantum when its turn comes.
+                self.deficit[peer] = 0 if self.ring else self.quantum
+                self.ring.append(peer)
+            queue.append(slot)
+            self.queued_count += 1
+            self.counters["queued"] += 1
+            self._dispatch()
+            return slot
+
+    def _grant(self, slot):
+        slot.granted_at = time.monotonic()
+        self.active_count += 1
+        self.active[slot.peer] = self.active.get(slot.peer, 0) + 1
+        self.counters["granted"] += 1
+        self.counters["wait_seconds"] += slot.granted_at - slot.queued_at
+        if slot.future is not None:
+            loop = slot.future.get_loop()
+            loop.call_soon_threadsafe(lambda: slot.future.done() or slot.future.set_result(slot))
+        else:
+            slot.event.set()
+
+    def _drop_peer(self, peer):
+        was_current = self.ring[0] == peer
+        self.ring.remove(peer)
+        del self.waiting[peer]
+        del self.deficit[peer]
+        if was_current and self.ring:
+            self.deficit[self.ring[0]] += self.quantum
+
+    def _pick(self):
+        # Deficit round-robin: the current peer keeps starting requests
+        # while its deficit covers them, then the turn (and a fresh
+        # quantum) passes to the next waiting peer.
+        while self.ring:
+            peer = self.ring[0]
+            queue = self.waiting[peer]
+            if self.deficit[peer] >= queue[0].cost:
+                slot = queue.popleft()
+                self.queued_count -= 1
+                self.deficit[peer] -= slot.cost
+                if not queue:
+                    self._drop_peer(peer)
+                return slot
+            self.ring.rotate(-1)
+            self.deficit[self.ring[0]] += self.quantum
+        return None
+
+    def _dispatch(self):
+        while self.active_count < self.slots and self.ring:
+            self._grant(self._pick())
+
+    def _abandon(self, slot):
+        """Takes a slot that stopped waiting out of the queue. Returns False
+        if it was granted in the meantime (the caller then owns it)."""
+        with self.lock:
+            if slot.granted_at is not None:
+                return False
+            queue = self.waiting.get(slot.peer)
+            if queue is not None and slot in queue:
+                queue.remove(slot)
+                self.queued_count -= 1
+                if not queue:
+                    self._drop_peer(slot.peer)
+            slot.released = True
+            return True
+
+    def acquire(self, peer, nbytes):
+        """Blocks until peer may upload nbytes and returns its UploadSlot.
+        Raises UploadBusy if the queue is full or the wait times out."""
+        slot = self._enqueue(peer, nbytes)
+        if not slot.event.wait(self.queue_timeout) and self._abandon(slot):
+            with self.lock:
+                self.counters["timed_out"] += 1
+                raise UploadBusy(self._retry_after())
+        return slot
+
+    async def acquire_async(self, peer, nbytes):
+        """Coroutine version of acquire() for the asyncio engine."""
+        future = asyncio.get_running_loop().create_future()
+        slot = self._enqueue(peer, nbytes, future)
+        if slot.granted_at is not None:
+            return slot
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(slot):
+                return slot
+            with self.lock:
+                self.counters["timed_out"] += 1
+                raise UploadBusy(self._retry_after())
+        except asyncio.CancelledError:
+            if not self._abandon(slot):
+                slot.release()
+            raise
+
+    def release(self, slot):
+        with self.lock:
+            if slot.released:
+                return
+            slot.released = True
+            self.active_count -= 1
+            self.active[slot.peer] -= 1
+            if not self.active[slot.peer]:
+                del self.active[slot.peer]
+            # A peer's bucket is only forgotten once it has refilled, so
+            # back-to-back range requests cannot each start with a burst.
+            for peer in [p for p, bucket in self.peer_buckets.items() if p not in self.active and bucket.full()]:
+                del self.peer_buckets[peer]
+            self._dispatch()
+
+    # -- rate limits and stats ---------------------------------------------
+
+    def _reserve(self, peer, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            self.meter.add(nbytes, now)
+            self.meters.setdefault(peer, _RateMeter()).add(nbytes, now)
+            buckets = [self.global_bucket]
+            if self.peer_rate:
+                if peer not in self.peer_buckets:
+                    self.peer_buckets[peer] = TokenBucket(self.peer_rate)
+                buckets.append(self.peer_buckets[peer])
+        return max((bucket.reserve(nbytes) for bucket in buckets if bucket is not None), default=0.0)
+
+    def get_stats(self):
+        with self.lock:
+            now = time.monotonic()
+            peers = {}
+            for peer, meter in list(self.meters.items()):
+                rate = meter.rate(now)
+                queued = len(self.waiting.get(peer, ()))
+                active = self.active.get(peer, 0)
+                if not (rate or queued or active):
+                    del self.meters[peer]
+                    continue
+                peers[peer] = {"active": active, "queued": queued, "bytes_per_s": rate}
+            for peer, queue in self.waiting.items():
+                peers.setdefault(peer, {"active": self.active.get(peer, 0), "queued": len(queue), "bytes_per_s": 0.0})
+            granted = self.counters["granted"]
+            return {
+                "slots": self.slots,
+                "active": self.active_count,
+                "queued": self.queued_count,
+                "max_queued": self.max_queued,
+                "bytes_per_s": self.meter.rate(now),
+                "global_rate": self.global_rate,
+                "peer_rate": self.peer_rate,
+                "granted": granted,
+                "rejected": self.counters["rejected"],
+                "timed_out": self.counters["timed_out"],
+                "avg_wait_s": self.counters["wait_seconds"] / granted if granted else 0.0,
+                "peers": peers,
+            }
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_upload_scheduler():
+    """Process-wide scheduler shared by the threaded and asyncio listeners."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = UploadScheduler()
+        return _default_scheduler
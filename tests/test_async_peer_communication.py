@@ -0,0 +1,53 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'P2P_connection_module')))
+
+import asyncio
+import unittest
+from unittest import mock
+import async_peer_communication as apc
+from async_peer_communication import AsyncPeerCommunicator
+from file_sharing_module.upload_scheduler import UploadBusy
+
+class RequestFileReplyTest(unittest.TestCase):
+    def setUp(self):
+        self.communicator = AsyncPeerCommunicator(0, crypto_workers=1)
+        self.addCleanup(self.communicator.crypto_pool.shutdown)
+        for patcher in (
+            mock.patch.object(apc, "resolve_file_key", lambda filename, session: (None, None)),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, reply):
+        async def serve(reader, writer):
+            await reader.read(1024)
+            writer.write(reply)
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(serve, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await self.communicator.request_file("127.0.0.1", port, "f.txt", None)
+            finally:
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def test_busy_reply_raises_upload_busy(self):
+        for reply in (b"BUSY|2.5\n", b"BUSY|12.5\n"):     # shorter and longer than FILE_FOUND
+            with self.subTest(reply=reply):
+                with self.assertRaises(UploadBusy) as caught:
+                    self.request(reply)
+                self.assertEqual(caught.exception.retry_after, float(reply[5:]))
+
+    def test_missing_file(self):
+        self.assertFalse(self.request(b"FILE_NOT_FOUND"))
+        self.assertFalse(self.request(b""))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import tempfile
+import unittest
+from unittest import mock
+from file_sharing_module import blob_store
+from file_sharing_module.blob_store import BlobStore, blob_id, content_hash_and_key
+from file_sharing_module.manifest_store import ManifestStore
+from file_sharing_module.pipeline import decrypt_and_hash_stream
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = ManifestStore(os.path.join(self.tmp.name, "manifest.db"), legacy_json=None)
+        self.blobs = BlobStore(os.path.join(self.tmp.name, "blobs"), self.manifest)
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def share(self, path, filename, compression=None):
+        hash_value, key = content_hash_and_key(path)
+        entry = {"filename": filename, "hash": hash_value, "compression": compression}
+        entry_id, stored = self.blobs.add(path, entry, key)
+        return entry_id, stored, entry, key
+
+    def read_blob(self, entry):
+        with open(self.blobs.path(entry["blob"]), "rb") as f:
+            return f.read()
+
+    def test_same_content_is_stored_once(self):
+        data = os.urandom(300_000)
+        _, stored_a, entry_a, key_a = self.share(self.write("a.bin", data), "a.bin")
+        _, stored_b, entry_b, key_b = self.share(self.write("b.bin", data), "b.bin")
+        self.assertEqual((stored_a, stored_b), (True, False))
+        self.assertEqual(entry_a["blob"], entry_b["blob"])
+        self.assertEqual(key_a, key_b)
+        self.assertEqual(self.blobs.get_stats()["blobs"], 1)
+        self.assertEqual(self.blobs.resolve("b.bin"), self.blobs.path(entry_a["blob"]))
+
+    def test_stored_content_is_not_read_again(self):
+        data = os.urandom(100_000)
+        self.share(self.write("a.bin", data), "a.bin")
+        with mock.patch.object(blob_store, "hash_and_encrypt_file") as encrypt:
+            _, stored, _, _ = self.share(self.write("b.bin", data), "b.bin")
+        self.assertFalse(stored)
+        encrypt.assert_not_called()
+
+    def test_hash_pass_returns_the_sample(self):
+        data = os.urandom(3 * blob_store.HASH_READ_SIZE // 2)
+        path = self.write("s.bin", data)
+        hash_value, key, sample = content_hash_and_key(path, sample_size=blob_store.HASH_READ_SIZE + 10)
+        self.assertEqual((hash_value, key), content_hash_and_key(path))
+        self.assertEqual(sample, data[:blob_store.HASH_READ_SIZE + 10])
+        self.assertEqual(content_hash_and_key(self.write("t.bin", b"abc"), sample_size=10)[2], b"abc")
+
+    def test_blob_decrypts_to_the_shared_content(self):
+        data = b"hello blobs " * 10_000
+        for compression in (None, {"codec": "zlib", "level": 6}):
+            with self.subTest(compression=compression):
+                _, _, entry, key = self.share(self.write("c.txt", data), "c.txt", compression)
+                self.assertEqual(entry["blob"], blob_id(entry["hash"], compression))
+                out = io.BytesIO()
+                digest = decrypt_and_hash_stream(io.BytesIO(self.read_blob(entry)), out, key,
+                                                 compression=compression)
+                self.assertEqual((out.getvalue(), digest), (data, entry["hash"]))
+
+    def test_reencryption_is_deterministic(self):
+        path = self.write("d.bin", os.urandom(200_000))
+        entry_id, _, entry, key = self.share(path, "d.bin")
+        before, root = self.read_blob(entry), entry["merkle"]["root"]
+        os.remove(self.blobs.path(entry["blob"]))
+        self.assertTrue(self.blobs.put(path, entry["hash"], key))
+        self.assertEqual(self.read_blob(entry), before)
+        self.assertEqual(self.blobs.merkle_info(entry["blob"])["root"], root)
+
+    def test_release_collects_the_last_reference(self):
+        data = os.urandom(100_000)
+        first, _, entry, _ = self.share(self.write("e.bin", data), "e.bin")
+        second, _, _, _ = self.share(self.write("f.bin", data), "f.bin")
+        blob_path = self.blobs.path(entry["blob"])
+        self.assertEqual(self.blobs.release(first), (True, False))
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual(self.blobs.release(second), (True, True))
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(os.path.exists(blob_path + ".merkle"))
+        self.assertEqual(self.blobs.release(second), (False, False))
+        self.assertIsNone(self.blobs.resolve("e.bin"))
+
+    def test_gc_removes_unreferenced_blobs(self):
+        entry_id, _, entry, _ = self.share(self.write("g.bin", os.urandom(1000)), "g.bin")
+        self.share(self.write("h.bin", os.urandom(1000)), "h.bin")
+        self.manifest.remove(entry_id)       # bypasses release()
+        self.assertEqual(self.blobs.gc(), 2)   # the blob and its .merkle sidecar
+        self.assertFalse(self.blobs.exists(entry["blob"]))
+        self.assertEqual(self.blobs.get_stats()["blobs"], 1)
+
+    def test_content_changed_while_sharing_is_refused(self):
+        path = self.write("i.bin", b"original")
+        hash_value, key = content_hash_and_key(path)
+        self.write("i.bin", b"modified")
+        with self.assertRaises(ValueError):
+            self.blobs.put(path, hash_value, key)
+        self.assertFalse(self.blobs.exists(hash_value))
+        self.assertEqual(os.listdir(os.path.dirname(self.blobs.path(hash_value))), [])
+
+if __name__ == "__main__":
+    unittest.main()
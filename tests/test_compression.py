@@ -0,0 +1,104 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import tempfile
+import unittest
+from unittest import mock
+from file_sharing_module import compression
+from file_sharing_module.compression import (
+    DEFAULT_LEVELS,
+    MIN_COMPRESS_SIZE,
+    SAMPLE_SIZE,
+    CompressingReader,
+    DecompressingWriter,
+    available_codecs,
+    choose_compression,
+)
+
+TEXT = b"".join(b"line %d of a very compressible log file\n" % i for i in range(20_000))
+
+class ChooseCompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        path = os.path.join(self.tmp.name, "f")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_compressible_file_gets_the_default_codec(self):
+        self.assertEqual(choose_compression(self.write(TEXT)), {"codec": "zlib", "level": DEFAULT_LEVELS["zlib"]})
+
+    def test_incompressible_file_is_left_alone(self):
+        self.assertIsNone(choose_compression(self.write(os.urandom(SAMPLE_SIZE))))
+
+    def test_small_file_is_left_alone(self):
+        self.assertIsNone(choose_compression(self.write(b"a" * (MIN_COMPRESS_SIZE - 1))))
+        self.assertIsNone(choose_compression(self.write(b"")))
+
+    def test_only_the_sample_is_inspected(self):
+        # Random data after the sample does not change the decision.
+        self.assertIsNotNone(choose_compression(self.write(TEXT[:SAMPLE_SIZE] + os.urandom(SAMPLE_SIZE))))
+        self.assertIsNone(choose_compression(self.write(os.urandom(SAMPLE_SIZE) + TEXT)))
+
+    def test_sample_already_read_is_used(self):
+        missing = os.path.join(self.tmp.name, "missing")
+        self.assertIsNotNone(choose_compression(missing, sample=TEXT))
+        self.assertIsNone(choose_compression(missing, sample=os.urandom(SAMPLE_SIZE) + TEXT))
+
+    def test_codec_and_level_choice(self):
+        path = self.write(TEXT)
+        self.assertEqual(choose_compression(path, "lzma", 4), {"codec": "lzma", "level": 4})
+        with mock.patch.object(compression, "zstandard", None):
+            self.assertEqual(choose_compression(path, "zstd")["codec"], "zlib")
+
+class CompressionStreamTest(unittest.TestCase):
+    def round_trip(self, codec, data, read_size):
+        reader = CompressingReader(io.BytesIO(data), codec, DEFAULT_LEVELS[codec])
+        compressed = bytearray()
+        while chunk := reader.read(read_size):
+            compressed += chunk
+        out = io.BytesIO()
+        writer = DecompressingWriter(out, codec)
+        for i in range(0, len(compressed), 1000):
+            writer.write(bytes(compressed[i:i + 1000]))
+        writer.close()
+        return bytes(compressed), out.getvalue()
+
+    def test_round_trip_every_codec(self):
+        for codec in available_codecs():
+            with self.subTest(codec=codec):
+                compressed, out = self.round_trip(codec, TEXT, 64 * 1024)
+                self.assertEqual(out, TEXT)
+                self.assertLess(len(compressed), len(TEXT) // 4)
+
+    def test_reads_are_full_until_eof(self):
+        reader = CompressingReader(io.BytesIO(os.urandom(300_000)), "zlib", 1)
+        sizes = []
+        while chunk := reader.read(50_000):
+            sizes.append(len(chunk))
+        self.assertTrue(all(size == 50_000 for size in sizes[:-1]))
+        self.assertEqual(reader.bytes_in, 300_000)
+        self.assertEqual(reader.bytes_out, sum(sizes))
+
+    def test_truncated_stream_is_detected(self):
+        for codec in ("zlib", "lzma"):
+            with self.subTest(codec=codec):
+                compressed, _ = self.round_trip(codec, TEXT, -1)
+                writer = DecompressingWriter(io.BytesIO(), codec)
+                writer.write(compressed[:len(compressed) // 2])
+                with self.assertRaises(ValueError):
+                    writer.close()
+
+    def test_corrupt_stream_is_detected(self):
+        with self.assertRaises(ValueError):
+            DecompressingWriter(io.BytesIO(), "zlib").write(b"definitely not zlib")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from file_sharing_module import download_manager as dm
+from file_sharing_module.download_manager import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    PAUSED,
+    QUEUED,
+    RUNNING,
+    DownloadManager,
+)
+from file_sharing_module.fileTransfer import DownloadStopped
+from file_sharing_module.upload_scheduler import UploadBusy
+
+STEPS = 20
+
+class FakeTransfers:
+    """Stands in for resume_download: 'downloads' STEPS blocks per file,
+    remembering progress across attempts like a .part file would."""
+
+    def __init__(self, step_delay=0.01):
+        self.step_delay = step_delay
+        self.progress = {}
+        self.calls = []
+        self.outcomes = {}       # {filename: [exception or False, ...]} for the next attempts
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def resume_download(self, ip, port, filename, session, workers=None, max_attempts=1,
+                        on_progress=None, should_stop=None):
+        self.calls.append((filename, (ip, port)))
+        pending = self.outcomes.get(filename)
+        if pending:
+            outcome = pending.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        while self.progress.get(filename, 0) < STEPS:
+            self.gate.wait()
+            if should_stop():
+                raise DownloadStopped(filename)
+            time.sleep(self.step_delay)
+            self.progress[filename] = self.progress.get(filename, 0) + 1
+            on_progress(self.progress[filename], STEPS)
+        return True
+
+class DownloadManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fake = FakeTransfers()
+        for patcher in (
+            mock.patch.object(dm, "resume_download", self.fake.resume_download),
+            mock.patch.object(dm, "DOWNLOAD_DIR", self.tmp.name),
+            mock.patch.object(dm, "BACKOFF_BASE", 0.01),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = DownloadManager(session=None, max_concurrent=2)
+        self.peers = [("10.0.0.1", 1), ("10.0.0.2", 2)]
+
+    def tearDown(self):
+        self.manager.close()
+        self.tmp.cleanup()
+
+    def wait_for(self, predicate, timeout=3):
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.005)
+
+    def test_batch_completes(self):
+        jobs = self.manager.submit_batch(["a", "b", "c"], self.peers)
+        self.assertTrue(self.manager.wait(jobs, 5))
+        self.assertEqual([job.state for job in jobs], [DONE] * 3)
+        self.assertEqual([job.progress for job in jobs], [1.0] * 3)
+        # Jobs start at different peers.
+        self.assertEqual({call[1] for call in self.fake.calls}, set(self.peers))
+
+    def test_duplicate_submit_returns_the_same_job(self):
+        self.fake.gate.clear()
+        job = self.manager.submit("a", self.peers)
+        self.assertIs(self.manager.submit("a", self.peers), job)
+        self.fake.gate.set()
+        self.assertTrue(self.manager.wait([job], 5))
+
+    def test_pause_and_resume_running_job(self):
+        job = self.manager.submit("a", self.peers)
+        self.wait_for(lambda: job.done_bytes >= 3)
+        self.assertTrue(self.manager.pause(job.job_id))
+        self.wait_for(lambda: job.state == PAUSED)
+        paused_at = self.fake.progress["a"]
+        time.sleep(0.05)
+        self.assertEqual(self.fake.progress["a"], paused_at)
+        self.assertTrue(self.manager.resume(job.job_id))
+        self.assertTrue(self.manager.wait([job], 5))
+        self.assertEqual(job.state, DONE)
+        self.assertEqual(len(self.fake.calls), 2)      # continued, not restarted
+
+    def test_pause_queued_job(self):
+        self.fake.gate.clear()
+        jobs = self.manager.submit_batch(["a", "b", "c"], self.peers)
+        self.assertTrue(self.manager.pause(jobs[2].job_id))
+        self.assertEqual(jobs[2].state, PAUSED)
+        self.fake.gate.set()
+        self.assertTrue(self.manager.wait(jobs[:2], 5))
+        self.assertEqual(jobs[2].state, PAUSED)
+        self.assertNotIn("c", [call[0] for call in self.fake.calls])
+        self.manager.resume(jobs[2].job_id)
+        self.assertTrue(self.manager.wait(jobs, 5))
+
+    def test_cancel_discards_the_partial_download(self):
+        part = os.path.join(self.tmp.name, "a.part")
+        for path in (part, part + ".json"):
+            open(path, "w").close()
+        job = self.manager.submit("a", self.peers)
+        self.wait_for(lambda: job.done_bytes >= 2)
+        self.assertTrue(self.manager.cancel(job.job_id))
+        self.assertTrue(self.manager.wait([job], 5))
+        self.assertEqual(job.state, CANCELLED)
+        self.assertFalse(os.path.exists(part) or os.path.exists(part + ".json"))
+
+    def test_failed_attempts_retry_on_the_next_peer(self):
+        self.fake.outcomes["a"] = [ConnectionError("down"), False]
+        job = self.manager.submit("a", self.peers)
+        self.assertTrue(self.manager.wait([job], 5))
+        self.assertEqual(job.state, DONE)
+        self.assertEqual([call[1] for call in self.fake.calls], [self.peers[0], self.peers[1], self.peers[0]])
+
+    def test_gives_up_after_max_attempts(self):
+        self.fake.outcomes["a"] = [ConnectionError("down")] * dm.DOWNLOAD_ATTEMPTS
+        job = self.manager.submit("a", self.peers)
+        self.assertTrue(self.manager.wait([job], 5))
+        self.assertEqual((job.state, job.error), (FAILED, "down"))
+
+    def test_busy_peer_is_not_a_failed_attempt(self):
+        self.fake.outcomes["a"] = [UploadBusy(0.01)] * (dm.DOWNLOAD_ATTEMPTS + 1)
+        job = self.manager.submit("a", self.peers)
+        self.assertTrue(self.manager.wait([job], 5))
+        self.assertEqual(job.state, DONE)
+        self.assertEqual(job.busy_retries, dm.DOWNLOAD_ATTEMPTS + 1)
+
+    def test_close_pauses_every_unfinished_job(self):
+        self.fake.gate.clear()
+        self.fake.outcomes["d"] = [ConnectionError("down")]
+        jobs = self.manager.submit_batch(["a", "b", "c", "d"], self.peers)
+        self.wait_for(lambda: sum(job.state == RUNNING for job in jobs) == 2)
+        self.manager.close()
+        self.fake.gate.set()
+        self.assertFalse(self.manager.wait(jobs))       # returns instead of hanging
+        self.assertEqual([job.state for job in jobs], [PAUSED] * 4)
+        self.assertFalse(self.manager.resume(jobs[0].job_id))
+        with self.assertRaises(RuntimeError):
+            self.manager.submit("e", self.peers)
+
+    def test_stats(self):
+        self.fake.gate.clear()
+        self.manager.submit_batch(["a", "b", "c"], self.peers)
+        self.wait_for(lambda: self.manager.get_stats()["active"] == 2)
+        stats = self.manager.get_stats()
+        self.assertEqual(stats["states"], {RUNNING: 2, QUEUED: 1})
+        self.fake.gate.set()
+
+if __name__ == "__main__":
+    unittest.main()
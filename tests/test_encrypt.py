@@ -0,0 +1,120 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import unittest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from encryption_module.encrypt import (
+    BLOCK_SIZE,
+    STREAM_HEADER_SIZE,
+    TAG_SIZE,
+    StreamDecryptor,
+    decrypt_stream,
+    encrypt_stream,
+    generate_key,
+    pad,
+)
+from encryption_module.parallel_encrypt import decrypt_stream_parallel, encrypt_stream_parallel
+
+CHUNK = 1024
+PREFIX = b"\x01" * 8
+
+def encrypt(data, key, chunk_size=CHUNK, nonce_prefix=None):
+    out = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), out, key, chunk_size, nonce_prefix)
+    return out.getvalue()
+
+def decrypt(blob, key):
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(blob), out, key)
+    return out.getvalue()
+
+def records(blob, chunk_size=CHUNK):
+    size = chunk_size + TAG_SIZE
+    body = blob[STREAM_HEADER_SIZE:]
+    return blob[:STREAM_HEADER_SIZE], [body[i:i + size] for i in range(0, len(body), size)]
+
+class ChunkedContainerTest(unittest.TestCase):
+    def setUp(self):
+        self.key = generate_key()
+        self.data = os.urandom(CHUNK * 3 + 100)
+
+    def test_round_trip(self):
+        for size in (0, 1, CHUNK, CHUNK * 3, len(self.data)):
+            with self.subTest(size=size):
+                self.assertEqual(decrypt(encrypt(self.data[:size], self.key), self.key), self.data[:size])
+
+    def test_incremental_decrypt_in_small_pieces(self):
+        blob = encrypt(self.data, self.key)
+        decryptor = StreamDecryptor(self.key)
+        out = b"".join(decryptor.update(blob[i:i + 7]) for i in range(0, len(blob), 7))
+        self.assertEqual(out + decryptor.finalize(), self.data)
+        self.assertFalse(decryptor.legacy)
+
+    def test_truncation_at_record_boundary_is_detected(self):
+        header, recs = records(encrypt(self.data, self.key))
+        for keep in range(len(recs)):
+            with self.subTest(records=keep):
+                with self.assertRaises(ValueError):
+                    decrypt(header + b"".join(recs[:keep]), self.key)
+
+    def test_reordered_records_are_detected(self):
+        header, recs = records(encrypt(self.data, self.key))
+        recs[0], recs[1] = recs[1], recs[0]
+        with self.assertRaises(ValueError):
+            decrypt(header + b"".join(recs), self.key)
+
+    def test_records_swapped_between_files_are_detected(self):
+        header_a, recs_a = records(encrypt(self.data, self.key))
+        _, recs_b = records(encrypt(os.urandom(len(self.data)), self.key))
+        recs_a[1] = recs_b[1]
+        with self.assertRaises(ValueError):
+            decrypt(header_a + b"".join(recs_a), self.key)
+
+    def test_flipped_bit_is_detected(self):
+        blob = bytearray(encrypt(self.data, self.key))
+        blob[STREAM_HEADER_SIZE + 5] ^= 1
+        with self.assertRaises(ValueError):
+            decrypt(bytes(blob), self.key)
+
+    def test_fixed_nonce_prefix_is_deterministic(self):
+        self.assertEqual(encrypt(self.data, self.key, nonce_prefix=PREFIX),
+                         encrypt(self.data, self.key, nonce_prefix=PREFIX))
+        self.assertNotEqual(encrypt(self.data, self.key), encrypt(self.data, self.key))
+
+    def test_legacy_cbc_blob_still_decrypts(self):
+        iv = os.urandom(BLOCK_SIZE)
+        encryptor = Cipher(algorithms.AES(self.key), modes.CBC(iv)).encryptor()
+        blob = iv + encryptor.update(pad(self.data)) + encryptor.finalize()
+        decryptor = StreamDecryptor(self.key)
+        out = decryptor.update(blob) + decryptor.finalize()
+        self.assertTrue(decryptor.legacy)
+        self.assertEqual(out, self.data)
+
+class ParallelEncryptTest(unittest.TestCase):
+    def setUp(self):
+        self.key = generate_key()
+
+    def test_parallel_output_matches_serial(self):
+        # Spans several worker segments plus a partial final record.
+        for data in (b"", os.urandom(CHUNK * 40 + 17), os.urandom(CHUNK * 32)):
+            with self.subTest(size=len(data)):
+                parallel = io.BytesIO()
+                encrypt_stream_parallel(io.BytesIO(data), parallel, self.key, workers=4,
+                                        chunk_size=CHUNK, nonce_prefix=PREFIX)
+                self.assertEqual(parallel.getvalue(), encrypt(data, self.key, nonce_prefix=PREFIX))
+
+    def test_parallel_decrypt_round_trip(self):
+        data = os.urandom(CHUNK * 40 + 17)
+        out = io.BytesIO()
+        decrypt_stream_parallel(io.BytesIO(encrypt(data, self.key)), out, self.key, workers=4)
+        self.assertEqual(out.getvalue(), data)
+
+    def test_parallel_decrypt_detects_truncation(self):
+        header, recs = records(encrypt(os.urandom(CHUNK * 40), self.key))
+        with self.assertRaises(ValueError):
+            decrypt_stream_parallel(io.BytesIO(header + b"".join(recs[:-1])), io.BytesIO(), self.key, workers=4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from P2P_connection_module.heartbeat import (
+    MAX_BATCH,
+    MAX_CLOCK_SKEW,
+    HeartbeatSender,
+    HeartbeatVerifier,
+    encode_heartbeats,
+    open_receiver,
+)
+
+SECRET = b"test-secret"
+PEERS = [("10.0.0.1", 10001), ("192.168.1.20", 65535)]
+NOW = 1_700_000_000.0
+
+class HeartbeatVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.verifier = HeartbeatVerifier(SECRET)
+
+    def test_authentic_datagram_is_accepted(self):
+        self.assertEqual(self.verifier.verify(encode_heartbeats(SECRET, PEERS, NOW), NOW), PEERS)
+
+    def test_wrong_secret_is_rejected(self):
+        self.assertIsNone(self.verifier.verify(encode_heartbeats(b"other", PEERS, NOW), NOW))
+        self.assertEqual(self.verifier.rejected, 1)
+
+    def test_tampered_datagram_is_rejected(self):
+        datagram = bytearray(encode_heartbeats(SECRET, PEERS, NOW))
+        for at in (0, 5, len(datagram) - 20, len(datagram) - 1):
+            with self.subTest(byte=at):
+                tampered = bytearray(datagram)
+                tampered[at] ^= 1
+                self.assertIsNone(self.verifier.verify(bytes(tampered), NOW))
+
+    def test_truncated_datagram_is_rejected(self):
+        datagram = encode_heartbeats(SECRET, PEERS, NOW)
+        self.assertIsNone(self.verifier.verify(datagram[:-1], NOW))
+        self.assertIsNone(self.verifier.verify(datagram[:10], NOW))
+
+    def test_replay_is_rejected(self):
+        datagram = encode_heartbeats(SECRET, PEERS, NOW)
+        self.assertEqual(self.verifier.verify(datagram, NOW), PEERS)
+        self.assertIsNone(self.verifier.verify(datagram, NOW + 1))
+        # A fresh datagram for the same peers is not a replay.
+        self.assertEqual(self.verifier.verify(encode_heartbeats(SECRET, PEERS, NOW + 1), NOW + 1), PEERS)
+
+    def test_replay_after_pruning_is_still_stale(self):
+        datagram = encode_heartbeats(SECRET, PEERS, NOW)
+        self.verifier.verify(datagram, NOW)
+        later = NOW + 3 * MAX_CLOCK_SKEW
+        self.verifier.verify(encode_heartbeats(SECRET, PEERS, later), later)   # prunes
+        self.assertIsNone(self.verifier.verify(datagram, later))
+
+    def test_clock_skew_window(self):
+        self.assertIsNotNone(self.verifier.verify(encode_heartbeats(SECRET, PEERS, NOW - MAX_CLOCK_SKEW + 1), NOW))
+        self.assertIsNone(self.verifier.verify(encode_heartbeats(SECRET, PEERS, NOW - MAX_CLOCK_SKEW - 1), NOW))
+        self.assertIsNone(self.verifier.verify(encode_heartbeats(SECRET, PEERS, NOW + MAX_CLOCK_SKEW + 1), NOW))
+
+    def test_batch_limits(self):
+        with self.assertRaises(ValueError):
+            encode_heartbeats(SECRET, [])
+        with self.assertRaises(ValueError):
+            encode_heartbeats(SECRET, PEERS * MAX_BATCH)
+        batch = [("10.0.0.1", 10000 + i) for i in range(MAX_BATCH)]
+        self.assertEqual(self.verifier.verify(encode_heartbeats(SECRET, batch, NOW), NOW), batch)
+
+class HeartbeatSenderTest(unittest.TestCase):
+    def test_large_batches_are_split(self):
+        receiver = open_receiver("127.0.0.1", 0)
+        sender = HeartbeatSender(receiver.getsockname(), SECRET)
+        self.addCleanup(receiver.close)
+        self.addCleanup(sender.close)
+        receiver.settimeout(2)
+        peers = [("10.0.0.1", 10000 + i) for i in range(MAX_BATCH + 5)]
+        sender.send(peers)
+        verifier = HeartbeatVerifier(SECRET)
+        received = []
+        for _ in range(2):
+            received += verifier.verify(receiver.recv(65536))
+        self.assertEqual(received, peers)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import base64
+import unittest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import serialization
+from encryption_module.key_wrap import (
+    SCHEME_RSA_OAEP,
+    SCHEME_X25519,
+    PublicKeyCache,
+    generate_keypair,
+    parse_access_entry,
+    unwrap_file_key,
+    wrap_file_key,
+    wrap_for_recipients,
+)
+
+FILE_KEY = bytes(range(32))
+
+def public_pem(public_key):
+    return public_key.public_bytes(serialization.Encoding.PEM,
+                                   serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+class KeyWrapTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rsa_private, cls.rsa_public = generate_keypair(SCHEME_RSA_OAEP)
+        cls.x_private, cls.x_public = generate_keypair(SCHEME_X25519)
+
+    def test_x25519_round_trip(self):
+        entry = wrap_file_key(self.x_public, FILE_KEY)
+        self.assertEqual(entry["scheme"], SCHEME_X25519)
+        self.assertEqual(unwrap_file_key(self.x_private, entry), FILE_KEY)
+
+    def test_x25519_wraps_are_randomized(self):
+        self.assertNotEqual(wrap_file_key(self.x_public, FILE_KEY), wrap_file_key(self.x_public, FILE_KEY))
+
+    def test_x25519_wrong_recipient_fails(self):
+        other_private, _ = generate_keypair(SCHEME_X25519)
+        with self.assertRaises(InvalidTag):
+            unwrap_file_key(other_private, wrap_file_key(self.x_public, FILE_KEY))
+
+    def test_x25519_tampered_entry_fails(self):
+        scheme, wrapped = parse_access_entry(wrap_file_key(self.x_public, FILE_KEY))
+        tampered = bytearray(wrapped)
+        tampered[-1] ^= 1
+        entry = {"scheme": scheme, "wrapped": base64.b64encode(bytes(tampered)).decode()}
+        with self.assertRaises(InvalidTag):
+            unwrap_file_key(self.x_private, entry)
+
+    def test_rsa_round_trip(self):
+        entry = wrap_file_key(self.rsa_public, FILE_KEY)
+        self.assertEqual(entry["scheme"], SCHEME_RSA_OAEP)
+        self.assertEqual(unwrap_file_key(self.rsa_private, entry), FILE_KEY)
+
+    def test_legacy_bare_base64_entry_is_rsa(self):
+        legacy = wrap_file_key(self.rsa_public, FILE_KEY)["wrapped"]
+        self.assertEqual(parse_access_entry(legacy)[0], SCHEME_RSA_OAEP)
+        self.assertEqual(unwrap_file_key(self.rsa_private, legacy), FILE_KEY)
+
+    def test_scheme_and_key_mismatch_is_reported(self):
+        with self.assertRaises(ValueError):
+            unwrap_file_key(self.x_private, wrap_file_key(self.rsa_public, FILE_KEY))
+        with self.assertRaises(ValueError):
+            unwrap_file_key(self.rsa_private, {"scheme": "nope", "wrapped": ""})
+
+    def test_mixed_recipients(self):
+        recipients = {
+            "rsa-user": public_pem(self.rsa_public),
+            "broken": "not a pem",
+            "x-user": public_pem(self.x_public),
+        }
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                access, failures = wrap_for_recipients(FILE_KEY, recipients, workers=workers)
+                self.assertEqual(list(access), ["rsa-user", "x-user"])
+                self.assertEqual(list(failures), ["broken"])
+                self.assertEqual(unwrap_file_key(self.rsa_private, access["rsa-user"]), FILE_KEY)
+                self.assertEqual(unwrap_file_key(self.x_private, access["x-user"]), FILE_KEY)
+
+class PublicKeyCacheTest(unittest.TestCase):
+    def test_new_key_for_same_user_is_not_stale(self):
+        cache = PublicKeyCache(max_size=2)
+        first = public_pem(generate_keypair(SCHEME_X25519)[1])
+        second = public_pem(generate_keypair(SCHEME_X25519)[1])
+        key = cache.get("alice", first)
+        self.assertIs(cache.get("alice", first), key)
+        self.assertEqual(public_pem(cache.get("alice", second)), second)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_lru_is_bounded(self):
+        cache = PublicKeyCache(max_size=2)
+        for name in ("a", "b", "c"):
+            cache.get(name, public_pem(generate_keypair(SCHEME_X25519)[1]))
+        self.assertEqual(len(cache.keys), 2)
+
+if __name__ == "__main__":
+    unittest.main()
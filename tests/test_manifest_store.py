@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import threading
+import unittest
+from file_sharing_module.manifest_store import ManifestStore
+
+def entry(filename, file_hash, recipients=("alice",)):
+    return {"filename": filename, "hash": file_hash, "shared_at": "2024-01-01T00:00:00",
+            "access": {name: f"wrapped-for-{name}" for name in recipients}}
+
+class ManifestStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "manifest.db")
+        self.store = ManifestStore(self.db_path, legacy_json=None)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_entries_keep_their_shape(self):
+        e = entry("a.txt", "h1", ("alice", "bob"))
+        self.store.add(e)
+        self.assertEqual(self.store.get("a.txt"), e)
+        self.assertIsNone(self.store.get("missing.txt"))
+
+    def test_newest_entry_for_a_name_wins(self):
+        self.store.add(entry("a.txt", "h1"))
+        self.store.add(entry("a.txt", "h2"))
+        self.assertEqual(self.store.get("a.txt")["hash"], "h2")
+        self.assertEqual(len(self.store), 2)
+
+    def test_lookups_by_hash_and_recipient(self):
+        self.store.add(entry("a.txt", "h1", ("alice",)))
+        self.store.add(entry("b.txt", "h1", ("bob",)))
+        self.store.add(entry("c.txt", "h2", ("alice", "bob")))
+        self.assertEqual([e["filename"] for e in self.store.find_by_hash("h1")], ["a.txt", "b.txt"])
+        self.assertEqual([e["filename"] for e in self.store.shared_with("alice")], ["a.txt", "c.txt"])
+        self.assertEqual(self.store.count_by_hash("h1"), 2)
+
+    def test_update_replaces_access(self):
+        entry_id = self.store.add(entry("a.txt", "h1", ("alice",)))
+        self.store.update(entry_id, entry("a.txt", "h1", ("bob",)))
+        self.assertEqual(self.store.shared_with("alice"), [])
+        self.assertEqual([e["filename"] for e in self.store.shared_with("bob")], ["a.txt"])
+
+    def test_remove_reports_orphaned_content(self):
+        first = self.store.add(entry("a.txt", "h1"))
+        second = self.store.add(entry("b.txt", "h1"))
+        orphaned = []
+        self.assertTrue(self.store.remove(first, orphaned.append))
+        self.assertEqual(orphaned, [])
+        self.assertTrue(self.store.remove(second, orphaned.append))
+        self.assertEqual(orphaned, ["h1"])
+        self.assertFalse(self.store.remove(second, orphaned.append))
+        self.assertEqual(self.store.shared_with("alice"), [])
+
+    def test_failed_transaction_rolls_back(self):
+        with self.assertRaises(KeyError):
+            self.store.replace_all([entry("a.txt", "h1"), {"hash": "no filename"}])
+        self.assertEqual(len(self.store), 0)
+
+    def test_legacy_json_imported_once(self):
+        legacy = os.path.join(self.tmp.name, "shared_manifest.json")
+        with open(legacy, "w") as f:
+            json.dump([entry("a.txt", "h1"), entry("b.txt", "h2")], f)
+        path = os.path.join(self.tmp.name, "imported.db")
+        for _ in range(2):
+            store = ManifestStore(path, legacy_json=legacy)
+            self.assertEqual(len(store), 2)
+            store.close()
+
+    def test_export_round_trips(self):
+        self.store.add(entry("a.txt", "h1"))
+        out = os.path.join(self.tmp.name, "export.json")
+        self.store.export_json(out)
+        other = ManifestStore(os.path.join(self.tmp.name, "other.db"), legacy_json=None)
+        self.addCleanup(other.close)
+        other.import_json(out)
+        self.assertEqual(other.all(), self.store.all())
+
+    def test_concurrent_writers_from_two_connections(self):
+        other = ManifestStore(self.db_path, legacy_json=None)
+        self.addCleanup(other.close)
+
+        def add_many(store, prefix):
+            for i in range(50):
+                store.add(entry(f"{prefix}{i}", f"{prefix}{i}"))
+        threads = [threading.Thread(target=add_many, args=(s, p)) for s, p in ((self.store, "x"), (other, "y"))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.store), 100)
+
+if __name__ == "__main__":
+    unittest.main()
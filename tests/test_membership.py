@@ -0,0 +1,137 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest import mock
+from P2P_connection_module.membership import MembershipLog
+from P2P_connection_module.peer_discovery import PeerDiscovery
+
+def peer(i):
+    return ("10.0.0.1", 10000 + i)
+
+def key(i):
+    return f"10.0.0.1:{10000 + i}"
+
+def parse(reply):
+    return reply.decode().split("|", 3)
+
+class MembershipLogTest(unittest.TestCase):
+    def setUp(self):
+        self.log = MembershipLog(page_size=3, max_log=10)
+
+    def test_joins_and_leaves_bump_the_version(self):
+        start = self.log.version
+        self.assertTrue(self.log.join(peer(1)))
+        self.assertFalse(self.log.join(peer(1)))      # heartbeat of a known peer
+        self.assertTrue(self.log.leave(peer(1)))
+        self.assertFalse(self.log.leave(peer(1)))
+        self.assertEqual(self.log.version, start + 2)
+
+    def test_delta_since_current_version_is_empty(self):
+        self.log.join(peer(1))
+        self.assertEqual(self.log.delta(self.log.version), f"DELTA|{self.log.version}|0|".encode())
+
+    def test_delta_lists_changes_in_order(self):
+        since = self.log.version
+        self.log.join(peer(1))
+        self.log.join(peer(2))
+        self.log.leave(peer(1))
+        self.assertEqual(parse(self.log.delta(since)), ["DELTA", str(since + 3), "0", f"+{key(1)},+{key(2)},-{key(1)}"])
+
+    def test_delta_is_paged(self):
+        since = self.log.version
+        for i in range(5):
+            self.log.join(peer(i))
+        _, reached, more, changes = parse(self.log.delta(since))
+        self.assertEqual((int(reached), more, len(changes.split(","))), (since + 3, "1", 3))
+        _, reached, more, changes = parse(self.log.delta(int(reached)))
+        self.assertEqual((int(reached), more, changes), (since + 5, "0", f"+{key(3)},+{key(4)}"))
+
+    def test_delta_outside_log_is_refused(self):
+        since = self.log.version
+        for i in range(12):
+            self.log.join(peer(i))
+        self.assertIsNone(self.log.delta(since))          # log no longer reaches back
+        self.assertIsNone(self.log.delta(self.log.version + 1))   # from before a registry restart
+        self.assertIsNotNone(self.log.delta(self.log.version - 10))
+
+    def test_snapshot_pages_cover_every_member(self):
+        for i in range(8):
+            self.log.join(peer(i))
+        seen, cursor, pages = [], "", 0
+        while True:
+            _, version, cursor, peers = parse(self.log.page(cursor))
+            seen += peers.split(",")
+            pages += 1
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), sorted(key(i) for i in range(8)))
+
+    def test_churn_between_pages_skips_nobody(self):
+        for i in range(6):
+            self.log.join(peer(i))
+        _, _, cursor, first = parse(self.log.page())
+        self.log.leave(peer(0))                            # before the cursor
+        _, _, _, second = parse(self.log.page(cursor))
+        self.assertEqual(sorted(first.split(",") + second.split(",")), sorted(key(i) for i in range(6)))
+
+    def test_getpeers_dispatch(self):
+        self.log.join(peer(1))
+        legacy = mock.Mock(return_value=b"legacy")
+        self.assertEqual(self.log.handle_getpeers("GETPEERS", legacy), b"legacy")
+        self.assertTrue(self.log.handle_getpeers(f"GETPEERS since={self.log.version}", legacy).startswith(b"DELTA|"))
+        self.assertTrue(self.log.handle_getpeers("GETPEERS since=0", legacy).startswith(b"SNAPSHOT|"))
+        self.assertTrue(self.log.handle_getpeers("GETPEERS since=junk", legacy).startswith(b"SNAPSHOT|"))
+        self.assertTrue(self.log.handle_getpeers(f"GETPEERS after={key(0)}", legacy).startswith(b"SNAPSHOT|"))
+
+class SyncPeersTest(unittest.TestCase):
+    def setUp(self):
+        self.log = MembershipLog(page_size=3, max_log=10)
+        self.calls = []
+        self.discovery = PeerDiscovery()
+
+        def registry_call(command):
+            self.calls.append(command)
+            return self.log.handle_getpeers(command, lambda: b"").decode()
+        self.discovery.registry_call = registry_call
+
+    def members(self):
+        return sorted(self.log.members)
+
+    def test_first_sync_pages_a_snapshot(self):
+        for i in range(7):
+            self.log.join(peer(i))
+        self.assertEqual(self.discovery.sync_peers(), self.members())
+        self.assertEqual(self.discovery.peer_version, self.log.version)
+
+    def test_later_syncs_fetch_only_deltas(self):
+        for i in range(4):
+            self.log.join(peer(i))
+        self.discovery.sync_peers()
+        self.log.leave(peer(0))
+        self.log.join(peer(9))
+        self.calls.clear()
+        self.assertEqual(self.discovery.sync_peers(), self.members())
+        self.assertEqual(self.calls, [f"GETPEERS since={self.log.version - 2}"])
+
+    def test_client_too_far_behind_resyncs(self):
+        self.log.join(peer(0))
+        self.discovery.sync_peers()
+        for i in range(1, 15):
+            self.log.join(peer(i))
+        self.log.leave(peer(0))
+        self.assertEqual(self.discovery.sync_peers(), self.members())
+        self.assertTrue(any("after=" in call for call in self.calls))
+
+    def test_error_reply_keeps_the_cache(self):
+        self.log.join(peer(0))
+        self.discovery.sync_peers()
+        self.discovery.registry_call = lambda command: "UNKNOWN_COMMAND"
+        with self.assertRaises(ConnectionError):
+            self.discovery.sync_peers()
+        self.assertEqual(sorted(self.discovery.peer_cache), self.members())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import tempfile
+import unittest
+from file_sharing_module.merkle import (
+    MerkleVerifyingReader,
+    decode_leaves_reply,
+    encode_leaves_reply,
+    hash_leaves,
+    leaf_hash,
+    load_leaves,
+    merkle_root,
+    node_hash,
+    save_leaves,
+    verify_file_range,
+    verify_leaf,
+)
+
+LEAF = 1000
+
+def leaves_of(data, leaf_size=LEAF):
+    return [leaf_hash(data[i:i + leaf_size]) for i in range(0, len(data), leaf_size)]
+
+class MerkleRootTest(unittest.TestCase):
+    def test_tree_shape(self):
+        a, b, c = (leaf_hash(x) for x in (b"a", b"b", b"c"))
+        self.assertEqual(merkle_root([]), leaf_hash(b""))
+        self.assertEqual(merkle_root([a]), a)
+        self.assertEqual(merkle_root([a, b]), node_hash(a, b))
+        # An odd node is promoted unchanged.
+        self.assertEqual(merkle_root([a, b, c]), node_hash(node_hash(a, b), c))
+
+    def test_leaf_and_node_hashes_are_domain_separated(self):
+        a, b = leaf_hash(b"a"), leaf_hash(b"b")
+        self.assertNotEqual(leaf_hash(a + b), node_hash(a, b))
+
+    def test_root_changes_with_any_leaf_or_order(self):
+        leaves = leaves_of(os.urandom(LEAF * 5))
+        root = merkle_root(leaves)
+        for i in range(len(leaves)):
+            changed = list(leaves)
+            changed[i] = leaf_hash(b"x")
+            self.assertNotEqual(merkle_root(changed), root)
+        self.assertNotEqual(merkle_root(leaves[1:] + leaves[:1]), root)
+
+class LeafListTest(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(LEAF * 4 + 10)
+        self.leaves = leaves_of(self.data)
+        self.merkle = {"root": merkle_root(self.leaves).hex(), "leaf_size": LEAF}
+
+    def test_parallel_hashing_matches(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(self.data)
+            f.flush()
+            self.assertEqual(hash_leaves(f.name, LEAF, workers=3), self.leaves)
+
+    def test_sidecar_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "blob.merkle")
+            self.assertIsNone(load_leaves(path))
+            save_leaves(path, self.leaves, LEAF)
+            self.assertEqual(load_leaves(path), (LEAF, self.leaves))
+
+    def test_reply_checked_against_manifest_root(self):
+        reply = encode_leaves_reply(LEAF, self.leaves)
+        self.assertEqual(decode_leaves_reply(reply, self.merkle), self.leaves)
+
+    def test_forged_leaf_list_is_rejected(self):
+        forged = list(self.leaves)
+        forged[2] = leaf_hash(b"forged")
+        cases = {
+            "forged leaf": encode_leaves_reply(LEAF, forged),
+            "missing leaf": encode_leaves_reply(LEAF, self.leaves[:-1]),
+            "other leaf size": encode_leaves_reply(LEAF * 2, self.leaves),
+            "truncated digest": encode_leaves_reply(LEAF, self.leaves)[:-1],
+            "not a leaf list": b"FILE_NOT_FOUND",
+        }
+        for name, reply in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    decode_leaves_reply(reply, self.merkle)
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(LEAF * 4 + 10)
+        self.leaves = leaves_of(self.data)
+
+    def test_verify_leaf(self):
+        verify_leaf(self.leaves, 1, self.data[LEAF:2 * LEAF])
+        with self.assertRaises(ValueError):
+            verify_leaf(self.leaves, 1, self.data[:LEAF])
+        with self.assertRaises(ValueError):
+            verify_leaf(self.leaves, 9, b"")
+
+    def test_verify_file_range_stops_at_first_bad_leaf(self):
+        tampered = bytearray(self.data)
+        tampered[2 * LEAF + 7] ^= 1
+        f = io.BytesIO(bytes(tampered))
+        size = len(self.data)
+        self.assertEqual(verify_file_range(f, self.leaves, LEAF, 0, 2 * LEAF, size), ((0, 2 * LEAF), None))
+        self.assertEqual(verify_file_range(f, self.leaves, LEAF, 0, size, size), ((0, 2 * LEAF), 2))
+        # The short last leaf only counts once the file end is reached.
+        self.assertEqual(verify_file_range(f, self.leaves, LEAF, 3 * LEAF, size, size), ((3 * LEAF, size), None))
+        self.assertEqual(verify_file_range(f, self.leaves, LEAF, 4 * LEAF, size - 5, size), ((4 * LEAF, 4 * LEAF), None))
+
+    def read_all(self, data, read_size):
+        reader = MerkleVerifyingReader(io.BytesIO(data), self.leaves, LEAF)
+        out = bytearray()
+        while chunk := reader.read(read_size):
+            out += chunk
+        return bytes(out)
+
+    def test_verifying_reader_passes_intact_stream(self):
+        for read_size in (1, 333, LEAF, 10 * LEAF):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(self.read_all(self.data, read_size), self.data)
+
+    def test_verifying_reader_fails_at_the_bad_leaf(self):
+        tampered = bytearray(self.data)
+        tampered[LEAF + 1] ^= 1
+        reader = MerkleVerifyingReader(io.BytesIO(bytes(tampered)), self.leaves, LEAF)
+        reader.read(LEAF)
+        with self.assertRaisesRegex(ValueError, "Chunk 1"):
+            reader.read(LEAF)
+
+    def test_verifying_reader_detects_truncation(self):
+        with self.assertRaises(ValueError):
+            self.read_all(self.data[:3 * LEAF], LEAF)
+        with self.assertRaises(ValueError):
+            self.read_all(self.data[:-1], LEAF)
+
+if __name__ == "__main__":
+    unittest.main()
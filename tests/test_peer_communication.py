@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'P2P_connection_module')))
+
+import threading
+import unittest
+from unittest import mock
+import peer_communication
+from peer_communication import PeerCommunicator
+
+class DispatchThreadTest(unittest.TestCase):
+    def setUp(self):
+        self.communicator = PeerCommunicator(0)
+        self.threads = []
+        self.done = threading.Event()
+
+        def record(*args):
+            self.threads.append(threading.current_thread())
+            self.done.set()
+        for name in ("handle_incoming_file_request", "handle_incoming_range_request"):
+            patcher = mock.patch.object(peer_communication, name, record)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_framed_requests_run_on_the_calling_thread(self):
+        for message in ("GET_FILE|a.txt", "GET_RANGE|a.txt|0|10"):
+            self.communicator.dispatch_message(message, None, ("127.0.0.1", 1), background=False)
+        self.assertEqual(self.threads, [threading.current_thread()] * 2)
+
+    def test_legacy_requests_get_their_own_thread(self):
+        self.communicator.dispatch_message("GET_FILE|a.txt", None, ("127.0.0.1", 1))
+        self.assertTrue(self.done.wait(2))
+        self.assertIsNot(self.threads[0], threading.current_thread())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from P2P_connection_module.protocol import FramedConnection, serve_framed
+from file_sharing_module.upload_engine import stream_file
+
+BIG_FRAMES = 200
+FRAME_SIZE = 64 * 1024
+FILE_DATA = os.urandom(9 * 1024 * 1024 + 123)
+methods = []
+
+def handle_request(command, reply):
+    def run():
+        try:
+            if command == "BIG":
+                for _ in range(BIG_FRAMES):
+                    reply.sendall(b"x" * FRAME_SIZE)
+            elif command.startswith("FILE|"):
+                _, path, offset = command.split("|")
+                with open(path, "rb") as f:
+                    methods.append(stream_file(reply, f, int(offset))[1])
+            else:
+                reply.sendall(command.encode())
+        except ConnectionAbortedError:
+            pass
+        finally:
+            reply.close()
+    threading.Thread(target=run, daemon=True).start()
+
+class EarlyCloseTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+
+        def accept():
+            conn, _ = self.listener.accept()
+            serve_framed(conn, handle_request)
+        threading.Thread(target=accept, daemon=True).start()
+        self.conn = FramedConnection.connect(self.listener.getsockname(), timeout=5)
+
+    def tearDown(self):
+        self.conn.close()
+        self.listener.close()
+
+    def test_request_after_early_close(self):
+        # The big response fills the stream's window; closing it early must
+        # not leave the shared reader blocked on it.
+        with self.conn.request("BIG") as stream:
+            self.assertEqual(stream.read(10), b"x" * 10)
+            time.sleep(0.2)  # let the reader fill the window
+        self.assertEqual(self.conn.call("ECHO"), b"ECHO")
+
+    def test_file_over_frames_is_zero_copy(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(FILE_DATA)
+            f.flush()
+            self.assertEqual(self.conn.call(f"FILE|{f.name}|0"), FILE_DATA)
+            self.assertEqual(self.conn.call(f"FILE|{f.name}|1000"), FILE_DATA[1000:])
+        self.assertEqual(methods[-2:], ["sendfile", "sendfile"])
+        # The connection is still in sync afterwards.
+        self.assertEqual(self.conn.call("ECHO"), b"ECHO")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import unittest
+from unittest import mock
+from file_sharing_module import fileTransfer as ft
+from file_sharing_module.fileTransfer import merge_ranges, missing_ranges
+
+SEGMENT = 1000
+
+class RangeBookkeepingTest(unittest.TestCase):
+    def test_merge_ranges(self):
+        self.assertEqual(merge_ranges([[50, 60], [0, 10], [10, 20], [15, 30]]), [[0, 30], [50, 60]])
+
+    def test_missing_ranges_split_into_segments(self):
+        self.assertEqual(missing_ranges([], 2500, SEGMENT), [(0, 1000), (1000, 1000), (2000, 500)])
+        self.assertEqual(missing_ranges([[0, 2500]], 2500, SEGMENT), [])
+        self.assertEqual(missing_ranges([[100, 200], [1500, 2500]], 2500, SEGMENT),
+                         [(0, 100), (200, 1000), (1200, 300)])
+
+    def test_missing_ranges_of_empty_file(self):
+        self.assertEqual(missing_ranges([], 0, SEGMENT), [])
+
+class FakePeer:
+    """Stands in for request_range: serves data, optionally failing once
+    after a number of bytes."""
+
+    def __init__(self, data, fail_after=None):
+        self.data = data
+        self.fail_after = fail_after
+        self.requests = []
+
+    def request_range(self, peer_ip, port, filename, offset, length, f_out, on_data=None, conn=None):
+        self.requests.append((offset, length))
+        length = min(length, len(self.data) - offset)
+        if self.fail_after is not None and offset + length > self.fail_after:
+            cut, self.fail_after = self.fail_after, None
+            if cut > offset:
+                f_out.seek(offset)
+                f_out.write(self.data[offset:cut])
+                on_data(offset, cut - offset)
+            raise ConnectionError("connection dropped")
+        f_out.seek(offset)
+        f_out.write(self.data[offset:offset + length])
+        if on_data:
+            on_data(offset, length)
+        return length, len(self.data)
+
+class ResumeDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.part_path = os.path.join(self.tmp.name, "f.bin.part")
+        self.state_path = self.part_path + ".json"
+        self.entry = {"hash": "h1"}
+        self.data = os.urandom(3500)
+        for patcher in (
+            mock.patch.object(ft, "DOWNLOAD_DIR", self.tmp.name),
+            mock.patch.object(ft, "RANGE_SEGMENT_SIZE", SEGMENT),
+            mock.patch.object(ft, "resolve_file_key", lambda filename, session: (self.entry, None)),
+            mock.patch.object(ft, "probe_file_size", lambda *a: len(self.data)),
+            mock.patch.object(ft, "fetch_merkle_leaves", lambda *a: None),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def resume(self, peer, max_attempts=1):
+        with mock.patch.object(ft, "request_range", peer.request_range):
+            return ft.resume_download("127.0.0.1", 1, "f.bin", None, max_attempts=max_attempts)
+
+    def downloaded(self):
+        with open(os.path.join(self.tmp.name, "f.bin"), "rb") as f:
+            return f.read()
+
+    def write_partial(self, done, size=None, file_hash="h1"):
+        with open(self.part_path, "wb") as f:
+            f.write(bytes(len(self.data)))
+            for start, end in done:
+                f.seek(start)
+                f.write(self.data[start:end])
+        with open(self.state_path, "w") as f:
+            json.dump({"size": size or len(self.data), "hash": file_hash, "done": done}, f)
+
+    def test_fresh_download(self):
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(peer.requests, [(0, 1000), (1000, 1000), (2000, 1000), (3000, 500)])
+        self.assertEqual(self.downloaded(), self.data)
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_resume_fetches_only_missing_ranges(self):
+        self.write_partial([[0, 1200], [2000, 3000]])
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(peer.requests, [(1200, 800), (3000, 500)])
+        self.assertEqual(self.downloaded(), self.data)
+
+    def test_stale_state_for_other_content_is_ignored(self):
+        self.write_partial([[0, 3500]], file_hash="old")
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(peer.requests[0], (0, 1000))
+        self.assertEqual(self.downloaded(), self.data)
+
+    def test_stale_state_for_other_size_is_ignored(self):
+        self.write_partial([[0, 1000]], size=9999)
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(len(peer.requests), 4)
+
+    def test_state_without_part_file_is_ignored(self):
+        self.write_partial([[0, 3500]])
+        os.remove(self.part_path)
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(len(peer.requests), 4)
+        self.assertEqual(self.downloaded(), self.data)
+
+    def test_interrupted_range_is_checkpointed(self):
+        peer = FakePeer(self.data, fail_after=1500)
+        self.assertFalse(self.resume(peer))
+        with open(self.state_path) as f:
+            self.assertEqual(json.load(f)["done"], [[0, 1500]])
+        peer.requests.clear()
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(peer.requests[0], (1500, 1000))
+        self.assertEqual(self.downloaded(), self.data)
+
+    def test_retries_within_one_call(self):
+        peer = FakePeer(self.data, fail_after=1500)
+        self.assertTrue(self.resume(peer, max_attempts=2))
+        self.assertEqual(self.downloaded(), self.data)
+
+    def test_empty_file(self):
+        self.data = b""
+        peer = FakePeer(self.data)
+        self.assertTrue(self.resume(peer))
+        self.assertEqual(peer.requests, [])
+        self.assertEqual(self.downloaded(), b"")
+
+if __name__ == "__main__":
+    unittest.main()
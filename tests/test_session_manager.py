@@ -0,0 +1,109 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+import unittest
+from unittest import mock
+from user_management_module import session_manager
+from user_management_module.session_manager import Session, SessionManager
+
+TIMEOUT = 0.3
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = SessionManager(timeout=TIMEOUT, authenticator=lambda u, p: Session(u, b"k"))
+        self.expired = []
+        self.expired_event = threading.Event()
+
+        @self.manager.on_expire
+        def record(session):
+            self.expired.append(session.username)
+            self.expired_event.set()
+        patcher = mock.patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_idle_session_expires(self):
+        session = Session("alice", b"k")
+        session.cache_file_key("h", b"d", b"key")
+        session_id = self.manager.add(session)
+        self.assertTrue(self.expired_event.wait(2))
+        self.assertEqual(self.expired, ["alice"])
+        self.assertIsNone(self.manager.get(session_id))
+        self.assertEqual(session.file_keys, {})
+
+    def test_activity_pushes_expiry_back(self):
+        session_id = self.manager.add(Session("alice", b"k"))
+        for _ in range(5):
+            time.sleep(TIMEOUT / 3)
+            self.assertTrue(self.manager.touch(session_id))
+        self.assertEqual(self.expired, [])
+        self.assertTrue(self.expired_event.wait(2))
+        self.assertFalse(self.manager.touch(session_id))
+
+    def test_earlier_deadline_wakes_the_timer(self):
+        long_manager = SessionManager(timeout=60, authenticator=lambda u, p: None)
+        self.addCleanup(long_manager.close)
+        expired = threading.Event()
+        long_manager.on_expire(lambda session: expired.set())
+        long_manager.add(Session("late", b"k"))
+        early = Session("early", b"k")
+        early.last_active = time.time() - 59.8
+        early_id = long_manager.add(early)
+        self.assertTrue(expired.wait(2))
+        self.assertIsNone(long_manager.get(early_id))
+        self.assertEqual(len(long_manager), 1)
+
+    def test_logout_removes_session(self):
+        session_id = self.manager.add(Session("alice", b"k"))
+        self.assertTrue(self.manager.logout(session_id))
+        self.assertFalse(self.manager.logout(session_id))
+        time.sleep(TIMEOUT * 2)
+        self.assertEqual(self.expired, [])
+
+    def test_login_registers_the_session(self):
+        session = self.manager.login("bob", "pw").result(2)
+        self.assertEqual(session.username, "bob")
+        self.assertIs(self.manager.get(session.session_id), session)
+
+    def test_many_sessions_expire(self):
+        ids = [self.manager.add(Session(f"user{i}", b"k")) for i in range(50)]
+        deadline = time.time() + 3
+        while len(self.manager) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(self.manager), 0)
+        self.assertEqual(sorted(self.expired), sorted(f"user{i}" for i in range(50)))
+        self.assertTrue(all(self.manager.get(i) is None for i in ids))
+
+class SessionTest(unittest.TestCase):
+    def test_inactive_session_is_expired(self):
+        session = Session("alice", b"k", timeout=10)
+        self.assertFalse(session.is_expired())
+        session.last_active -= 11
+        self.assertTrue(session.is_expired())
+
+    def test_file_key_cache(self):
+        session = Session("alice", b"k")
+        session.cache_file_key("h", b"digest", b"key")
+        self.assertEqual(session.get_file_key("h", b"digest"), b"key")
+        self.assertIsNone(session.get_file_key("h", b"other"))   # same content, different wrap
+        with mock.patch.object(session_manager, "FILE_KEY_TTL", -1):
+            session.cache_file_key("h", b"digest", b"key")
+        self.assertIsNone(session.get_file_key("h", b"digest"))
+
+    def test_private_key_loaded_once_on_demand(self):
+        loader = mock.Mock(return_value="private-key")
+        session = Session("alice", b"k", key_loader=loader)
+        loader.assert_not_called()
+        self.assertEqual(session.private_key, "private-key")
+        self.assertEqual(session.private_key, "private-key")
+        loader.assert_called_once()
+        self.assertIn("private_key_load", session.timings)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import unittest
+from file_sharing_module.swarm import ENDGAME_STALL_SECONDS, SWARM_MAX_PEER_FAILURES, ChunkScheduler
+
+CHUNKS = [(i * 1000, (i + 1) * 1000) for i in range(4)]
+A, B, C = ("10.0.0.1", 1), ("10.0.0.2", 1), ("10.0.0.3", 1)
+
+class RarestFirstTest(unittest.TestCase):
+    def test_rarest_chunk_first(self):
+        s = ChunkScheduler(CHUNKS, {A: [0, 1, 2, 3], B: [1, 2, 3], C: [2, 3]})
+        self.assertEqual(s.next_chunk(A), 0)     # only A has it
+        self.assertEqual(s.next_chunk(A), 1)     # two holders
+        self.assertEqual(s.next_chunk(C), 2)     # ties go to the lower index
+        self.assertEqual(s.next_chunk(B), 3)
+
+    def test_only_held_chunks_are_assigned(self):
+        s = ChunkScheduler(CHUNKS, {A: [0], B: [3]})
+        self.assertEqual(s.next_chunk(B), 3)
+        self.assertIsNone(s.next_chunk(B))
+        self.assertTrue(s.stuck)
+
+    def test_done_chunks_are_skipped(self):
+        s = ChunkScheduler(CHUNKS, {A: range(4)}, done=[0, 1])
+        self.assertEqual(s.next_chunk(A), 2)
+        s.complete(2, A, 1000, 0.1)
+        self.assertEqual(s.next_chunk(A), 3)
+        s.complete(3, A, 1000, 0.1)
+        self.assertTrue(s.finished)
+
+    def test_failed_chunk_goes_back_to_any_holder(self):
+        s = ChunkScheduler(CHUNKS[:1], {A: [0], B: [0]})
+        self.assertEqual(s.next_chunk(A), 0)
+        s.fail(0, A)
+        self.assertEqual(s.next_chunk(B), 0)
+
+    def test_peer_dropped_after_repeated_failures(self):
+        s = ChunkScheduler(CHUNKS, {A: range(4), B: range(4)})
+        for _ in range(SWARM_MAX_PEER_FAILURES):
+            s.fail(s.next_chunk(A), A)
+        self.assertNotIn(A, s.holdings)
+        self.assertEqual(s.pending, set(range(4)))
+
+    def test_busy_does_not_count_as_failure(self):
+        s = ChunkScheduler(CHUNKS, {A: range(4)})
+        for _ in range(SWARM_MAX_PEER_FAILURES + 1):
+            s.fail(s.next_chunk(A), A, count=False)
+        self.assertIn(A, s.holdings)
+
+class EndgameTest(unittest.TestCase):
+    def setUp(self):
+        self.s = ChunkScheduler(CHUNKS[:1], {A: [0], B: [0], C: [0]})
+        self.assertEqual(self.s.next_chunk(A), 0)
+
+    def test_faster_peer_duplicates_slow_chunk(self):
+        self.s.rates = {A: 10.0, B: 1e6}
+        self.assertEqual(self.s.next_chunk(B), 0)
+        self.assertEqual(set(self.s.in_flight[0]), {A, B})
+
+    def test_slower_peer_does_not_duplicate(self):
+        self.s.rates = {A: 1e6, B: 10.0}
+        self.assertIsNone(self.s.next_chunk(B))
+
+    def test_chunk_without_rate_waits_for_stall(self):
+        self.assertIsNone(self.s.next_chunk(B))
+        self.s.in_flight[0][A] = time.monotonic() - ENDGAME_STALL_SECONDS - 1
+        self.assertEqual(self.s.next_chunk(B), 0)
+
+    def test_fetchers_per_chunk_are_capped(self):
+        self.s.rates = {A: 1.0, B: 1e6, C: 1e7}
+        self.assertEqual(self.s.next_chunk(B), 0)
+        self.assertIsNone(self.s.next_chunk(C))
+
+    def test_first_delivery_wins(self):
+        self.s.rates = {A: 10.0, B: 1e6}
+        self.s.next_chunk(B)
+        self.assertTrue(self.s.complete(0, B, 1000, 0.01))
+        self.assertFalse(self.s.complete(0, A, 1000, 100))
+        self.assertTrue(self.s.finished)
+        self.assertEqual(self.s.in_flight, {})
+
+    def test_failure_of_one_fetcher_keeps_chunk_in_flight(self):
+        self.s.rates = {A: 10.0, B: 1e6}
+        self.s.next_chunk(B)
+        self.s.fail(0, A)
+        self.assertNotIn(0, self.s.pending)
+        self.assertEqual(set(self.s.in_flight[0]), {B})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import threading
+import time
+import unittest
+from file_sharing_module.upload_scheduler import (
+    BUSY_RETRY_MIN,
+    DRR_QUANTUM,
+    UploadBusy,
+    UploadScheduler,
+    encode_busy,
+    parse_busy,
+)
+
+MiB = 1024 * 1024
+
+class UploadSchedulerTest(unittest.TestCase):
+    def wait_for(self, predicate, timeout=3):
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.005)
+
+    def queue_in_thread(self, scheduler, peer, nbytes, order):
+        """Starts a thread that waits for a slot, records the grant and
+        releases it at once; returns once the request is queued."""
+        queued = scheduler.get_stats()["queued"]
+
+        def run():
+            with scheduler.acquire(peer, nbytes):
+                order.append(peer)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.wait_for(lambda: scheduler.get_stats()["queued"] == queued + 1)
+        return thread
+
+    def test_free_slot_is_granted_at_once(self):
+        scheduler = UploadScheduler(slots=2)
+        with scheduler.acquire("A", MiB), scheduler.acquire("B", MiB):
+            stats = scheduler.get_stats()
+            self.assertEqual((stats["active"], stats["queued"]), (2, 0))
+        self.assertEqual(scheduler.get_stats()["active"], 0)
+
+    def test_drr_does_not_let_one_peer_starve_another(self):
+        scheduler = UploadScheduler(slots=1)
+        order = []
+        holder = scheduler.acquire("X", MiB)
+        threads = [self.queue_in_thread(scheduler, "A", DRR_QUANTUM, order) for _ in range(6)]
+        threads.append(self.queue_in_thread(scheduler, "B", MiB, order))
+        holder.release()
+        for thread in threads:
+            thread.join(3)
+        self.assertEqual(sorted(order), ["A"] * 6 + ["B"])
+        # First come, first served would grant B last.
+        self.assertLessEqual(order.index("B"), 2)
+
+    def test_full_queue_replies_busy(self):
+        scheduler = UploadScheduler(slots=1, max_queued=1)
+        order = []
+        holder = scheduler.acquire("A", MiB)
+        thread = self.queue_in_thread(scheduler, "B", MiB, order)
+        with self.assertRaises(UploadBusy) as caught:
+            scheduler.acquire("C", MiB)
+        self.assertGreaterEqual(caught.exception.retry_after, BUSY_RETRY_MIN)
+        self.assertEqual(scheduler.get_stats()["rejected"], 1)
+        holder.release()
+        thread.join(3)
+        self.assertEqual(order, ["B"])
+
+    def test_per_peer_queue_limit(self):
+        scheduler = UploadScheduler(slots=1, max_queued_per_peer=1)
+        order = []
+        holder = scheduler.acquire("A", MiB)
+        thread = self.queue_in_thread(scheduler, "B", MiB, order)
+        with self.assertRaises(UploadBusy):
+            scheduler.acquire("B", MiB)
+        other = self.queue_in_thread(scheduler, "C", MiB, order)
+        holder.release()
+        for t in (thread, other):
+            t.join(3)
+        self.assertEqual(order, ["B", "C"])
+
+    def test_wait_times_out_with_busy(self):
+        scheduler = UploadScheduler(slots=1, queue_timeout=0.1)
+        with scheduler.acquire("A", MiB):
+            with self.assertRaises(UploadBusy):
+                scheduler.acquire("B", MiB)
+            stats = scheduler.get_stats()
+            self.assertEqual((stats["timed_out"], stats["queued"]), (1, 0))
+        # The abandoned request does not hold a slot.
+        with scheduler.acquire("C", MiB):
+            self.assertEqual(scheduler.get_stats()["active"], 1)
+
+    def test_async_acquire_waits_for_a_release(self):
+        scheduler = UploadScheduler(slots=1)
+
+        async def run():
+            holder = await scheduler.acquire_async("A", MiB)
+            waiter = asyncio.ensure_future(scheduler.acquire_async("B", MiB))
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiter.done())
+            holder.release()
+            slot = await asyncio.wait_for(waiter, 2)
+            slot.release()
+            return slot.peer
+        self.assertEqual(asyncio.run(run()), "B")
+
+    def test_rate_limits(self):
+        scheduler = UploadScheduler(slots=2)
+        scheduler.set_limits(peer_rate=MiB)
+        with scheduler.acquire("A", 2 * MiB) as slot:
+            self.assertEqual(slot.reserve(MiB), 0.0)           # the burst
+            self.assertAlmostEqual(slot.reserve(MiB), 1.0, delta=0.1)
+        scheduler.set_limits(global_rate=MiB)
+        with scheduler.acquire("A", MiB) as a, scheduler.acquire("B", MiB) as b:
+            self.assertEqual(a.reserve(MiB), 0.0)
+            self.assertAlmostEqual(b.reserve(MiB), 1.0, delta=0.1)
+        scheduler.set_limits()
+        with scheduler.acquire("A", MiB) as slot:
+            self.assertEqual(slot.reserve(100 * MiB), 0.0)
+
+    def test_busy_reply_round_trip(self):
+        self.assertEqual(parse_busy(encode_busy(2.5).decode()).retry_after, 2.5)
+        self.assertEqual(parse_busy("BUSY|soon\n").retry_after, BUSY_RETRY_MIN)
+        self.assertIsInstance(parse_busy("BUSY\n"), ConnectionError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import threading
+import unittest
+from user_management_module import user_directory
+from user_management_module.user_directory import UserDirectory
+
+def record(name):
+    return {"public_key": f"pk-{name}", "salt": "00"}
+
+class UserDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "userData.json")
+        with open(self.path, "w") as f:
+            json.dump({"alice": record("alice")}, f)
+        self.directory = UserDirectory(self.path, compact_after=5)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def journal_lines(self):
+        with open(self.path + ".journal") as f:
+            return f.read().splitlines()
+
+    def snapshot(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_reads_snapshot(self):
+        self.assertEqual(self.directory.get("alice"), record("alice"))
+        self.assertNotIn("bob", self.directory)
+
+    def test_writes_are_journaled_not_snapshotted(self):
+        self.assertTrue(self.directory.add("bob", record("bob")))
+        self.assertFalse(self.directory.add("bob", record("other")))
+        self.assertEqual(len(self.journal_lines()), 1)
+        self.assertNotIn("bob", self.snapshot())
+        self.assertEqual(self.directory.get("bob"), record("bob"))
+
+    def test_other_instance_replays_journal(self):
+        other = UserDirectory(self.path, compact_after=5)
+        self.assertEqual(len(other), 1)
+        self.directory.add("bob", record("bob"))
+        self.directory.remove("alice")
+        self.assertEqual(other.all(), {"bob": record("bob")})
+        self.assertEqual(self.directory.add_many({"bob": record("x"), "carol": record("carol")}), ["bob"])
+        self.assertEqual(sorted(other.usernames()), ["bob", "carol"])
+
+    def test_incomplete_journal_line_waits_for_the_rest(self):
+        self.directory.add("bob", record("bob"))
+        line = json.dumps({"op": "put", "username": "carol", "record": record("carol")})
+        with open(self.path + ".journal", "a") as f:
+            f.write(line[:10])
+        self.assertNotIn("carol", self.directory)
+        with open(self.path + ".journal", "a") as f:
+            f.write(line[10:] + "\n")
+        self.assertEqual(self.directory.get("carol"), record("carol"))
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        other = UserDirectory(self.path, compact_after=5)
+        other.get("alice")
+        for i in range(5):
+            self.directory.put(f"user{i}", record(i))
+        self.assertEqual(self.journal_lines(), [])
+        self.assertEqual(len(self.snapshot()), 6)
+        # A reader that had consumed part of the old journal reloads cleanly.
+        self.assertEqual(len(other), 6)
+        self.assertEqual(other.get("user4"), record(4))
+
+    def test_compaction_after_reader_offset_passes_new_journal(self):
+        other = UserDirectory(self.path, compact_after=100)
+        for i in range(3):
+            self.directory.put(f"user{i}", record(i))
+        self.assertEqual(len(other), 4)
+        self.directory.compact()
+        self.directory.put("late", record("late"))
+        self.assertEqual(other.get("late"), record("late"))
+        self.assertEqual(len(other), 5)
+
+    def test_replaying_journal_over_snapshot_is_harmless(self):
+        self.directory.add("bob", record("bob"))
+        journal = self.journal_lines()
+        self.directory.compact()
+        with open(self.path + ".journal", "w") as f:
+            f.write("\n".join(journal) + "\n")
+        self.assertEqual(UserDirectory(self.path).all(), {"alice": record("alice"), "bob": record("bob")})
+
+    def test_missing_files_mean_no_users(self):
+        directory = UserDirectory(os.path.join(self.tmp.name, "none.json"))
+        self.assertEqual(len(directory), 0)
+        self.assertTrue(directory.add("bob", record("bob")))
+        self.assertEqual(directory.usernames(), ["bob"])
+
+    @unittest.skipIf(user_directory.fcntl is None, "needs fcntl")
+    def test_reload_waits_for_a_writer(self):
+        other = UserDirectory(self.path)
+        other.get("alice")
+        result = []
+        reader = threading.Thread(target=lambda: result.append(other.all()), daemon=True)
+        with self.directory._write_lock():
+            # Nothing changed yet: lookups only stat the files.
+            self.assertEqual(other.get("alice"), record("alice"))
+            self.directory._write_snapshot({"bob": record("bob")})
+            reader.start()
+            reader.join(0.2)
+            self.assertEqual(result, [])
+        reader.join(2)
+        self.assertEqual(result, [{"bob": record("bob")}])
+
+    def test_replace_all(self):
+        self.directory.add("bob", record("bob"))
+        self.directory.replace_all({"carol": record("carol")})
+        self.assertEqual(UserDirectory(self.path).all(), {"carol": record("carol")})
+
+if __name__ == "__main__":
+    unittest.main()
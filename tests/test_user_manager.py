@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tempfile
+import unittest
+from unittest import mock
+from user_management_module import user_manager
+from user_management_module.user_directory import UserDirectory
+from user_management_module.user_manager import LOGIN_FAILED, AuthenticationError, authenticate, register_users
+
+class AuthenticateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        directory = UserDirectory(os.path.join(self.tmp.name, "userData.json"))
+        for patcher in (
+            mock.patch.object(user_manager, "get_user_directory", lambda: directory),
+            mock.patch.object(user_manager, "PRIVATE_KEY_DIR", self.tmp.name),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        registered, failures = register_users({"alice": "pw"})
+        self.assertEqual((registered, failures), (["alice"], {}))
+
+    def failure(self, username, password):
+        with self.assertRaises(AuthenticationError) as caught:
+            authenticate(username, password)
+        return str(caught.exception)
+
+    def test_login(self):
+        session = authenticate("alice", "pw", lazy_key=False)
+        self.assertEqual(session.username, "alice")
+        self.assertIsNotNone(session.private_key)
+
+    def test_missing_key_is_reported_like_a_wrong_password(self):
+        self.assertEqual(self.failure("alice", "wrong"), LOGIN_FAILED)
+        os.remove(user_manager.private_key_path("alice"))
+        self.assertEqual(self.failure("alice", "wrong"), LOGIN_FAILED)
+        self.assertEqual(self.failure("alice", "pw"), LOGIN_FAILED)
+
+    def test_password_is_checked_before_the_key_file(self):
+        os.remove(user_manager.private_key_path("alice"))
+        with mock.patch.object(user_manager, "ph") as ph:
+            ph.verify.side_effect = ValueError
+            self.assertEqual(self.failure("alice", "pw"), LOGIN_FAILED)
+        ph.verify.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,47 @@
 import time
+import heapq
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Time (in seconds) after which the session is considered expired due to inactivity
 SESSION_TIMEOUT = 600  # 10 minutes
 
+# Unwrapped file keys are cached per session so repeated downloads of the
+# same content skip the private-key unwrap.
+FILE_KEY_CACHE_SIZE = 256
+FILE_KEY_TTL = 300  # seconds
+
+# Logins (Argon2 verify + PBKDF2) handled concurrently by a SessionManager.
+LOGIN_WORKERS = 4
+
 class Session:
-    def __init__(self, username, derived_key, private_key):
+    def __init__(self, username, derived_key, private_key=None, timeout=SESSION_TIMEOUT, key_loader=None):
+        self.session_id = None              # assigned by SessionManager.add()
         self.username = username
         self.derived_key = derived_key      # AES key derived from password
-        self.private_key = private_key      # Decrypted RSA private key (used for file key decryption)
+        self._private_key = private_key     # Decrypted RSA or X25519 private key (used for file key unwrapping)
+        self._key_loader = key_loader       # loads the private key on first use if none was given
+        self._key_lock = threading.Lock()
+        self.timings = {}                   # {step: milliseconds} from login and key loading
         self.login_time = time.time()
         self.last_active = time.time()
+        self.timeout = timeout
+        self.file_keys = OrderedDict()      # {content_hash: (wrapped_key_digest, file_key, expires_at)}
+        self.file_keys_lock = threading.Lock()
+
+    @property
+    def private_key(self):
+        """The private key, decrypted the first time it is needed."""
+        if self._private_key is None and self._key_loader is not None:
+            with self._key_lock:
+                if self._private_key is None:
+                    start = time.perf_counter()
+                    self._private_key = self._key_loader()
+                    self.timings["private_key_load"] = (time.perf_counter() - start) * 1000
+                    self._key_loader = None
+        return self._private_key
 
     def update_activity(self):
         """Call this whenever the user performs an action."""
@@ -17,10 +49,41 @@ class Session:
 
     def is_expired(self):
         """Returns True if the session has been inactive for too long."""
-        return (time.time() - self.last_active) > SESSION_TIMEOUT
+        expired = (time.time() - self.last_active) > self.timeout
+        if expired:
+            self.clear_file_keys()
+        return expired
+
+    def get_file_key(self, content_hash, wrapped_key_digest):
+        """Returns a cached file key, or None. The digest of the wrapped key
+        must match too: the same content shared twice has different keys."""
+        with self.file_keys_lock:
+            cached = self.file_keys.get(content_hash)
+            if cached is None:
+                return None
+            digest, file_key, expires_at = cached
+            if expires_at <= time.time():
+                del self.file_keys[content_hash]
+                return None
+            if digest != wrapped_key_digest:
+                return None
+            self.file_keys.move_to_end(content_hash)
+            return file_key
+
+    def cache_file_key(self, content_hash, wrapped_key_digest, file_key):
+        with self.file_keys_lock:
+            self.file_keys[content_hash] = (wrapped_key_digest, file_key, time.time() + FILE_KEY_TTL)
+            self.file_keys.move_to_end(content_hash)
+            while len(self.file_keys) > FILE_KEY_CACHE_SIZE:
+                self.file_keys.popitem(last=False)
+
+    def clear_file_keys(self):
+        with self.file_keys_lock:
+            self.file_keys.clear()
 
     def logout(self):
         """Logs the session out explicitly (manual logout)."""
+        self.clear_file_keys()
         print(f"[!] User '{self.username}' has been logged out.")
         return True
 
@@ -30,3 +93,117 @@ class Session:
 
     def __str__(self):
         return f"Session(username={self.username}, active_for={self.get_duration()}s)"
+
+class SessionManager:
+    """Holds many concurrent sessions and expires them from one timer.
+
+    Every session has one entry in a heap of (deadline, session_id). A
+    single timer thread sleeps until the earliest deadline; activity does
+    not touch the heap, so when a deadline passes for a session that was
+    used since, it is simply pushed back to last_active + timeout. Expired
+    sessions are removed and handed to the on_expire callbacks.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT, login_workers=LOGIN_WORKERS, authenticator=None):
+        if authenticator is None:
+            from user_management_module.user_manager import authenticate as authenticator
+        self.timeout = timeout
+        self.authenticator = authenticator
+        self.sessions = {}          # {session_id: Session}
+        self.deadlines = []         # heap of (deadline, session_id)
+        self.callbacks = []
+        self.cond = threading.Condition()
+        self.login_pool = ThreadPoolExecutor(max_workers=login_workers, thread_name_prefix="login")
+        self.timer = None
+        self.running = True
+
+    def on_expire(self, callback):
+        """Registers callback(session), run on the timer thread."""
+        self.callbacks.append(callback)
+        return callback
+
+    def add(self, session):
+        with self.cond:
+            session.session_id = secrets.token_hex(16)
+            session.timeout = self.timeout
+            self.sessions[session.session_id] = session
+            deadline = session.last_active + self.timeout
+            heapq.heappush(self.deadlines, (deadline, session.session_id))
+            if self.timer is None:
+                self.timer = threading.Thread(target=self._run_timer, daemon=True, name="session-timer")
+                self.timer.start()
+            elif self.deadlines[0][1] == session.session_id:
+                self.cond.notify()
+        return session.session_id
+
+    def login(self, username, password):
+        """Authenticates on the login pool. Returns a Future resolving to
+        the new, registered Session (or raising the authenticator's error)."""
+        def run():
+            return self.sessions[self.add(self.authenticator(username, password))]
+        return self.login_pool.submit(run)
+
+    def get(self, session_id):
+        with self.cond:
+            return self.sessions.get(session_id)
+
+    def touch(self, session_id):
+        """Marks activity; returns False if the session is gone."""
+        session = self.get(session_id)
+        if session is None:
+            return False
+        session.update_activity()
+        return True
+
+    def logout(self, session_id):
+        with self.cond:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        # Its heap entry is dropped when it comes due.
+        return session.logout()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.sessions)
+
+    def _run_timer(self):
+        while True:
+            expired = []
+            with self.cond:
+                if not self.running:
+                    return
+                now = time.time()
+                while self.deadlines and self.deadlines[0][0] <= now:
+                    _, session_id = heapq.heappop(self.deadlines)
+                    session = self.sessions.get(session_id)
+                    if session is None:
+                        continue
+                    deadline = session.last_active + self.timeout
+                    if deadline > now:
+                        heapq.heappush(self.deadlines, (deadline, session_id))
+                    else:
+                        del self.sessions[session_id]
+                        expired.append(session)
+                if not expired:
+                    wait = self.deadlines[0][0] - now if self.deadlines else None
+                    self.cond.wait(wait)
+                    continue
+            for session in expired:
+                session.clear_file_keys()
+                for callback in self.callbacks:
+                    try:
+                        callback(session)
+                    except Exception as e:
+                        print(f"[!] Session expiry callback failed for {session.username}: {e}")
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+            self.deadlines.clear()
+            self.cond.notify()
+        self.login_pool.shutdown(wait=False)
+        for session in sessions:
+            session.clear_file_keys()
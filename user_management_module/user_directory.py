@@ -0,0 +1,243 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process locking is skipped there
+    fcntl = None
+
+# Cached user directory backed by userData.json.
+#
+# userData.json stays the snapshot of all users. Registrations and other
+# changes are appended as single JSON lines to a journal next to it
+# (userData.json.journal) instead of rewriting the snapshot, and the
+# journal is folded back into the snapshot (written atomically) once it
+# has JOURNAL_COMPACT_ENTRIES records. Readers keep an in-memory index and
+# only stat() the files per lookup: a changed snapshot (mtime/size/inode)
+# triggers a full reload, a grown journal only the new tail. Reloads hold a
+# shared flock on userData.json.lock and writers an exclusive one, so a
+# compaction cannot land between reading the snapshot and the journal.
+USER_DATA_FILE = os.path.join(os.path.dirname(__file__), "userData.json")
+JOURNAL_COMPACT_ENTRIES = 1000
+
+def _file_id(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+class UserDirectory:
+    """Username -> user record index over userData.json and its journal.
+    Thread-safe, and safe across processes sharing the same files."""
+
+    def __init__(self, path=USER_DATA_FILE, compact_after=JOURNAL_COMPACT_ENTRIES):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.lock_path = path + ".lock"
+        self.compact_after = compact_after
+        self.lock = threading.RLock()
+        self.users = {}
+        self.version = 0          # bumped whenever the in-memory view changes
+        self._snapshot_id = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._exclusive = False   # this process holds the write flock
+
+    # -- reading ---------------------------------------------------------
+
+    def _apply(self, record):
+        if record["op"] == "put":
+            self.users[record["username"]] = record["record"]
+        elif record["op"] == "del":
+            self.users.pop(record["username"], None)
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_offset)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+        # Only complete lines count; a writer may be mid-append.
+        end = tail.rfind(b"\n") + 1
+        for line in tail[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+                self._journal_entries += 1
+        self._journal_offset += end
+        if end:
+            self.version += 1
+
+    def _stale(self):
+        journal_id = _file_id(self.journal_path)
+        journal_size = journal_id[2] if journal_id else 0
+        return _file_id(self.path) != self._snapshot_id or journal_size != self._journal_offset
+
+    def _refresh(self):
+        with self.lock:
+            if not self._stale():
+                return
+            with self._flock(None if self._exclusive or fcntl is None else fcntl.LOCK_SH):
+                self._reload()
+
+    def _reload(self):
+        with self.lock:
+            snapshot_id = _file_id(self.path)
+            if snapshot_id != self._snapshot_id:
+                users = {}
+                if snapshot_id is not None:
+                    with open(self.path, "r") as f:
+                        users = json.load(f)
+                self.users = users
+                self._snapshot_id = snapshot_id
+                self._journal_offset = 0
+                self._journal_entries = 0
+                self.version += 1
+            journal_id = _file_id(self.journal_path)
+            journal_size = journal_id[2] if journal_id else 0
+            if journal_size < self._journal_offset:
+                # Compacted by another process between our two stats (only
+                # possible without fcntl); start over.
+                self._snapshot_id = None
+                return self._reload()
+            if journal_size > self._journal_offset:
+                self._read_journal()
+
+    def get(self, username):
+        """Returns the user's record, or None."""
+        self._refresh()
+        with self.lock:
+            return self.users.get(username)
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __len__(self):
+        self._refresh()
+        return len(self.users)
+
+    def usernames(self):
+        self._refresh()
+        with self.lock:
+            return list(self.users)
+
+    def all(self):
+        """Copy of the whole directory ({username: record})."""
+        self._refresh()
+        with self.lock:
+            return dict(self.users)
+
+    # -- writing ---------------------------------------------------------
+
+    @contextmanager
+    def _flock(self, operation):
+        # flock() locks taken through different descriptors conflict even
+        # within one process, so readers inside _write_lock() must not
+        # take the shared lock (see _exclusive).
+        with self.lock:
+            if operation is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, operation)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self):
+        with self._flock(fcntl.LOCK_EX if fcntl else None):
+            self._exclusive = True
+            try:
+                yield
+            finally:
+                self._exclusive = False
+
+    def _append(self, records):
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+        with open(self.journal_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._read_journal()
+        if self._journal_entries >= self.compact_after:
+            self._compact()
+
+    def put_many(self, records):
+        """Writes {username: record} in one journal append."""
+        with self._write_lock():
+            self._refresh()
+            self._append([{"op": "put", "username": username, "record": record}
+                          for username, record in records.items()])
+
+    def put(self, username, record):
+        self.put_many({username: record})
+
+    def add(self, username, record):
+        """Creates a user; returns False if the name is already taken."""
+        with self._write_lock():
+            self._refresh()
+            if username in self.users:
+                return False
+            self._append([{"op": "put", "username": username, "record": record}])
+            return True
+
+    def add_many(self, records):
+        """Creates every user in {username: record} whose name is free, in
+        one journal append. Returns the usernames that were already taken."""
+        with self._write_lock():
+            self._refresh()
+            taken = [username for username in records if username in self.users]
+            self._append([{"op": "put", "username": username, "record": record}
+                          for username, record in records.items() if username not in self.users])
+            return taken
+
+    def remove(self, username):
+        with self._write_lock():
+            self._refresh()
+            if username not in self.users:
+                return False
+            self._append([{"op": "del", "username": username}])
+            return True
+
+    def _write_snapshot(self, users):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(users, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # Replaying a journal over a snapshot that already contains it is
+        # harmless, so a reader racing this truncate still ends up correct.
+        with open(self.journal_path, "wb"):
+            pass
+        self._snapshot_id = None
+        self._refresh()
+
+    def _compact(self):
+        self._write_snapshot(self.users)
+
+    def compact(self):
+        """Folds the journal into userData.json."""
+        with self._write_lock():
+            self._refresh()
+            self._compact()
+
+    def replace_all(self, users):
+        with self._write_lock():
+            self._write_snapshot(users)
+
+_default_directory = None
+_default_lock = threading.Lock()
+
+def get_user_directory():
+    """Process-wide directory for user_management_module/userData.json."""
+    global _default_directory
+    with _default_lock:
+        if _default_directory is None:
+            _default_directory = UserDirectory()
+        return _default_directory
@@ -1,17 +1,23 @@
 import json
 import os
 import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from argon2 import PasswordHasher
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from user_management_module.session_manager import Session
+from user_management_module.user_directory import get_user_directory
 from encryption_module.encrypt import (
-    generate_rsa_keypair,
     encrypt_private_key,
     decrypt_private_key
 )
+from encryption_module.key_wrap import DEFAULT_KEY_SCHEME
+from encryption_module.keypair_pool import take_keypair, warm_up
+from encryption_module.parallel_encrypt import DEFAULT_WORKERS
 
 USER_DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "user_management_module", "userData.json")
 PRIVATE_KEY_DIR = os.path.join(os.path.dirname(__file__), "..", "private_keys")
@@ -25,48 +31,67 @@ if not os.path.exists(USER_DATA_FILE):
 
 ph = PasswordHasher()
 
+# Records without "pbkdf2_iterations" were created with this count.
+PBKDF2_ITERATIONS = 100000
+# Login runs PBKDF2 on this pool while Argon2 verifies in the caller.
+KDF_WORKERS = 4
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+def _get_kdf_pool():
+    global _kdf_pool
+    with _kdf_pool_lock:
+        if _kdf_pool is None:
+            _kdf_pool = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix="kdf")
+        return _kdf_pool
+
 def load_users():
-    with open(USER_DATA_FILE, 'r') as f:
-        return json.load(f)
+    """Returns a copy of every user record. Prefer get_user_directory().get()
+    for single lookups; it does not re-read the file."""
+    return get_user_directory().all()
 
 def save_users(users):
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+    get_user_directory().replace_all(users)
 
-def derive_key_from_password(password: str, salt: bytes) -> bytes:
+def derive_key_from_password(password: str, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000,
+        iterations=iterations,
         backend=default_backend()
     )
     return kdf.derive(password.encode())
 
-def register_user():
-    users = load_users()
-    username = input("Enter a new username: ").strip()
-    if username in users:
-        print("[!] Username already exists.")
-        return False
+def private_key_path(username):
+    return os.path.join(PRIVATE_KEY_DIR, f"{username}_private.pem.enc")
 
-    password = input("Enter a password: ").strip()
-    confirm = input("Confirm password: ").strip()
-    if password != confirm:
-        print("[!] Passwords do not match.")
-        return False
+def install_private_key(username, pending_path, accepted):
+    """Moves a key written by provision_user into place once the directory
+    has accepted username, or deletes it if the name was taken. The key is
+    never written to its final path first: a registration that loses the
+    race for a name would otherwise overwrite the winner's key."""
+    if accepted:
+        os.replace(pending_path, private_key_path(username))
+    elif os.path.exists(pending_path):
+        os.remove(pending_path)
 
+def provision_user(username, password, key_scheme=DEFAULT_KEY_SCHEME):
+    """Hashes the password, creates the user's keypair and writes the
+    encrypted private key to a pending path. Returns (record, pending_path);
+    nothing is added to the directory yet, and the caller finishes with
+    install_private_key()."""
     salt = os.urandom(16)
     derived_key = derive_key_from_password(password, salt)
     password_hash = ph.hash(password)
     salt_b64 = base64.b64encode(salt).decode()
 
-    # 🔐 Generate RSA keypair
-    private_key, public_key = generate_rsa_keypair()
+    # 🔐 Take a keypair (X25519 by default, RSA on request; RSA comes pre-generated)
+    private_key, public_key = take_keypair(key_scheme)
 
-    # 🔐 Save encrypted private key
-    priv_path = os.path.join(PRIVATE_KEY_DIR, f"{username}_private.pem.enc")
-    encrypt_private_key(private_key, derived_key, priv_path)
+    # 🔐 Save encrypted private key (under a pending name until the username is taken)
+    pending_path = f"{private_key_path(username)}.{os.urandom(8).hex()}.tmp"
+    encrypt_private_key(private_key, derived_key, pending_path)
 
     # 🔐 Serialize and save public key
     public_pem = public_key.public_bytes(
@@ -74,42 +99,162 @@ def register_user():
         format=serialization.PublicFormat.SubjectPublicKeyInfo
     ).decode()
 
-    users[username] = {
+    return {
         "password_hash": password_hash,
         "salt": salt_b64,
-        "public_key": public_pem
-    }
+        "public_key": public_pem,
+        "key_scheme": key_scheme,
+        "pbkdf2_iterations": PBKDF2_ITERATIONS
+    }, pending_path
+
+def register_user(key_scheme=DEFAULT_KEY_SCHEME):
+    # Slow (RSA) keypairs are generated while the user types the password.
+    warm_up(key_scheme)
+    directory = get_user_directory()
+    username = input("Enter a new username: ").strip()
+    if username in directory:
+        print("[!] Username already exists.")
+        return False
+
+    password = input("Enter a password: ").strip()
+    confirm = input("Confirm password: ").strip()
+    if password != confirm:
+        print("[!] Passwords do not match.")
+        return False
 
-    save_users(users)
+    record, pending_path = provision_user(username, password, key_scheme)
+
+    # Appends one record instead of rewriting the whole user file.
+    accepted = directory.add(username, record)
+    install_private_key(username, pending_path, accepted)
+    if not accepted:
+        print("[!] Username already exists.")
+        return False
     print(f"[+] User '{username}' registered successfully.")
     return True
 
-def login_user():
-    users = load_users()
-    username = input("Username: ").strip()
-    password = input("Password: ").strip()
+def register_users(credentials, key_scheme=DEFAULT_KEY_SCHEME, workers=None):
+    """Non-interactive bulk registration.
 
-    if username not in users:
-        print("[!] Username not found.")
-        return None
+    credentials is {username: password}. Users are provisioned on a worker
+    pool and written to the user directory in one batch. Returns
+    (registered, failures): the usernames added, and {username: reason}
+    for the rest.
+    """
+    warm_up(key_scheme)
+    directory = get_user_directory()
+    failures = {}
+    pending = {}
+    for username, password in credentials.items():
+        username = username.strip()
+        if not username or not password:
+            failures[username] = "empty username or password"
+        elif username in directory or username in pending:
+            failures[username] = "username already exists"
+        else:
+            pending[username] = password
+    if not pending:
+        return [], failures
+
+    def provision(item):
+        username, password = item
+        try:
+            return username, *provision_user(username, password, key_scheme), None
+        except Exception as e:
+            return username, None, None, str(e)
+
+    workers = min(workers or DEFAULT_WORKERS, len(pending))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(provision, pending.items()))
+
+    records = {}
+    pending_paths = {}
+    for username, record, pending_path, error in results:
+        if error is None:
+            records[username] = record
+            pending_paths[username] = pending_path
+        else:
+            failures[username] = error
+
+    # One journal append for the whole batch.
+    for username in directory.add_many(records):
+        failures[username] = "username already exists"
+        del records[username]
+    for username, pending_path in pending_paths.items():
+        install_private_key(username, pending_path, username in records)
+    return list(records), failures
+
+class AuthenticationError(Exception):
+    pass
+
+# Same reply for a wrong password and a missing private key file.
+LOGIN_FAILED = "Login failed: incorrect password or missing key file."
+
+def _elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+def authenticate(username, password, lazy_key=True):
+    """Non-interactive login. Returns a Session, or raises
+    AuthenticationError with the reason.
 
-    stored_hash = users[username]["password_hash"]
-    salt = base64.b64decode(users[username]["salt"])
+    The Argon2 check and the PBKDF2 derivation only depend on the password
+    and the stored record, so they run concurrently; the derived key is
+    thrown away if the password is wrong. The private key is decrypted on
+    first use unless lazy_key is False. session.timings has the per-step
+    latency in milliseconds.
+    """
+    timings = {}
+    start = time.perf_counter()
+    # Served from the directory's in-memory index; no file read per login.
+    user = get_user_directory().get(username)
+    timings["lookup"] = _elapsed_ms(start)
+    if user is None:
+        raise AuthenticationError("Username not found.")
 
+    salt = base64.b64decode(user["salt"])
+    iterations = user.get("pbkdf2_iterations", PBKDF2_ITERATIONS)
+
+    def derive():
+        step = time.perf_counter()
+        derived = derive_key_from_password(password, salt, iterations)
+        timings["pbkdf2"] = _elapsed_ms(step)
+        return derived
+
+    derivation = _get_kdf_pool().submit(derive)
+    step = time.perf_counter()
     try:
-        ph.verify(stored_hash, password)
+        ph.verify(user["password_hash"], password)
     except Exception:
-        print("[!] Incorrect password.")
-        return None
+        derivation.cancel()
+        raise AuthenticationError(LOGIN_FAILED)
+    finally:
+        timings["argon2_verify"] = _elapsed_ms(step)
+    derived_key = derivation.result()
+    timings["kdf_total"] = _elapsed_ms(step)
 
-    derived_key = derive_key_from_password(password, salt)
-
-    # 🔐 Decrypt private key
-    priv_path = os.path.join(PRIVATE_KEY_DIR, f"{username}_private.pem.enc")
+    # Checked only once the password is right, and reported like a wrong
+    # password, so a caller without the password learns nothing about it.
+    priv_path = private_key_path(username)
     if not os.path.exists(priv_path):
-        print("[!] Private key file missing.")
+        raise AuthenticationError(LOGIN_FAILED)
+
+    session = Session(username=username, derived_key=derived_key,
+                      key_loader=lambda: decrypt_private_key(priv_path, derived_key))
+    session.timings.update(timings)
+    if not lazy_key:
+        session.private_key
+    session.timings["login_total"] = _elapsed_ms(start)
+    return session
+
+def login_user():
+    username = input("Username: ").strip()
+    password = input("Password: ").strip()
+
+    try:
+        session = authenticate(username, password)
+    except AuthenticationError as e:
+        print(f"[!] {e}")
         return None
-    private_key = decrypt_private_key(priv_path, derived_key)
 
     print(f"[+] Logged in as {username}.")
-    return Session(username=username, derived_key=derived_key, private_key=private_key)
+    return session